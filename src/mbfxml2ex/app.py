@@ -1,16 +1,19 @@
+import json
 import os
 import sys
 import argparse
-import xml.etree.ElementTree as ElTree
-from xml.etree.ElementTree import ParseError
 
+from mbfxml2ex.cache import MBFParseCache, default_cache_dir, default_parse_cache
 from mbfxml2ex.classes import MBFData
-from mbfxml2ex.exceptions import MBFXMLFormat, MBFXMLFile
-from mbfxml2ex.parsers import parse_contour, parse_tree, parse_marker, parse_images, parse_vessel
-from mbfxml2ex.utilities import get_raw_tag
-from mbfxml2ex.zinc import write_ex
-
-MBF_INTERNAL_DATA_SET_TAGS = ["filefacts", "thumbnail", "description", "property", "processedlocations", "sparcdata"]
+from mbfxml2ex.estimate import estimate
+from mbfxml2ex.exceptions import MBFXMLFile
+from mbfxml2ex.filters import MBFObjectFilter, MBF_OBJECT_KINDS
+from mbfxml2ex.lazy import LazyMBFData
+from mbfxml2ex.parallel import read_objects_in_parallel
+from mbfxml2ex.reader import iterate_objects, add_object, XML_BACKENDS
+from mbfxml2ex.sources import STDIN_SOURCE, is_file_name, strip_compression_suffix
+from mbfxml2ex.summary import summarize
+from mbfxml2ex.validate import validate
 
 
 class ProgramArguments(object):
@@ -18,79 +21,138 @@ class ProgramArguments(object):
         self.external_annotation = None
         self.input_xml = None
         self.output_ex = None
-
-
-def read_xml(file_name):
+        self.backend = None
+        self.processes = None
+        self.cache_dir = None
+        self.no_cache = False
+        self.lazy_properties = False
+        self.validate_only = False
+        self.kinds = None
+        self.tree_types = None
+        self.tree_classes = None
+        self.contour_names = None
+        self.marker_names = None
+        self.vessel_names = None
+        self.node_tolerance = 0.0
+        self.share_nodes = False
+        self.constant_fields = None
+
+
+def read_xml(file_name, backend=None, processes=None, lazy=False, cache=None, lazy_properties=False,
+             object_filter=None):
+    """
+    Read an MBF XML file.
+
+    Gzip, bz2 and xz compressed files are decompressed as they are parsed.  Stdin and file objects
+    are always parsed in this process and are not cached.
+
+    :param file_name: Name of the MBF XML file, '-' for stdin, or a binary file object.
+    :param backend: XML parser backend, see mbfxml2ex.reader.resolve_backend.
+    :param processes: Parse with this many processes, see mbfxml2ex.parallel.read_objects_in_parallel.
+    :param lazy: Return a LazyMBFData that parses objects when they are asked for, only for uncompressed files.
+    :param cache: MBFParseCache to load the data from and store it in, False to not use a cache.
+        [defaults to the cache set up through the environment, see mbfxml2ex.cache.default_parse_cache.]
+    :param lazy_properties: Convert the values of generic properties when they are first used,
+        see mbfxml2ex.reader.iterate_objects.
+    :param object_filter: MBFObjectFilter selecting the objects to read, cannot be used with lazy.
+    :return: MBFData.
+    """
+    if not is_file_name(file_name):
+        if lazy:
+            raise ValueError("Only files can be read lazily.")
+        return _collect_objects(iterate_objects(file_name, backend, lazy_properties, object_filter))
+
+    file_name = os.fspath(file_name)
     if os.path.exists(file_name):
-        data = MBFData()
-        try:
-            tree = ElTree.parse(file_name)
-        except ParseError as e:
-            raise MBFXMLFormat(e.msg) from None
-
-        root = tree.getroot()
-
-        # We can move marker elements that appear in the tree or contour structure.
-        relocate_marker_elements = []
-        for child in root:
-            raw_tag = get_raw_tag(child)
-            if raw_tag in ["tree", "contour"] and child.find('.//{http://www.mbfbioscience.com/2007/neurolucida}marker') is not None:
-                relocate_marker_elements.append({"owner": child, "ns": "http://www.mbfbioscience.com/2007/neurolucida"})
-            elif raw_tag in ["tree", "contour"] and child.find('.//{}marker') is not None:
-                relocate_marker_elements.append({"owner": child, "ns": ""})
-
-        for marker_root_element in relocate_marker_elements:
-            marker_element = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker')
-            marker_element_parent = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker/..')
-            while marker_element is not None:
-                marker_element_parent.remove(marker_element)
-                root.append(marker_element)
-                marker_element = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker')
-                marker_element_parent = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker/..')
-
-        for child in root:
-            raw_tag = get_raw_tag(child)
-            if raw_tag == "tree":
-                tree_data = parse_tree(child)
-                data.add_tree(tree_data)
-            elif raw_tag == "contour":
-                contour_data = parse_contour(child)
-                data.add_contour(contour_data)
-            elif raw_tag == "marker":
-                marker_data = parse_marker(child)
-                data.add_marker(marker_data)
-            elif raw_tag == "images":
-                images_data = parse_images(child)
-                data.set_images(images_data)
-            elif raw_tag == "vessel":
-                vessel_data = parse_vessel(child)
-                data.add_vessel(vessel_data)
-            elif raw_tag in MBF_INTERNAL_DATA_SET_TAGS:
-                pass  # Do nothing.
-            else:
-                print('Unhandled tag: ', raw_tag)
-
-        # Apparently this is not to be done.  These scaling factors are for model units
-        # and not to be applied to contours, trees, etc.
-        # data.process_scaling_and_offset()
+        if lazy:
+            if object_filter is not None:
+                raise ValueError("An object filter cannot be used when reading lazily.")
+            return LazyMBFData(file_name, backend, lazy_properties=lazy_properties)
+
+        if cache is None:
+            cache = default_parse_cache()
+        if cache:
+            cache_key = cache.key(file_name, _parse_options(lazy_properties, object_filter))
+            data = cache.load(cache_key)
+            if data is not None:
+                return data
+
+        if processes is None or processes == 1:
+            objects = iterate_objects(file_name, backend, lazy_properties, object_filter)
+        else:
+            objects = read_objects_in_parallel(file_name, processes, backend, lazy_properties, object_filter)
+
+        data = _collect_objects(objects)
+        if cache:
+            cache.store(cache_key, data)
 
         return data
 
     raise MBFXMLFile('File does not exist: "{0}"'.format(file_name))
 
 
+def _collect_objects(objects):
+    data = MBFData()
+    for raw_tag, object_data in objects:
+        add_object(data, raw_tag, object_data)
+
+    # Apparently this is not to be done.  These scaling factors are for model units
+    # and not to be applied to contours, trees, etc.
+    # data.process_scaling_and_offset()
+
+    return data
+
+
+def _parse_options(lazy_properties, object_filter):
+    # The options that change the parsed data, options left at their default are not included.
+    options = {}
+    if lazy_properties:
+        options["lazy_properties"] = True
+    if object_filter is not None:
+        options["object_filter"] = repr(object_filter)
+
+    return options
+
+
+def _object_filter(args):
+    criteria = {name: getattr(args, name) for name in
+                ["kinds", "tree_types", "tree_classes", "contour_names", "marker_names", "vessel_names"]}
+    if all(value is None for value in criteria.values()):
+        return None
+
+    return MBFObjectFilter(**criteria)
+
+
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     options = {}
     args = parse_args()
-    if os.path.exists(args.input_xml):
+    if args.input_xml == STDIN_SOURCE or os.path.exists(args.input_xml):
+        if args.validate_only:
+            errors = validate(args.input_xml)
+            for error in errors:
+                print(f"{args.input_xml}:{error.line()}: {error.message()}")
+            sys.exit(1 if errors else 0)
+
+        # Zinc is only imported when it is needed.
+        from mbfxml2ex.zinc import write_ex
+
         if args.output_ex is None:
-            output_ex = args.input_xml + '.ex'
+            output_ex = strip_compression_suffix(args.input_xml) + '.ex'
         else:
             output_ex = args.output_ex
 
         options["external_annotation"] = args.external_annotation
+        options["node_tolerance"] = args.node_tolerance
+        options["share_nodes"] = args.share_nodes
+        options["constant_fields"] = args.constant_fields
 
-        contents = read_xml(args.input_xml)
+        cache = False if args.no_cache else MBFParseCache(args.cache_dir or default_cache_dir())
+        contents = read_xml(args.input_xml, args.backend, args.processes, cache=cache,
+                            lazy_properties=args.lazy_properties, object_filter=_object_filter(args))
         if contents is None:
             sys.exit(-2)
         else:
@@ -99,16 +161,92 @@ def main():
         sys.exit(-1)
 
 
+def main_estimate(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="mbfxml2exconverter estimate",
+        description="Count the objects and points of a Neurolucida Xml data file without parsing it and estimate "
+                    "the peak memory in bytes and the wall time in seconds of converting it to ex format. "
+                    "The estimate is written to stdout as JSON.")
+    parser.add_argument("input_xml", help="Location of the input xml file, which may be gzip, bz2 or xz "
+                                          "compressed, or - to read from stdin.")
+    args = parser.parse_args(argv)
+    if args.input_xml == STDIN_SOURCE or os.path.exists(args.input_xml):
+        print(json.dumps(estimate(args.input_xml), indent=2))
+    else:
+        sys.exit(-1)
+
+
+def main_summarize(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="mbfxml2exconverter summarize",
+        description="Summarize the objects of a Neurolucida Xml data file without converting it: counts per type, "
+                    "class and name, point counts, traced lengths, bounding boxes, puncta voxel totals and the "
+                    "branch count of each tree. The summary is written to stdout as JSON.")
+    parser.add_argument("input_xml", help="Location of the input xml file, which may be gzip, bz2 or xz "
+                                          "compressed, or - to read from stdin.")
+    parser.add_argument("--backend", choices=XML_BACKENDS, default="expat",
+                        help="XML parser backend. [defaults to expat.]")
+    args = parser.parse_args(argv)
+    if args.input_xml == STDIN_SOURCE or os.path.exists(args.input_xml):
+        print(json.dumps(summarize(args.input_xml, args.backend), indent=2))
+    else:
+        sys.exit(-1)
+
+
+SUBCOMMANDS = {
+    "estimate": main_estimate,
+    "summarize": main_summarize,
+}
+
+
 def parse_args():
-    parser = argparse.ArgumentParser(description="Transform Neurolucida Xml data file to ex format.")
-    parser.add_argument("input_xml", help="Location of the input xml file.")
-    parser.add_argument("--output-ex", help="Location of the output ex file. "
+    parser = argparse.ArgumentParser(description="Transform Neurolucida Xml data file to ex format.",
+                                     epilog="Run 'mbfxml2exconverter estimate --help' to estimate the cost of a "
+                                            "conversion before running it, or 'mbfxml2exconverter summarize --help' "
+                                            "to summarize a file without converting it.")
+    parser.add_argument("input_xml", help="Location of the input xml file, which may be gzip, bz2 or xz "
+                                          "compressed, or - to read from stdin.")
+    parser.add_argument("--output-ex", help="Location of the output ex file, required when reading from stdin. "
                                             "[defaults to the location of the input file if not set.]")
     parser.add_argument("--external-annotation", help="Output any annotations as a separate file at "
                                                       "the same location as the output ex file.")
+    parser.add_argument("--backend", choices=XML_BACKENDS,
+                        help="XML parser backend to use, lxml must be installed to use it. [defaults to etree.]")
+    parser.add_argument("--processes", type=int,
+                        help="Parse the top level objects with this many processes, 0 uses one process per CPU. "
+                             "[defaults to parsing in this process.]")
+    parser.add_argument("--cache-dir", help="Directory of the cache of parsed input files. "
+                                            "[defaults to mbfxml2ex in the user's cache directory.]")
+    parser.add_argument("--no-cache", action="store_true", help="Always parse the input file, do not use the cache.")
+    parser.add_argument("--lazy-properties", action="store_true",
+                        help="Only convert the values of generic properties, such as GUID and Channel, "
+                             "when they are used.")
+    parser.add_argument("--kinds", nargs="+", choices=MBF_OBJECT_KINDS,
+                        help="Only read objects of these kinds. [defaults to all kinds.]")
+    parser.add_argument("--tree-types", nargs="+", help="Only read trees with one of these types, e.g. Dendrite.")
+    parser.add_argument("--tree-classes", nargs="+", help="Only read trees with one of these classes.")
+    parser.add_argument("--contour-names", nargs="+", help="Only read contours with one of these names.")
+    parser.add_argument("--marker-names", nargs="+", help="Only read markers with one of these names.")
+    parser.add_argument("--vessel-names", nargs="+", help="Only read vessels with one of these names.")
+    parser.add_argument("--node-tolerance", type=float, default=0.0,
+                        help="Points of an object closer than this distance share a node. "
+                             "[defaults to 0, only points with equal coordinates share a node.]")
+    parser.add_argument("--share-nodes", action="store_true",
+                        help="Share nodes between the trees, contours and vessels of the file, not only within "
+                             "each of them.")
+    parser.add_argument("--constant-fields", choices=["node", "object"], default="node",
+                        help="Store the fields constant over a tree, contour or vessel, such as rgb, on every node "
+                             "of it, or once for it on the elements. [defaults to node.]")
+
+    parser.add_argument("--validate-only", action="store_true",
+                        help="Only check the input file, every error is reported with its line number and nothing "
+                             "is written. Exits with 1 if there are errors.")
 
     program_arguments = ProgramArguments()
     parser.parse_args(namespace=program_arguments)
+    if program_arguments.input_xml == STDIN_SOURCE and program_arguments.output_ex is None \
+            and not program_arguments.validate_only:
+        parser.error("--output-ex is required when reading from stdin.")
 
     return program_arguments
 
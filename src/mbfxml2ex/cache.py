@@ -0,0 +1,177 @@
+import hashlib
+import os
+import pickle
+
+import mbfxml2ex
+
+CACHE_VERSION = 1
+CACHE_DIR_ENVIRONMENT_VARIABLE = "MBFXML2EX_CACHE_DIR"
+CACHE_SIZE_ENVIRONMENT_VARIABLE = "MBFXML2EX_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 2 ** 30
+CACHE_FILE_SUFFIX = ".mbfcache"
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def default_cache_dir():
+    """
+    Return the directory of the parse cache in the user's cache directory.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "mbfxml2ex")
+
+
+def default_cache_size():
+    """
+    Return the size limit of the parse cache in bytes, MBFXML2EX_CACHE_SIZE overrides the default.
+    """
+    return int(os.environ.get(CACHE_SIZE_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_SIZE))
+
+
+def content_hash(file_name):
+    """
+    Return the SHA-256 hex digest of the content of the file.
+    """
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class MBFParseCache(object):
+    """
+    On disk cache of parsed MBF data keyed by the content of the input file.
+
+    The key of an entry is made from a hash of the file content, the version of mbfxml2ex,
+    CACHE_VERSION and any options that change the parsed data, so renaming or touching a file
+    does not invalidate its entry and editing it does.  Entries are pickled, the points of an
+    object are kept in its point store and are written as a single block of doubles.
+    When the entries take up more than max_size bytes the least recently used entries are removed,
+    see default_cache_size for the default limit.
+
+    Entries are unpickled when loaded, only use a directory that is not writable by others.
+    """
+
+    def __init__(self, directory, max_size=None):
+        self._directory = directory
+        self._max_size = default_cache_size() if max_size is None else max_size
+
+    def directory(self):
+        return self._directory
+
+    def max_size(self):
+        return self._max_size
+
+    def key(self, file_name, options=None):
+        """
+        Return the cache key for the file parsed with the given options.
+
+        :param file_name: Name of the MBF XML file.
+        :param options: Dict of the options that change the parsed data.
+        :return: Key as a hex string.
+        """
+        option_items = sorted((options or {}).items())
+        identity = f"{mbfxml2ex.__version__}:{CACHE_VERSION}:{option_items!r}:{content_hash(file_name)}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def _entry_file_name(self, key):
+        return os.path.join(self._directory, key + CACHE_FILE_SUFFIX)
+
+    def load(self, key):
+        """
+        Return the data stored for the key, or None if there is no usable entry.
+        """
+        entry_file_name = self._entry_file_name(key)
+        try:
+            with open(entry_file_name, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+            # An entry from an incompatible version or a partly written file, it will be replaced.
+            self._remove(entry_file_name)
+            return None
+
+        try:
+            # Mark the entry as recently used.
+            os.utime(entry_file_name)
+        except OSError:
+            pass
+
+        return data
+
+    def store(self, key, data):
+        """
+        Store the data for the key and evict the least recently used entries over the size limit.
+
+        The cache is only an optimisation, failing to write to it is not an error.
+        """
+        entry_file_name = self._entry_file_name(key)
+        temporary_file_name = f"{entry_file_name}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            with open(temporary_file_name, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_file_name, entry_file_name)
+        except (OSError, pickle.PicklingError):
+            self._remove(temporary_file_name)
+            return
+
+        self.evict()
+
+    def entries(self):
+        """
+        Return (file name, size, last used time) tuples of the cache entries.
+        """
+        entries = []
+        try:
+            with os.scandir(self._directory) as it:
+                for entry in it:
+                    if entry.name.endswith(CACHE_FILE_SUFFIX):
+                        try:
+                            status = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((entry.path, status.st_size, status.st_mtime_ns))
+        except OSError:
+            pass
+
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the entries fit in max_size bytes.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_size = sum(entry[1] for entry in entries)
+        for entry_file_name, size, _ in entries:
+            if total_size <= self._max_size:
+                break
+            self._remove(entry_file_name)
+            total_size -= size
+
+    def clear(self):
+        for entry_file_name, _, _ in self.entries():
+            self._remove(entry_file_name)
+
+    @staticmethod
+    def _remove(file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+
+def default_parse_cache():
+    """
+    Return the parse cache configured through the environment, or None.
+
+    The cache is used when MBFXML2EX_CACHE_DIR is set.
+    """
+    directory = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if not directory:
+        return None
+
+    return MBFParseCache(directory)
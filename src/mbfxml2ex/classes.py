@@ -1,44 +1,308 @@
 import itertools
 import xml.etree.ElementTree as ET
+from array import array
+from collections.abc import MutableMapping, Sequence
+from sys import intern
 
-from cmlibs.utils.zinc.general import AbstractNodeDataObject
+import numpy as np
 
 from mbfxml2ex.conversions import hex_to_rgb
 from mbfxml2ex.exceptions import MBFImagesException
 
 
-class MBFPoint(AbstractNodeDataObject):
+class MBFPointStore(object):
+    """
+    Columnar storage for the points of an MBF object.
+
+    Points are stored as consecutive x, y, z and radius float64 values.  The parsers add points
+    while reading an object, afterwards the values are available as NumPy views without copying.
+    Points cannot be added to a store once a NumPy view of it exists.
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values=None):
+        self._values = array('d') if values is None else values
+
+    def add(self, x, y, z, diameter=0.0):
+        """
+        Add a point to the store.
+
+        :return: The index of the point in the store.
+        """
+        index = len(self._values) // 4
+        self._values.extend((x, y, z, diameter / 2.0))
+        return index
+
+    def as_array(self):
+        """
+        Return a (N, 4) array view of the x, y, z and radius values of the points in the store.
+        """
+        return np.frombuffer(self._values, dtype=np.float64).reshape(-1, 4)
+
+    def coordinates(self):
+        return self.as_array()[:, :3]
+
+    def radius(self):
+        return self.as_array()[:, 3]
+
+    def point(self, index):
+        return MBFPoint.view(self, index)
+
+    def points(self, start=0, stop=None):
+        return MBFPointSequence(self, start, len(self) if stop is None else stop)
+
+    def get_value(self, index, component):
+        return self._values[4 * index + component]
+
+    def set_value(self, index, component, value):
+        self._values[4 * index + component] = value
+
+    def __len__(self):
+        return len(self._values) // 4
+
+
+class MBFNodeDataObject(object):
+    """
+    Node data for cmlibs.utils.zinc.general.create_node, which reads the values of the fields
+    named by get_field_names from the methods of the same name.
+
+    This matches cmlibs.utils.zinc.general.AbstractNodeDataObject, it is defined here so that
+    reading MBF data does not import Zinc.  It does not derive from AbstractNodeDataObject, so
+    isinstance checks against that class are False for points, see CHANGELOG.rst.
+
+    It has slots and no instance dict, so subclasses with slots, such as MBFPoint, have none either.
+    The field names and time sequences are the class defaults until they are set on an object.
+    """
+    __slots__ = ('_field_names', '_time_sequence', '_time_sequence_field_names')
+    _default_field_names = []
+    _default_time_sequence = []
+    _default_time_sequence_field_names = []
+
+    def check_field_names(self):
+        for field_name in self.get_field_names():
+            if not hasattr(self, field_name):
+                raise NotImplementedError('Missing data method for field: %s' % field_name)
+
+    def get_field_names(self):
+        try:
+            return self._field_names
+        except AttributeError:
+            return self._default_field_names
+
+    def set_field_names(self, field_names):
+        self._field_names = field_names
+        self.check_field_names()
+
+    def get_time_sequence(self):
+        try:
+            return self._time_sequence
+        except AttributeError:
+            return self._default_time_sequence
+
+    def set_time_sequence(self, time_sequence):
+        self._time_sequence = time_sequence
+
+    def get_time_sequence_field_names(self):
+        try:
+            return self._time_sequence_field_names
+        except AttributeError:
+            return self._default_time_sequence_field_names
+
+    def set_time_sequence_field_names(self, time_sequence_field_names):
+        self._time_sequence_field_names = time_sequence_field_names
+
+
+class MBFPoint(MBFNodeDataObject):
+    """
+    Accessor for a single point in an MBFPointStore.
+
+    Creating an MBFPoint directly creates a store holding just that point.
+    """
+    __slots__ = ('_store', '_index')
+    _default_field_names = ['coordinates', 'radius']
 
     def __init__(self, x, y, z, diameter=0.0):
-        super(MBFPoint, self).__init__(['coordinates', 'radius'])
-        self._x = x
-        self._y = y
-        self._z = z
-        self._radius = diameter / 2.0
+        self._store = MBFPointStore()
+        self._index = self._store.add(x, y, z, diameter)
+
+    @classmethod
+    def view(cls, store, index):
+        point = cls.__new__(cls)
+        point._store = store
+        point._index = index
+        return point
+
+    def store(self):
+        return self._store
+
+    def index(self):
+        return self._index
 
     def get(self):
-        return [self._x, self._y, self._z, self._radius]
+        return [self._store.get_value(self._index, component) for component in range(4)]
 
     def coordinates(self):
-        return [self._x, self._y, self._z]
+        return [self._store.get_value(self._index, component) for component in range(3)]
 
     def radius(self):
-        return self._radius
+        return self._store.get_value(self._index, 3)
 
     def scale(self, scale):
-        self._x = self._x * scale[0]
-        self._y = self._y * scale[1]
+        self._store.set_value(self._index, 0, self._store.get_value(self._index, 0) * scale[0])
+        self._store.set_value(self._index, 1, self._store.get_value(self._index, 1) * scale[1])
 
     def offset(self, offset):
-        self._x = self._x + offset[0]
-        self._y = self._y + offset[1]
-        self._z = self._z + offset[2]
+        for component in range(3):
+            self._store.set_value(self._index, component, self._store.get_value(self._index, component) + offset[component])
+
+    def __repr__(self):
+        x, y, z, radius = self.get()
+        return f'x="{x}" y="{y}" z="{z}" r="{radius}"'
+
+
+class MBFPointSequence(Sequence):
+    """
+    Read only sequence of the points in a contiguous range of an MBFPointStore.
+    """
+    __slots__ = ('_store', '_start', '_stop')
+
+    def __init__(self, store, start, stop):
+        self._store = store
+        self._start = start
+        self._stop = stop
+
+    def store(self):
+        return self._store
+
+    def range(self):
+        return range(self._start, self._stop)
+
+    def as_array(self):
+        return self._store.as_array()[self._start:self._stop]
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return MBFPointSequence(self._store, self._start + start, self._start + max(start, stop))
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("point index out of range")
+
+        return MBFPoint.view(self._store, self._start + index)
+
+    def __iter__(self):
+        for index in range(self._start, self._stop):
+            yield MBFPoint.view(self._store, index)
 
     def __repr__(self):
-        return f'x="{self._x}" y="{self._y}" z="{self._z}" r="{self._radius}"'
+        return repr(list(self))
+
+
+def point_values(points):
+    """
+    Return the (N, 4) array of the x, y, z and radius of the points, taken from the array of their
+    point store when they share one.
+
+    :param points: Sequence of MBFPoint.
+    :return: NumPy array of the values of the points.
+    """
+    if points:
+        store = points[0].store()
+        if all(point.store() is store for point in points):
+            return store.as_array()[[point.index() for point in points]]
+
+    return np.array([point.get() for point in points], dtype=np.float64).reshape(-1, 4)
+
+
+def object_values(points):
+    """
+    Return the (N, 4) array of the values of the points of a contour, marker or vessel edge, a view of
+    its point store when it has one, see point_values.
+
+    :param points: MBFPointSequence, or a list of MBFPoint for objects built in code.
+    :return: NumPy array of the values of the points.
+    """
+    if isinstance(points, MBFPointSequence):
+        return points.as_array()
+
+    return point_values(list(points))
+
+
+class MBFRecord(MutableMapping):
+    """
+    Base for the records of parsed MBF objects.
+
+    Records keep the dictionary style access of the dict based records they replace while
+    storing their values in slots, the keys of a record are the names of its slots.
+    Keys without a value behave as missing keys.
+    """
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(f"'{key}' is not a key of {type(self).__name__}")
+
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class MBFContour(MBFRecord):
+    __slots__ = ('colour', 'rgb', 'closed', 'name', 'resolution', 'properties', 'data')
+
+
+class MBFMarker(MBFRecord):
+    __slots__ = ('colour', 'rgb', 'name', 'type', 'varicosity', 'properties', 'data')
+
+
+class MBFVessel(MBFRecord):
+    __slots__ = ('version', 'colour', 'rgb', 'type', 'properties', 'name', 'nodes', 'edges', 'edgelists')
+
+
+class MBFVesselNode(MBFRecord):
+    __slots__ = ('id', 'data')
+
+
+class MBFVesselEdge(MBFRecord):
+    __slots__ = ('id', 'properties', 'class', 'data')
 
 
 class MBFProperty:
+    __slots__ = ('_name', '_version')
 
     def __init__(self, name, version):
         self._name = name
@@ -61,6 +325,7 @@ class MBFProperty:
 
 
 class MBFPropertyChannel(MBFProperty):
+    __slots__ = ('_number', '_colour')
 
     def __init__(self, version, number, colour):
         super(MBFPropertyChannel, self).__init__("Channel", version)
@@ -79,6 +344,7 @@ class MBFPropertyChannel(MBFProperty):
 
 
 class MBFPropertyFillDensity(MBFProperty):
+    __slots__ = ('_number',)
 
     def __init__(self, number):
         super(MBFPropertyFillDensity, self).__init__("FillDensity", -1.0)
@@ -89,6 +355,7 @@ class MBFPropertyFillDensity(MBFProperty):
 
 
 class MBFPropertyTreeOrder(MBFProperty):
+    __slots__ = ('_number',)
 
     def __init__(self, number):
         super(MBFPropertyTreeOrder, self).__init__("TreeOrder", "1")
@@ -103,6 +370,8 @@ class MBFPropertyTreeOrder(MBFProperty):
 
 
 class MBFPropertyPunctum(MBFProperty):
+    __slots__ = ('_spread', '_mean_luminance', '_surface_area', '_voxel_count', '_flag_2d',
+                 '_volume', '_location', '_colocalized_fraction', '_proximal_fraction')
 
     def __init__(self, version, spread, mean_luminance, surface_area, voxel_count, flag_2d,
                  volume, location, colocalized_fraction, proximal_fraction):
@@ -153,6 +422,7 @@ class MBFPropertyPunctum(MBFProperty):
 
 
 class MBFPropertyVolumeRLE(MBFProperty):
+    __slots__ = ('_volume_description',)
 
     def __init__(self, volume_description):
         super(MBFPropertyVolumeRLE, self).__init__("VolumeRLE", -1.0)
@@ -195,6 +465,7 @@ class MBFPropertyVolumeRLE(MBFProperty):
 
 
 class MBFPropertyText(MBFProperty):
+    __slots__ = ('_label',)
 
     def __init__(self, name, label, version=-1.0):
         super(MBFPropertyText, self).__init__(name, version)
@@ -208,6 +479,7 @@ class MBFPropertyText(MBFProperty):
 
 
 class MBFPropertySet(MBFProperty):
+    __slots__ = ('_items',)
 
     def __init__(self, items):
         super(MBFPropertySet, self).__init__("Set", -1.0)
@@ -224,6 +496,8 @@ class MBFPropertySet(MBFProperty):
 
 
 class MBFAttribute:
+    __slots__ = ('_name', '_value')
+
     def __init__(self, name, value):
         self._name = name
         self._value = value
@@ -238,18 +512,50 @@ class MBFAttribute:
         return f"{self._name} = {self._value}"
 
 
+def generic_property_items(raw_items):
+    """
+    Convert the children of a generic property to its items.
+
+    :param raw_items: Sequence of the tag and text of each child in turn.
+    :return: List of {tag: value} dicts.
+    """
+    items = []
+    for raw_tag, value in zip(raw_items[::2], raw_items[1::2]):
+        raw_tag = intern(raw_tag)
+        if raw_tag not in ["n", "s", "c", "l", "b"]:
+            print(f"Need to handle this property child tag '{raw_tag}'.")
+        if value:
+            value = float(value) if raw_tag == "n" else intern(value)
+        else:
+            value = None
+
+        items.append({raw_tag: value})
+
+    return items
+
+
 class MBFPropertyGeneric(MBFProperty):
+    __slots__ = ('_items', '_raw_items')
 
-    def __init__(self, name, items):
+    def __init__(self, name, items=None, raw_items=None):
+        """
+        A generic property is made from either its items or the raw tags and texts of its children,
+        see generic_property_items, the raw items are only converted when the items are first needed.
+        """
         super(MBFPropertyGeneric, self).__init__(name, -1.0)
         self._items = items
+        self._raw_items = raw_items
 
     def items(self):
+        if self._items is None:
+            self._items = generic_property_items(self._raw_items)
+            self._raw_items = None
+
         return self._items
 
     def is_valid(self):
         valid = True
-        for item in self._items:
+        for item in self.items():
             for k, v in item.items():
                 if k == 'n':
                     valid = isinstance(v, float)
@@ -262,12 +568,12 @@ class MBFPropertyGeneric(MBFProperty):
         return valid
 
     def text(self):
-        s = [f'{key}={val}' for item in self._items for key, val in item.items()]
+        s = [f'{key}={val}' for item in self.items() for key, val in item.items()]
         return f'<name={self.name()}><{"=".join(s)}>'
 
     def to_xml(self):
         root = ET.Element("property", name=self._name)
-        for item in self._items:
+        for item in self.items():
             for key, value in item.items():
                 child = ET.SubElement(root, key)
                 if key == 'n':
@@ -277,11 +583,12 @@ class MBFPropertyGeneric(MBFProperty):
         return ET.tostring(root, encoding='utf-8').decode()
 
     def __repr__(self):
-        props = [f'{key}: {val}' for d in self._items for key, val in d.items()]
+        props = [f'{key}: {val}' for d in self.items() for key, val in d.items()]
         return 'Generic property: "{0}" --> "{1}"'.format(self._name, ', '.join(props))
 
 
 class MBFPropertyTraceAssociation(MBFPropertyText):
+    __slots__ = ()
 
     def __init__(self, label):
         super(MBFPropertyTraceAssociation, self).__init__("TraceAssociation", label)
@@ -291,6 +598,7 @@ class MBFPropertyTraceAssociation(MBFPropertyText):
 
 
 class MBFPropertyGUID(MBFPropertyText):
+    __slots__ = ()
 
     def __init__(self, label):
         super(MBFPropertyGUID, self).__init__("GUID", label)
@@ -310,6 +618,7 @@ class MBFPropertyGUID(MBFPropertyText):
 
 
 class NeurolucidaZSpacing:
+    __slots__ = ('_z', '_slices')
 
     def __init__(self, z=1.0, slices=0):
         self._z = z
@@ -326,6 +635,7 @@ class NeurolucidaZSpacing:
 
 
 class NeurolucidaChannel:
+    __slots__ = ('_identifier', '_source')
 
     def __init__(self, identifier=None, source=None):
         self._identifier = identifier
@@ -336,6 +646,7 @@ class NeurolucidaChannel:
 
 
 class NeurolucidaChannels:
+    __slots__ = ('_merge', '_channels')
 
     def __init__(self, merge):
         self._merge = merge
@@ -353,9 +664,11 @@ class NeurolucidaChannels:
 
 
 class MBFTree:
+    __slots__ = ('_mbf_points', '_point_store')
 
-    def __init__(self, mbf_points):
+    def __init__(self, mbf_points, point_store=None):
         self._mbf_points = mbf_points
+        self._point_store = point_store
 
     def colour(self):
         return self._mbf_points['attributes'].get('color', '#000000')
@@ -370,31 +683,192 @@ class MBFTree:
     def leaf(self):
         return self._mbf_points['attributes'].get('leaf')
 
+    def attributes(self):
+        return self._mbf_points['attributes']
+
     def type(self):
         return self._mbf_points['attributes'].get('type')
 
+    def point_store(self):
+        return self._point_store
+
+    def structure(self):
+        return self._mbf_points
+
     def points(self):
-        return _retrieve_points(self._mbf_points)
+        return _retrieve_points(self._mbf_points, self._point_store)
+
+    def branch_properties(self):
+        """
+        Return the properties and inherited attributes of every branch of the tree, in one pass from the root down.
+
+        Branches are identified by their path in points, the root has the empty path.  The properties
+        and attributes of a branch are those that properties gives for the points of the branch.
+        Branches without attributes of their own share the attributes dict of their parent.
+
+        :return: Dict of branch path to a tuple of the list of properties and the dict of attributes of the branch.
+        """
+        return _inherit_branch_properties(self._mbf_points)
+
+    def flat(self):
+        """
+        Return the flat representation of the points of the tree, see MBFFlatTree.
+        """
+        return _flatten_tree(self._mbf_points, self._point_store)
+
+
+class MBFFlatTree(object):
+    """
+    Flat representation of the points of a tree as integer arrays.
+
+    Points are numbered in the order of points, branches are numbered as they are reached from the root
+    down, the root is branch 0.  The parent of a point is the point it is joined to, for the first point
+    of a branch that is the point of the parent branch before the branch.
+    """
+
+    def __init__(self, values, parents, branch_ids, branch_starts, branch_parents, branch_paths):
+        self._values = values
+        self._parents = parents
+        self._branch_ids = branch_ids
+        self._branch_starts = branch_starts
+        self._branch_parents = branch_parents
+        self._branch_paths = branch_paths
+
+    def values(self):
+        """
+        Return the (N, 4) array of the x, y, z and radius of the points.
+        """
+        return self._values
+
+    def parents(self):
+        """
+        Return the array of the index of the parent of each point, -1 for points without a parent.
+        """
+        return self._parents
+
+    def branch_ids(self):
+        """
+        Return the array of the branch of each point.
+        """
+        return self._branch_ids
+
+    def branch_starts(self):
+        """
+        Return the array of the index of the first point of each branch, -1 for branches without points.
+        """
+        return self._branch_starts
+
+    def branch_parents(self):
+        """
+        Return the array of the parent branch of each branch, -1 for the root.
+        """
+        return self._branch_parents
+
+    def branch_paths(self):
+        """
+        Return the list of the path of each branch, as for MBFTree.branch_properties.
+        """
+        return self._branch_paths
     #
     # def point_properties(self):
     #     return _determine_point_properties(self._structure)
 
 
+def _branch_item(branch, index):
+    # Runs of points are stored as ranges into the point store, each point in a run counts as one item.
+    position = 0
+    for item in branch['points']:
+        size = len(item) if type(item) is range else 1
+        if index < position + size:
+            return item
+        position += size
+
+    raise IndexError("branch index out of range")
+
+
 def _determine_branch_properties(branch, path):
     parent_path = path[:-1]
     attributes = branch['attributes']
     for entry in parent_path:
-        branch = branch['points'][entry]
+        branch = _branch_item(branch, entry)
         attributes = {**attributes, **branch['attributes']}
 
     return branch['properties'], attributes
 
 
-def _retrieve_points(structure):
+def _inherit_branch_properties(structure):
+    branch_properties = {}
+    pending = [((), structure, structure['attributes'])]
+    while pending:
+        path, branch, attributes = pending.pop()
+        branch_properties[path] = (branch['properties'], attributes)
+        index = 0
+        for item in branch['points']:
+            if type(item) is dict:
+                child_attributes = {**attributes, **item['attributes']} if item['attributes'] else attributes
+                pending.append((path + (index,), item, child_attributes))
+                index += 1
+            else:
+                index += len(item) if type(item) is range else 1
+
+    return branch_properties
+
+
+def _flatten_tree(structure, point_store=None):
+    # Follows the nesting of the points of the tree with a stack, not recursion, each frame is the items of a branch,
+    # the position of the next item, the index of the next item in the path, the branch and the previous point.
+    chunks = []
+    parents = []
+    branch_ids = []
+    branch_starts = [-1]
+    branch_parents = [-1]
+    branch_paths = [()]
+    stack = [[structure['points'], 0, 0, 0, -1]]
+    while stack:
+        frame = stack[-1]
+        items, position, path_index, branch, previous = frame
+        if position == len(items):
+            stack.pop()
+            continue
+
+        item = items[position]
+        frame[1] += 1
+        if type(item) is dict:
+            branch_starts.append(-1)
+            branch_parents.append(branch)
+            branch_paths.append(branch_paths[branch] + (path_index,))
+            frame[2] += 1
+            stack.append([item['points'], 0, 0, len(branch_paths) - 1, previous])
+            continue
+
+        if type(item) is range:
+            size = len(item)
+            chunks.append(point_store.as_array()[item.start:item.stop])
+        else:
+            size = 1
+            chunks.append(np.array([item.get()], dtype=np.float64))
+        if size:
+            first = len(parents)
+            if branch_starts[branch] == -1:
+                branch_starts[branch] = first
+            parents.append(previous)
+            parents.extend(range(first, first + size - 1))
+            branch_ids.extend([branch] * size)
+            frame[2] += size
+            frame[4] = first + size - 1
+
+    values = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    return MBFFlatTree(values, np.array(parents, dtype=np.intp), np.array(branch_ids, dtype=np.intp),
+                       np.array(branch_starts, dtype=np.intp), np.array(branch_parents, dtype=np.intp), branch_paths)
+
+
+def _retrieve_points(structure, point_store=None):
     points = []
     for item in structure['points']:
         if type(item) is dict:
-            points.append(_retrieve_points(item))
+            points.append(_retrieve_points(item, point_store))
+        elif type(item) is range:
+            points.extend(MBFPoint.view(point_store, index) for index in item)
         else:
             points.append(item)
 
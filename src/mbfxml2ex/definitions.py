@@ -10,3 +10,7 @@ INFOSET_RANK_MAP = {
     'leaf': ('metadata', 1),
     'TreeOrder': ('metadata', 2),
 }
+
+NEUROLUCIDA_NAMESPACE = "http://www.mbfbioscience.com/2007/neurolucida"
+
+MBF_INTERNAL_DATA_SET_TAGS = ["filefacts", "thumbnail", "description", "property", "processedlocations", "sparcdata"]
@@ -0,0 +1,152 @@
+import mmap
+import os
+import re
+
+from mbfxml2ex.sources import open_source, is_file_name, detect_compression
+
+SCAN_CHUNK_SIZE = 1 << 24
+
+ESTIMATE_COUNTS = ["trees", "branches", "points", "contours", "markers", "vessels", "puncta", "puncta_voxels"]
+COST_FEATURES = ESTIMATE_COUNTS + ["puncta_squared"]
+
+_COUNTED_TAGS = [("trees", b"<tree"), ("branches", b"<branch"), ("points", b"<point"), ("contours", b"<contour"),
+                 ("markers", b"<marker"), ("vessels", b"<vessel"), ("puncta", b'"VolumeRLE"')]
+# The scaling and the voxel counts lead the run length encoding of a punctum volume.
+_VOLUME_RLE = re.compile(rb'"VolumeRLE"\s*>\s*<(?:[\w.-]+:)?s>\s*((?:[^\s<]{1,32}\s+){6}[^\s<]{1,32})')
+# Longer than any counted tag or volume header, so no match is split between two windows.
+_SCAN_OVERLAP = 4096
+
+
+def cost_features(counts):
+    """
+    Return the features of the cost model for the counts of a document, see COST_FEATURES.
+
+    Every punctum written defines the faces of the whole punctum mesh again, so the time taken
+    by puncta grows with the square of their number.
+    """
+    features = dict(counts)
+    features["puncta_squared"] = counts["puncta"] ** 2
+    return features
+
+
+class MBFCostModel(object):
+    """
+    Model of the wall time and peak memory of reading an MBF XML file and writing it as EX.
+
+    Each cost is a base cost plus a cost per unit of each feature, see cost_features.
+    """
+
+    def __init__(self, base_time, time_per_item, base_memory, memory_per_item):
+        self._base_time = base_time
+        self._time_per_item = time_per_item
+        self._base_memory = base_memory
+        self._memory_per_item = memory_per_item
+
+    def wall_time(self, counts):
+        """
+        Return the predicted wall time in seconds for a file with these counts.
+        """
+        features = cost_features(counts)
+        return self._base_time + sum(features[name] * cost for name, cost in self._time_per_item.items())
+
+    def peak_memory(self, counts):
+        """
+        Return the predicted peak resident memory in bytes for a file with these counts.
+        """
+        features = cost_features(counts)
+        return self._base_memory + sum(features[name] * cost for name, cost in self._memory_per_item.items())
+
+
+# Fitted with tests/calibrate_estimate.py, CPython 3.11 and cmlibs.zinc 4 on x86-64 Linux.
+DEFAULT_COST_MODEL = MBFCostModel(
+    base_time=0.252,
+    time_per_item={'branches': 7.02e-05, 'points': 7.56e-05, 'contours': 0.000809, 'markers': 0.000243,
+                   'puncta': 0.000672, 'puncta_voxels': 1.91e-06, 'puncta_squared': 3.95e-05},
+    base_memory=62879821,
+    memory_per_item={'trees': 2.41e+04, 'branches': 170, 'points': 210, 'markers': 492, 'puncta': 9.89e+03,
+                     'puncta_voxels': 74.4})
+
+
+def _count_window(window, end, counts):
+    # Count the matches that start before end, the window holds at least _SCAN_OVERLAP bytes more unless it is the last.
+    for name, tag in _COUNTED_TAGS:
+        counts[name] += window.count(tag, 0, end + len(tag) - 1)
+
+    for match in _VOLUME_RLE.finditer(window, 0, end + _SCAN_OVERLAP):
+        if match.start() >= end:
+            break
+        voxel_counts = match.group(1).split()[4:7]
+        try:
+            counts["puncta_voxels"] += int(float(voxel_counts[0]) * float(voxel_counts[1]) * float(voxel_counts[2]))
+        except ValueError:
+            pass
+
+
+def scan_counts(chunks):
+    """
+    Count the objects, points and puncta voxels of an MBF XML document without parsing it.
+
+    The start tags and the volume headers of puncta are counted with a byte level search, so
+    tags in comments and CDATA are counted too.  Nested markers count as markers.
+
+    :param chunks: Iterable of consecutive byte chunks of the document.
+    :return: Dict of the counts named in ESTIMATE_COUNTS.
+    """
+    counts = dict.fromkeys(ESTIMATE_COUNTS, 0)
+    window = b''
+    for chunk in chunks:
+        window = window + chunk if window else chunk
+        if len(window) > _SCAN_OVERLAP:
+            end = len(window) - _SCAN_OVERLAP
+            _count_window(window, end, counts)
+            window = window[end:]
+
+    _count_window(window, len(window), counts)
+    return counts
+
+
+def _mapped_chunks(content):
+    for start in range(0, len(content), SCAN_CHUNK_SIZE):
+        yield content[start:start + SCAN_CHUNK_SIZE]
+
+
+def _stream_chunks(stream):
+    return iter(lambda: stream.read(SCAN_CHUNK_SIZE), b'')
+
+
+def _scan_source(source):
+    if is_file_name(source):
+        with open(source, 'rb') as f:
+            if detect_compression(f.read(8)) is None:
+                try:
+                    content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # An empty file cannot be mapped.
+                    return scan_counts([])
+                with content:
+                    return scan_counts(_mapped_chunks(content))
+
+    with open_source(source) as stream:
+        return scan_counts(_stream_chunks(stream))
+
+
+def estimate(source, cost_model=DEFAULT_COST_MODEL):
+    """
+    Estimate the size of an MBF XML document and the cost of converting it to EX.
+
+    Uncompressed files are memory mapped and searched, nothing is parsed as XML.
+    Compressed files, stdin and file objects are searched as they are read.
+
+    :param source: File name, '-' for stdin, or binary file object, see mbfxml2ex.sources.open_source.
+    :param cost_model: MBFCostModel predicting the cost of read_xml followed by write_ex.
+    :return: Dict with the counts, see scan_counts, the predicted 'peak_memory' in bytes
+        and the predicted 'wall_time' in seconds.
+    """
+    counts = _scan_source(source)
+    result = {"counts": counts,
+              "peak_memory": int(cost_model.peak_memory(counts)),
+              "wall_time": cost_model.wall_time(counts)}
+    if is_file_name(source):
+        result["file_size"] = os.path.getsize(source)
+
+    return result
@@ -0,0 +1,138 @@
+from mbfxml2ex.index import scan_top_level_elements, scan_nested_markers, start_tag, end_tag
+
+MBF_OBJECT_KINDS = ["tree", "contour", "marker", "vessel", "images"]
+
+
+def _as_set(values):
+    return None if values is None else frozenset(values)
+
+
+def _vessel_name(attributes):
+    version = int(attributes.get('version', 0))
+    return attributes.get('name') if version < 4 else attributes.get('class')
+
+
+class MBFObjectFilter(object):
+    """
+    Selects the top level objects to read from an MBF XML document.
+
+    An object is read when its kind is one of kinds and it matches the values given for its kind,
+    a criterion that is None matches everything.  Markers nested in trees and contours are
+    selected as markers whether or not their owner is selected.
+    """
+
+    def __init__(self, kinds=None, tree_types=None, tree_classes=None, contour_names=None, marker_names=None,
+                 vessel_names=None):
+        if kinds is not None:
+            unknown_kinds = [kind for kind in kinds if kind not in MBF_OBJECT_KINDS]
+            if unknown_kinds:
+                raise ValueError(f"Unknown object kinds: {', '.join(unknown_kinds)}, "
+                                 f"expected some of {', '.join(MBF_OBJECT_KINDS)}.")
+
+        self._kinds = _as_set(kinds)
+        self._tree_types = _as_set(tree_types)
+        self._tree_classes = _as_set(tree_classes)
+        self._contour_names = _as_set(contour_names)
+        self._marker_names = _as_set(marker_names)
+        self._vessel_names = _as_set(vessel_names)
+
+    def accepts_kind(self, raw_tag):
+        return self._kinds is None or raw_tag in self._kinds
+
+    def has_criteria(self, raw_tag):
+        """
+        Return whether objects of this kind are selected by their attributes as well as their kind.
+        """
+        if raw_tag == "tree":
+            return self._tree_types is not None or self._tree_classes is not None
+        elif raw_tag == "contour":
+            return self._contour_names is not None
+        elif raw_tag == "marker":
+            return self._marker_names is not None
+        elif raw_tag == "vessel":
+            return self._vessel_names is not None
+
+        return False
+
+    def accepts(self, raw_tag, attributes):
+        """
+        Return whether the object with this tag and these XML attributes is selected.
+        """
+        if not self.accepts_kind(raw_tag):
+            return False
+
+        if raw_tag == "tree":
+            return _matches(self._tree_types, attributes.get('type')) and \
+                _matches(self._tree_classes, attributes.get('class'))
+        elif raw_tag == "contour":
+            return _matches(self._contour_names, attributes.get('name'))
+        elif raw_tag == "marker":
+            return _matches(self._marker_names, attributes.get('name'))
+        elif raw_tag == "vessel":
+            return _matches(self._vessel_names, _vessel_name(attributes))
+
+        return True
+
+    def accepts_object(self, raw_tag, object_data):
+        """
+        Return whether the parsed object with this tag is selected.
+        """
+        if raw_tag == "tree":
+            return self.accepts(raw_tag, object_data.attributes())
+        elif raw_tag in ["contour", "marker"]:
+            return self.accepts(raw_tag, {'name': object_data['name']})
+        elif raw_tag == "vessel":
+            return self.accepts_kind(raw_tag) and _matches(self._vessel_names, object_data['name'])
+
+        return self.accepts_kind(raw_tag)
+
+    def __repr__(self):
+        criteria = [(name, sorted(value)) for name, value in [
+            ("kinds", self._kinds), ("tree_types", self._tree_types), ("tree_classes", self._tree_classes),
+            ("contour_names", self._contour_names), ("marker_names", self._marker_names),
+            ("vessel_names", self._vessel_names)] if value is not None]
+        return f"MBFObjectFilter({', '.join(f'{name}={value!r}' for name, value in criteria)})"
+
+
+def _matches(values, value):
+    return values is None or value in values
+
+
+def select_elements(content, object_filter=None):
+    """
+    Select the parts of an MBF XML document to parse for the filter.
+
+    Elements that are not objects and objects the filter rejects are left out.  A rejected tree
+    or contour holding markers the filter may accept is replaced by an element with the same start
+    tag holding only those markers, so they are relocated in the same order as in a full read.
+    Without a filter every top level element is selected.
+
+    :param content: Bytes like object with the document.
+    :param object_filter: MBFObjectFilter or None.
+    :return: Tuple of the MBFElementIndex of the document and a list of (raw tag, segments, keep)
+        tuples.  The segments are literal bytes or (start, end) byte ranges, the object parsed from
+        the segments is only kept when keep is True.
+    """
+    index = scan_top_level_elements(content)
+    if object_filter is None:
+        return index, [(raw_tag, [(start, end)], True) for raw_tag, start, end in index.entries()]
+
+    selection = []
+    for raw_tag, start, end in index.entries():
+        if raw_tag not in MBF_OBJECT_KINDS:
+            continue
+
+        if object_filter.accepts_kind(raw_tag) and object_filter.has_criteria(raw_tag):
+            accepted = object_filter.accepts(raw_tag, index.start_tag_attributes(start_tag(content, start)))
+        else:
+            accepted = object_filter.accepts_kind(raw_tag)
+
+        if accepted:
+            selection.append((raw_tag, [(start, end)], True))
+        elif raw_tag in ["tree", "contour"] and object_filter.accepts_kind("marker"):
+            markers = scan_nested_markers(content, start, end)
+            if markers:
+                tag = start_tag(content, start)
+                selection.append((raw_tag, [tag, *markers, end_tag(tag)], False))
+
+    return index, selection
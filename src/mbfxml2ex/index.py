@@ -0,0 +1,259 @@
+import io
+import mmap
+import re
+import xml.etree.ElementTree as ElTree
+
+from mbfxml2ex.exceptions import MBFXMLFormat
+from mbfxml2ex.sources import detect_compression
+
+SEGMENT_READ_SIZE = 1 << 20
+
+_ROOT_START_TAG = re.compile(rb'<([^\s/>?!]+)(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*\s*>')
+_START_TAG = re.compile(rb'<([^\s/>?!]+)(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*\s*(/?)>')
+_NESTED_MARKER_START = re.compile(rb'<(?:[^\s/>?!:]+:)?marker[\s/>]')
+_SKIPPED_MARKUP = [(b'<!--', b'-->'), (b'<![CDATA[', b']]>'), (b'<?', b'?>'), (b'<!', b'>')]
+
+
+class MBFElementIndex(object):
+    """
+    Byte ranges of the top level elements of an MBF XML document.
+
+    The prolog is everything up to and including the start tag of the document root, it carries
+    the encoding and the namespace declarations a range needs to be parsed on its own.
+    Each entry is a (raw tag, start, end) tuple, an element spans [start, end) of the file.
+    """
+
+    def __init__(self, prolog, root_tag, entries):
+        self._prolog = prolog
+        self._root_tag = root_tag
+        self._entries = entries
+
+    def prolog(self):
+        return self._prolog
+
+    def root_tag(self):
+        return self._root_tag
+
+    def entries(self):
+        return self._entries
+
+    def fragment(self, content):
+        """
+        Return a complete MBF XML document holding the given content of the document root.
+
+        :param content: Bytes of one or more consecutive top level elements.
+        :return: Bytes of the document.
+        """
+        return b''.join([self._prolog, content, b'</', self._root_tag, b'>'])
+
+    def end_tag(self):
+        return b''.join([b'</', self._root_tag, b'>'])
+
+    def start_tag_attributes(self, start_tag):
+        """
+        Return the attributes of a top level start tag of this document.
+
+        :param start_tag: Bytes of the start tag.
+        :return: Dict of the attributes.
+        """
+        element_end = b'' if start_tag.endswith(b'/>') else end_tag(start_tag)
+        try:
+            root = ElTree.fromstring(self.fragment(start_tag + element_end))
+        except ElTree.ParseError as e:
+            raise MBFXMLFormat(f"Malformed start tag: {e}") from None
+        return dict(root[0].attrib)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MBFSegmentReader(io.RawIOBase):
+    """
+    Reads the concatenation of literal byte strings and (start, end) byte ranges of a binary file.
+    """
+
+    def __init__(self, file_object, segments):
+        super(MBFSegmentReader, self).__init__()
+        self._file = file_object
+        self._segments = iter(segments)
+        self._current = b''
+        self._range = None
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        if self._range is None:
+            segment = next(self._segments, None)
+            if not isinstance(segment, tuple):
+                return segment
+            self._range = segment
+
+        start, end = self._range
+        size = min(end - start, SEGMENT_READ_SIZE)
+        self._file.seek(start)
+        chunk = self._file.read(size)
+        if len(chunk) < size:
+            raise MBFXMLFormat("File is shorter than its index.")
+        self._range = (start + size, end) if start + size < end else None
+        return chunk
+
+    def readinto(self, buffer):
+        while not self._current:
+            chunk = self._next_chunk()
+            if chunk is None:
+                return 0
+            self._current = memoryview(chunk)
+
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+
+def _skip_markup(content, position):
+    for opening, closing in _SKIPPED_MARKUP:
+        if content[position:position + len(opening)] == opening:
+            end = content.find(closing, position + len(opening))
+            if end == -1:
+                raise MBFXMLFormat(f"Unterminated markup at byte {position}.")
+            return end + len(closing)
+
+    return None
+
+
+def _end_tag_pattern(qualified_tag, patterns):
+    if qualified_tag not in patterns:
+        patterns[qualified_tag] = re.compile(rb'</' + re.escape(qualified_tag) + rb'\s*>')
+
+    return patterns[qualified_tag]
+
+
+def scan_top_level_elements(content):
+    """
+    Scan the byte ranges of the top level elements of an MBF XML document.
+
+    Only the markup between top level elements is tokenized, the end of an element is found by
+    searching for its end tag.  MBF elements do not nest elements with the tag of a top level
+    element, a document that breaks this gives ranges that are not well-formed on their own.
+
+    :param content: Bytes like object with the document.
+    :return: MBFElementIndex.
+    """
+    compression = detect_compression(content[:8])
+    if compression is not None:
+        raise MBFXMLFormat(f"A {compression} compressed document cannot be scanned.")
+    if content[:2] in (b'\xff\xfe', b'\xfe\xff') or b'\x00' in content[:4]:
+        raise MBFXMLFormat("Only byte oriented encodings can be scanned.")
+
+    position = 0
+    while True:
+        position = content.find(b'<', position)
+        if position == -1:
+            raise MBFXMLFormat("No document root found.")
+        skipped = _skip_markup(content, position)
+        if skipped is None:
+            break
+        position = skipped
+
+    match = _ROOT_START_TAG.match(content, position)
+    if match is None:
+        raise MBFXMLFormat(f"Malformed document root at byte {position}.")
+
+    root_tag = match.group(1)
+    prolog = bytes(content[:match.end()])
+    position = match.end()
+    end_tag_patterns = {}
+    entries = []
+    while True:
+        position = content.find(b'<', position)
+        if position == -1:
+            raise MBFXMLFormat("Document root is not closed.")
+        if content[position:position + 2] == b'</':
+            break
+        skipped = _skip_markup(content, position)
+        if skipped is not None:
+            position = skipped
+            continue
+
+        match = _START_TAG.match(content, position)
+        if match is None:
+            raise MBFXMLFormat(f"Malformed start tag at byte {position}.")
+        end = _element_end(content, match, end_tag_patterns)
+        entries.append((match.group(1).rpartition(b':')[2].decode('latin-1'), position, end))
+        position = end
+
+    return MBFElementIndex(prolog, root_tag, entries)
+
+
+def start_tag(content, start):
+    """
+    Return the bytes of the start tag beginning at start.
+    """
+    match = _START_TAG.match(content, start)
+    if match is None:
+        raise MBFXMLFormat(f"Malformed start tag at byte {start}.")
+
+    return match.group(0)
+
+
+def end_tag(start_tag_bytes):
+    """
+    Return the bytes of the end tag matching the start tag.
+    """
+    return b''.join([b'</', _START_TAG.match(start_tag_bytes).group(1), b'>'])
+
+
+def _element_end(content, match, end_tag_patterns):
+    if match.group(2):
+        return match.end()
+
+    qualified_tag = match.group(1)
+    end_match = _end_tag_pattern(qualified_tag, end_tag_patterns).search(content, match.end())
+    if end_match is None:
+        raise MBFXMLFormat(f"Element '{qualified_tag.decode('latin-1')}' starting at byte {match.start()} "
+                           "is not closed.")
+
+    return end_match.end()
+
+
+def scan_nested_markers(content, start, end):
+    """
+    Scan the byte ranges of the markers nested in the element spanning [start, end) of the document.
+
+    :param content: Bytes like object with the document.
+    :param start: Start of the element.
+    :param end: End of the element.
+    :return: List of (start, end) tuples in document order.
+    """
+    end_tag_patterns = {}
+    ranges = []
+    position = start + 1
+    while True:
+        marker_match = _NESTED_MARKER_START.search(content, position, end)
+        if marker_match is None:
+            return ranges
+
+        match = _START_TAG.match(content, marker_match.start(), end)
+        if match is None:
+            raise MBFXMLFormat(f"Malformed start tag at byte {marker_match.start()}.")
+        position = _element_end(content, match, end_tag_patterns)
+        ranges.append((marker_match.start(), position))
+
+
+def index_file(file_name, scan=scan_top_level_elements):
+    """
+    Scan the byte ranges of the top level elements of an MBF XML file.
+
+    :param file_name: Name of the MBF XML file.
+    :param scan: Function called with the mapped content of the file.
+    :return: Result of scan, MBFElementIndex by default.
+    """
+    with open(file_name, 'rb') as f:
+        try:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise MBFXMLFormat("Empty file.") from None
+
+        with content:
+            return scan(content)
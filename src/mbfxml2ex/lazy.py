@@ -0,0 +1,196 @@
+import io
+import json
+import os
+from collections import OrderedDict
+
+from mbfxml2ex.classes import MBFData
+from mbfxml2ex.exceptions import MBFDataException
+from mbfxml2ex.index import MBFElementIndex, index_file, scan_top_level_elements, scan_nested_markers
+from mbfxml2ex.reader import iterate_objects
+
+INDEX_VERSION = 1
+INDEX_FILE_SUFFIX = ".mbfindex.json"
+DEFAULT_CACHE_SIZE = 64
+
+_INDEXED_TAGS = ["tree", "contour", "marker", "vessel", "images"]
+
+
+def index_file_name(file_name):
+    """
+    Return the name of the index file saved next to the MBF XML file.
+    """
+    return file_name + INDEX_FILE_SUFFIX
+
+
+def _file_signature(file_name):
+    status = os.stat(file_name)
+    return {"version": INDEX_VERSION, "size": status.st_size, "mtime_ns": status.st_mtime_ns}
+
+
+def _scan_objects(content):
+    index = scan_top_level_elements(content)
+    ranges = {raw_tag: [] for raw_tag in _INDEXED_TAGS}
+    nested_markers = []
+    for raw_tag, start, end in index.entries():
+        if raw_tag in ranges:
+            ranges[raw_tag].append([start, end])
+        if raw_tag in ["tree", "contour"]:
+            nested_markers.extend([marker_start, marker_end]
+                                  for marker_start, marker_end in scan_nested_markers(content, start, end))
+
+    # Markers nested in trees and contours come after all the other markers, as they do when reading the whole file.
+    ranges["marker"].extend(nested_markers)
+    return {"prolog": index.prolog().decode("latin-1"), "root_tag": index.root_tag().decode("latin-1"),
+            "ranges": ranges}
+
+
+def _load_index(file_name):
+    try:
+        with open(index_file_name(file_name), "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    signature = _file_signature(file_name)
+    if not isinstance(index, dict) or any(index.get(key) != value for key, value in signature.items()):
+        return None
+
+    return index
+
+
+def _save_index(file_name, index):
+    temporary_file_name = index_file_name(file_name) + f".{os.getpid()}"
+    try:
+        with open(temporary_file_name, "w") as f:
+            json.dump(index, f)
+        os.replace(temporary_file_name, index_file_name(file_name))
+    except OSError:
+        # The index is only an optimisation, a location that cannot be written to is not an error.
+        try:
+            os.remove(temporary_file_name)
+        except OSError:
+            pass
+
+
+class LazyMBFData(MBFData):
+    """
+    MBF data that parses its objects from the file when they are first asked for.
+
+    The byte ranges of the objects are indexed when the file is opened and the counts are answered
+    from the index, the images are parsed straight away.  Parsed objects are kept in a least recently
+    used cache of cache_size objects.  The index is saved next to the file, see index_file_name,
+    and reused for as long as the size and modification time of the file are unchanged.
+    """
+
+    def __init__(self, file_name, backend=None, cache_size=DEFAULT_CACHE_SIZE, persist_index=True,
+                 lazy_properties=False):
+        super(LazyMBFData, self).__init__()
+        self._file_name = file_name
+        self._backend = backend
+        self._lazy_properties = lazy_properties
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+
+        index = _load_index(file_name) if persist_index else None
+        if index is None:
+            signature = _file_signature(file_name)
+            index = index_file(file_name, _scan_objects)
+            index.update(signature)
+            if persist_index:
+                _save_index(file_name, index)
+
+        self._header = MBFElementIndex(index["prolog"].encode("latin-1"), index["root_tag"].encode("latin-1"), [])
+        self._ranges = index["ranges"]
+        if self._ranges["images"]:
+            self._images = self._parse_range(*self._ranges["images"][-1])
+
+    def _parse_range(self, start, end):
+        with open(self._file_name, "rb") as f:
+            f.seek(start)
+            content = f.read(end - start)
+
+        source = io.BytesIO(self._header.fragment(content))
+        _, parsed_object = next(iterate_objects(source, self._backend, self._lazy_properties))
+        return parsed_object
+
+    def _get(self, raw_tag, index):
+        start, end = self._ranges[raw_tag][index]
+        if start in self._cache:
+            self._cache.move_to_end(start)
+            return self._cache[start]
+
+        parsed_object = self._parse_range(start, end)
+        if self._cache_size > 0:
+            self._cache[start] = parsed_object
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return parsed_object
+
+    def _get_all(self, raw_tag):
+        return [self._get(raw_tag, index) for index in range(len(self._ranges[raw_tag]))]
+
+    def file_name(self):
+        return self._file_name
+
+    def cached_count(self):
+        return len(self._cache)
+
+    def add_tree(self, tree_data):
+        raise MBFDataException("Lazily read MBF data cannot be added to.")
+
+    def get_trees(self):
+        return self._get_all("tree")
+
+    def get_tree(self, index):
+        return self._get("tree", index)
+
+    def trees_count(self):
+        return len(self._ranges["tree"])
+
+    def add_contour(self, contour_data):
+        raise MBFDataException("Lazily read MBF data cannot be added to.")
+
+    def get_contours(self):
+        return self._get_all("contour")
+
+    def get_contour(self, index):
+        return self._get("contour", index)
+
+    def contours_count(self):
+        return len(self._ranges["contour"])
+
+    def add_marker(self, marker_data):
+        raise MBFDataException("Lazily read MBF data cannot be added to.")
+
+    def get_markers(self):
+        return self._get_all("marker")
+
+    def get_marker(self, index):
+        return self._get("marker", index)
+
+    def markers_count(self):
+        return len(self._ranges["marker"])
+
+    def add_vessel(self, vessel_data):
+        raise MBFDataException("Lazily read MBF data cannot be added to.")
+
+    def get_vessels(self):
+        return self._get_all("vessel")
+
+    def get_vessel(self, index):
+        return self._get("vessel", index)
+
+    def vessel_count(self):
+        return len(self._ranges["vessel"])
+
+    def set_images(self, images):
+        raise MBFDataException("Lazily read MBF data cannot be added to.")
+
+    def process_scaling_and_offset(self):
+        # Parsed objects are dropped from the cache, changes made to them would be lost.
+        raise MBFDataException("Lazily read MBF data cannot be scaled and offset.")
+
+    def __len__(self):
+        return self.trees_count() + self.markers_count() + self.contours_count() + len(self._images) + \
+            self.vessel_count()
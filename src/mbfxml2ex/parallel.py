@@ -0,0 +1,107 @@
+import functools
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from mbfxml2ex.exceptions import MBFXMLFormat
+from mbfxml2ex.filters import select_elements
+from mbfxml2ex.index import MBFElementIndex, MBFSegmentReader, index_file
+from mbfxml2ex.reader import iterate_objects, MBF_OBJECT_PARSERS
+
+CHUNKS_PER_PROCESS = 4
+
+
+def resolve_processes(processes):
+    """
+    Return the number of processes to parse with, 0 asks for one process per CPU.
+    """
+    if processes == 0:
+        return os.cpu_count() or 1
+
+    if processes < 0:
+        raise ValueError(f"The number of processes must not be negative, got {processes}.")
+
+    return processes
+
+
+def _selection_size(item):
+    return sum(len(segment) if isinstance(segment, bytes) else segment[1] - segment[0] for segment in item[1])
+
+
+def _partition(selection, chunk_count):
+    # Split the selection into runs of consecutive elements with about the same number of bytes.
+    if not selection:
+        return []
+
+    target = sum(_selection_size(item) for item in selection) / chunk_count
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for item in selection:
+        chunk.append(item)
+        chunk_size += _selection_size(item)
+        if chunk_size >= target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def _parse_chunk(file_name, header, chunk, backend, lazy_properties):
+    with open(file_name, 'rb') as f:
+        segments = [header.prolog(), *(segment for _, item_segments, _ in chunk for segment in item_segments),
+                    header.end_tag()]
+        objects = list(iterate_objects(io.BufferedReader(MBFSegmentReader(f, segments)), backend, lazy_properties))
+
+    keep = [kept for raw_tag, _, kept in chunk if raw_tag in MBF_OBJECT_PARSERS]
+    # Markers relocated out of trees and contours follow the top level objects.
+    return [parsed_object for parsed_object, kept in zip(objects, keep) if kept], objects[len(keep):]
+
+
+def read_objects_in_parallel(file_name, processes, backend=None, lazy_properties=False, object_filter=None):
+    """
+    Parse the objects of an MBF XML file with a pool of processes.
+
+    The byte ranges of the top level elements are scanned first, consecutive ranges are handed
+    to the processes and the parsed objects are put back in the order of a serial parse.
+    When the file cannot be scanned, or any range fails to parse, the file is parsed serially
+    so the result and the errors are the same as for a serial parse.
+
+    :param file_name: Name of the MBF XML file.
+    :param processes: Number of processes, 0 for one process per CPU.
+    :param backend: XML parser backend, see mbfxml2ex.reader.resolve_backend.
+    :param lazy_properties: Convert the values of generic properties when they are first used.
+    :param object_filter: MBFObjectFilter selecting the objects to read, or None.
+    :return: List of (raw tag, parsed object) tuples.
+    """
+    processes = resolve_processes(processes)
+    try:
+        index, selection = index_file(file_name, functools.partial(select_elements, object_filter=object_filter))
+    except MBFXMLFormat:
+        index, selection = None, []
+
+    chunks = _partition(selection, processes * CHUNKS_PER_PROCESS)
+    if processes < 2 or len(chunks) < 2:
+        return list(iterate_objects(file_name, backend, lazy_properties, object_filter))
+
+    header = MBFElementIndex(index.prolog(), index.root_tag(), [])
+    try:
+        with ProcessPoolExecutor(min(processes, len(chunks))) as executor:
+            results = list(executor.map(
+                _parse_chunk,
+                [file_name] * len(chunks),
+                [header] * len(chunks),
+                chunks,
+                [backend] * len(chunks),
+                [lazy_properties] * len(chunks)))
+    except Exception:
+        return list(iterate_objects(file_name, backend, lazy_properties, object_filter))
+
+    objects = [parsed_object for chunk_objects, _ in results for parsed_object in chunk_objects]
+    objects.extend((raw_tag, marker) for _, relocated_markers in results for raw_tag, marker in relocated_markers
+                   if object_filter is None or object_filter.accepts_object(raw_tag, marker))
+    return objects
@@ -1,57 +1,111 @@
+import functools
+from sys import intern
+
 from mbfxml2ex.classes import MBFPropertyChannel, MBFProperty, NeurolucidaChannel, NeurolucidaChannels, \
-    NeurolucidaZSpacing, MBFPoint, MBFPropertyPunctum, MBFPropertyVolumeRLE, MBFPropertySet, MBFPropertyTraceAssociation, \
-    MBFTree, MBFPropertyGUID, MBFPropertyFillDensity, MBFPropertyTreeOrder, MBFPropertyGeneric
+    NeurolucidaZSpacing, MBFPointStore, MBFPropertyPunctum, MBFPropertyVolumeRLE, MBFPropertySet, MBFPropertyTraceAssociation, \
+    MBFTree, MBFPropertyGUID, MBFPropertyFillDensity, MBFPropertyTreeOrder, MBFPropertyGeneric, MBFContour, MBFMarker, \
+    MBFVessel, MBFVesselNode, MBFVesselEdge, generic_property_items
 from mbfxml2ex.conversions import hex_to_rgb
 from mbfxml2ex.exceptions import MBFXMLException
 from mbfxml2ex.utilities import get_raw_tag
 
 
-def _parse_tree_structure(tree_root):
-    tree = {'points': [], 'properties': [], 'attributes': {k: v for k, v in tree_root.attrib.items()}}
+def _intern(value):
+    return value if value is None else intern(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_colour_rgb(colour):
+    return tuple(hex_to_rgb(colour))
+
+
+def _colour_rgb(colour):
+    # The colour is converted once, each object gets its own rgb list so that changing it leaves the others alone.
+    return list(_cached_colour_rgb(colour))
+
+
+def _new_tree_structure(attributes):
+    return {'points': [], 'properties': [], 'attributes': {intern(k): intern(v) for k, v in attributes.items()}}
+
+
+def _parse_tree_structure(tree_root, point_store, lazy_properties=False):
+    # Follows the nesting of the branches with a stack, not recursion, each frame is the children of an element
+    # still to parse, the tree structure of the element and the start of its current run of points.
+    tree = _new_tree_structure(tree_root.attrib)
     # if 'class' in tree_root.attrib:
     #     tree['class'] = tree_root.attrib['class']
 
-    for child in tree_root:
+    stack = [[iter(tree_root), tree, None]]
+    while stack:
+        frame = stack[-1]
+        children, structure, run_start = frame
+        child = next(children, None)
+        if child is None:
+            _close_point_run(structure, run_start, point_store)
+            stack.pop()
+            continue
+
         raw_tag = get_raw_tag(child)
         if raw_tag == "point":
-            tree['points'].append(_create_mbf_point(child))
+            index = _add_point(point_store, child.attrib)
+            if run_start is None:
+                frame[2] = index
         elif raw_tag == "branch":
-            tree['points'].append(_parse_tree_structure(child))
+            frame[2] = _close_point_run(structure, run_start, point_store)
+            branch = _new_tree_structure(child.attrib)
+            structure['points'].append(branch)
+            stack.append([iter(child), branch, None])
         elif raw_tag == "property":
-            prop = _parse_property(child)
-            tree['properties'].append((prop.name(), prop))
+            prop = _parse_property(child, lazy_properties)
+            structure['properties'].append((prop.name(), prop))
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
     return tree
 
 
-def parse_tree(tree_root):
-    return MBFTree(_parse_tree_structure(tree_root))
+def _close_point_run(tree_structure, run_start, point_store):
+    """
+    Add the run of points from run_start to the end of the point store to the tree structure.
+    """
+    if run_start is not None:
+        tree_structure['points'].append(range(run_start, len(point_store)))
+
+    return None
+
+
+def parse_tree(tree_root, lazy_properties=False):
+    point_store = MBFPointStore()
+    return MBFTree(_parse_tree_structure(tree_root, point_store, lazy_properties), point_store)
 
 
-def parse_contour(contour_root):
-    contour = {
-        'colour': contour_root.attrib['color'],
-        'rgb': hex_to_rgb(contour_root.attrib['color']),
-        'closed': contour_root.attrib['closed'] == 'true',
-        'name': contour_root.attrib['name'],
-        'resolution': -1,
-        'properties': [],
-    }
-    data = []
+def _new_contour(attributes):
+    colour = intern(attributes['color'])
+    return MBFContour(
+        colour=colour,
+        rgb=_colour_rgb(colour),
+        closed=attributes['closed'] == 'true',
+        name=intern(attributes['name']),
+        resolution=-1,
+        properties=[],
+    )
+
+
+def parse_contour(contour_root, lazy_properties=False):
+    contour = _new_contour(contour_root.attrib)
+    point_store = MBFPointStore()
     for child in contour_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "point":
-            data.append(_create_mbf_point(child))
+            _add_point(point_store, child.attrib)
         elif raw_tag == "property":
-            contour['properties'].append(_parse_property(child))
+            contour['properties'].append(_parse_property(child, lazy_properties))
         elif raw_tag == "resolution":
             contour['resolution'] = float(child.text)
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
-    contour['data'] = data
+    contour['data'] = point_store.points()
 
     return contour
 
@@ -126,7 +180,7 @@ def parse_numeric_value(element):
 
 
 def parse_string_value(element):
-    return "" if element.text is None else element.text.strip()
+    return "" if element.text is None else intern(element.text.strip())
 
 
 def parse_fill_density_property(property_root):
@@ -148,7 +202,7 @@ def _property_text(property_root):
 def parse_set_property(property_root):
     items = []
     for child in property_root:
-        items.append(child.text)
+        items.append(_intern(child.text))
 
     return MBFPropertySet(items)
 
@@ -193,25 +247,20 @@ def parse_tree_order_property(property_root):
     return MBFPropertyTreeOrder(int(number_string))
 
 
-def parse_generic_property(property_root):
+def parse_generic_property(property_root, lazy=False):
     # name = get_raw_tag(property_root)
-    name = property_root.attrib.get("name", "unnamed-property")
-    properties = []
+    name = intern(property_root.attrib.get("name", "unnamed-property"))
+    raw_items = []
     for child in property_root:
-        raw_tag = get_raw_tag(child)
-        value = child.text if child.text else None
-        if raw_tag not in ["n", "s", "c", "l", "b"]:
-            print(f"Need to handle this property child tag '{raw_tag}'.")
-        if value is not None:
-            if raw_tag == "n":
-                value = float(value)
+        raw_items += (get_raw_tag(child), child.text)
 
-        properties.append({raw_tag: value})
+    if lazy:
+        return MBFPropertyGeneric(name, raw_items=tuple(raw_items))
 
-    return MBFPropertyGeneric(name, properties)
+    return MBFPropertyGeneric(name, generic_property_items(raw_items))
 
 
-def _parse_property(property_root) -> MBFProperty:
+def _parse_property(property_root, lazy_properties=False) -> MBFProperty:
     name = property_root.attrib['name']
     if name == "Punctum":
         return parse_punctum_property(property_root)
@@ -222,7 +271,7 @@ def _parse_property(property_root) -> MBFProperty:
     elif name == "TraceAssociation":
         return parse_trace_association_property(property_root)
     elif name in ["Channel", "GUID", "FillDensity", "TreeOrder", "zSmear", "Densitometry"]:
-        return parse_generic_property(property_root)
+        return parse_generic_property(property_root, lazy_properties)
     # elif name == "Channel":
     #     return parse_channel_property(property_root)
     # elif name == "TreeOrder":
@@ -243,25 +292,30 @@ def _parse_property(property_root) -> MBFProperty:
         raise MBFXMLException("Unhandled property '{0}'".format(name))
 
 
-def parse_marker(marker_root):
-    marker = {'colour': marker_root.attrib['color'],
-              'rgb': hex_to_rgb(marker_root.attrib['color']),
-              'name': marker_root.attrib['name'],
-              'type': marker_root.attrib['type'],
-              'varicosity': marker_root.attrib['varicosity'] == "true",
-              'properties': []}
+def _new_marker(attributes):
+    colour = intern(attributes['color'])
+    return MBFMarker(colour=colour,
+                     rgb=_colour_rgb(colour),
+                     name=intern(attributes['name']),
+                     type=intern(attributes['type']),
+                     varicosity=attributes['varicosity'] == "true",
+                     properties=[])
+
 
-    data = []
+def parse_marker(marker_root, lazy_properties=False):
+    marker = _new_marker(marker_root.attrib)
+
+    point_store = MBFPointStore()
     for child in marker_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "point":
-            data.append(_create_mbf_point(child))
+            _add_point(point_store, child.attrib)
         elif raw_tag == "property":
-            marker['properties'].append(_parse_property(child))
+            marker['properties'].append(_parse_property(child, lazy_properties))
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
-    marker['data'] = data
+    marker['data'] = point_store.points()
 
     return marker
 
@@ -307,75 +361,100 @@ def parse_images(images_root):
     return images
 
 
-def parse_node(node_root):
-    node = {'id': node_root.attrib['id'], }
+def _new_node(attributes):
+    return MBFVesselNode(id=attributes['id'])
+
+
+def parse_node(node_root, point_store=None):
+    node = _new_node(node_root.attrib)
+    if point_store is None:
+        point_store = MBFPointStore()
 
     data = None
     for child in node_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "point":
-            data = _create_mbf_point(child)
+            data = point_store.point(_add_point(point_store, child.attrib))
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
     if data is None:
-        raise MBFXMLException("XML format violation no point tag for node with id '{0}'.".format(node['id']))
+        _raise_missing_node_point(node)
 
     node['data'] = data
     return node
 
 
-def parse_nodes(nodes_root):
+def parse_nodes(nodes_root, point_store=None):
+    if point_store is None:
+        point_store = MBFPointStore()
+
     nodes = []
     for child in nodes_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "node":
-            nodes.append(parse_node(child))
+            nodes.append(parse_node(child, point_store))
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
     return nodes
 
 
-def parse_edge(edge_root):
-    edge = {'id': edge_root.attrib['id'], 'properties': []}
-    if 'class' in edge_root.attrib:
-        edge['class'] = edge_root.attrib['class']
+def _raise_missing_node_point(node):
+    raise MBFXMLException("XML format violation no point tag for node with id '{0}'.".format(node['id']))
+
+
+def _new_edge(attributes):
+    edge = MBFVesselEdge(id=attributes['id'], properties=[])
+    if 'class' in attributes:
+        edge['class'] = intern(attributes['class'])
+
+    return edge
+
 
-    data = []
+def parse_edge(edge_root, point_store=None, lazy_properties=False):
+    edge = _new_edge(edge_root.attrib)
+    if point_store is None:
+        point_store = MBFPointStore()
+
+    start = len(point_store)
     for child in edge_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "point":
-            data.append(_create_mbf_point(child))
+            _add_point(point_store, child.attrib)
         elif raw_tag == "property":
-            edge['properties'].append(_parse_property(child))
+            edge['properties'].append(_parse_property(child, lazy_properties))
         else:
             raise MBFXMLException("XML format violation unknown tag {0}".format(raw_tag))
 
-    edge['data'] = data
+    edge['data'] = point_store.points(start)
     return edge
 
 
-def parse_edges(edges_root):
-    edges = []
+def parse_edges(edges_root, point_store=None, lazy_properties=False):
+    if point_store is None:
+        point_store = MBFPointStore()
 
+    edges = []
     for child in edges_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "edge":
-            edges.append(parse_edge(child))
+            edges.append(parse_edge(child, point_store, lazy_properties))
         else:
             raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
 
     return edges
 
 
-def parse_edgelist(edgelist_root):
-    edgelist = {'id': edgelist_root.attrib['id'],
-                'edge': edgelist_root.attrib['edge'],
-                'sourcenode': edgelist_root.attrib['sourcenode'],
-                'targetnode': edgelist_root.attrib['targetnode'], }
+def _new_edgelist(attributes):
+    return {'id': attributes['id'],
+            'edge': attributes['edge'],
+            'sourcenode': attributes['sourcenode'],
+            'targetnode': attributes['targetnode'], }
 
-    return edgelist
+
+def parse_edgelist(edgelist_root):
+    return _new_edgelist(edgelist_root.attrib)
 
 
 def parse_edgelists(edgelists_root):
@@ -391,35 +470,41 @@ def parse_edgelists(edgelists_root):
     return edgelists
 
 
-def parse_vessel(vessel_root):
-    version = int(vessel_root.attrib['version'])
-    vessel = {
-        'version': version,
-        'colour': vessel_root.attrib['color'],
-        'rgb': hex_to_rgb(vessel_root.attrib['color']),
-        'type': vessel_root.attrib['type'],
-        'properties': [],
-        'name': vessel_root.attrib['name'] if version < 4 else vessel_root.attrib['class'],
-    }
+def _new_vessel(attributes):
+    version = int(attributes['version'])
+    colour = intern(attributes['color'])
+    return MBFVessel(
+        version=version,
+        colour=colour,
+        rgb=_colour_rgb(colour),
+        type=intern(attributes['type']),
+        properties=[],
+        name=intern(attributes['name'] if version < 4 else attributes['class']),
+    )
+
+
+def parse_vessel(vessel_root, lazy_properties=False):
+    vessel = _new_vessel(vessel_root.attrib)
 
+    point_store = MBFPointStore()
     for child in vessel_root:
         raw_tag = get_raw_tag(child)
         if raw_tag == "nodes":
-            vessel['nodes'] = parse_nodes(child)
+            vessel['nodes'] = parse_nodes(child, point_store)
         elif raw_tag == "edges":
-            vessel['edges'] = parse_edges(child)
+            vessel['edges'] = parse_edges(child, point_store, lazy_properties)
         elif raw_tag == "edgelists":
             vessel['edgelists'] = parse_edgelists(child)
         elif raw_tag == "property":
-            vessel['properties'].append(_parse_property(child))
+            vessel['properties'].append(_parse_property(child, lazy_properties))
         else:
             print(f"Unhandled tag in vessel: '{raw_tag}'")
 
     return vessel
 
 
-def _create_mbf_point(child):
-    return MBFPoint(float(child.attrib['x']),
-                    float(child.attrib['y']),
-                    float(child.attrib['z']),
-                    float(child.attrib['d']))
+def _add_point(point_store, attributes):
+    return point_store.add(float(attributes['x']),
+                           float(attributes['y']),
+                           float(attributes['z']),
+                           float(attributes['d']))
@@ -0,0 +1,230 @@
+import functools
+import io
+import xml.etree.ElementTree as ElTree
+from xml.etree.ElementTree import ParseError
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+from mbfxml2ex import sax
+from mbfxml2ex.definitions import MBF_INTERNAL_DATA_SET_TAGS
+from mbfxml2ex.exceptions import MBFXMLFormat
+from mbfxml2ex.filters import select_elements
+from mbfxml2ex.index import MBFSegmentReader, index_file
+from mbfxml2ex.parsers import parse_contour, parse_tree, parse_marker, parse_images, parse_vessel
+from mbfxml2ex.sources import open_source, is_file_name
+from mbfxml2ex.utilities import get_raw_tag
+
+XML_BACKENDS = ["etree", "lxml", "expat"]
+
+MBF_OBJECT_PARSERS = {
+    "tree": parse_tree,
+    "contour": parse_contour,
+    "marker": parse_marker,
+    "images": parse_images,
+    "vessel": parse_vessel,
+}
+
+
+def available_backends():
+    """
+    Return the names of the XML parser backends that can be used in this environment.
+    """
+    return [backend for backend in XML_BACKENDS if backend != "lxml" or lxml_etree is not None]
+
+
+def resolve_backend(backend=None):
+    """
+    Return the name of the XML parser backend to use.
+
+    When no backend is given ElementTree is used, lxml and expat have to be asked for.
+    Going through the element interface of the parsers lxml is slower than ElementTree,
+    see tests/benchmark_backends.py.
+
+    :param backend: One of XML_BACKENDS or None.
+    :return: The name of the backend.
+    """
+    if backend is None:
+        return "etree"
+
+    if backend not in XML_BACKENDS:
+        raise ValueError(f"Unknown XML parser backend '{backend}', expected one of {', '.join(XML_BACKENDS)}.")
+    if backend not in available_backends():
+        raise ValueError(f"XML parser backend '{backend}' is not available.")
+
+    return backend
+
+
+def _iterparse(source, backend):
+    if backend == "lxml":
+        return lxml_etree.iterparse(source, events=("start", "end"), remove_comments=True, remove_pis=True,
+                                    huge_tree=True)
+
+    return ElTree.iterparse(source, events=("start", "end"))
+
+
+def iterate_top_level_elements(source, backend="etree"):
+    """
+    Stream the top level elements of an MBF XML document.
+
+    Each child of the document root is yielded as soon as its end tag has been read and is
+    released once the consumer moves on, so only one top level element is held in memory at a time.
+    Markers found inside trees and contours are collected as they close, detached from their
+    parents in a single pass when their owner closes, and yielded after the last top level element.
+
+    :param source: File name, '-' for stdin, or file object of the MBF XML document, see
+        mbfxml2ex.sources.open_source for compressed documents.
+    :param backend: Element building backend, either 'etree' or 'lxml'.
+    :return: Generator of (raw tag, element) tuples.
+    """
+    with open_source(source) as stream:
+        yield from _iterate_top_level_elements(stream, backend)
+
+
+def _iterate_top_level_elements(source, backend):
+    parse_errors = (ParseError,) if lxml_etree is None else (ParseError, lxml_etree.ParseError)
+    open_elements = []
+    relocate_markers = False
+    marker_parents = {}
+    relocated_markers = []
+    try:
+        for event, element in _iterparse(source, backend):
+            if event == "start":
+                open_elements.append(element)
+                if len(open_elements) == 2:
+                    relocate_markers = get_raw_tag(element) in ["tree", "contour"]
+                continue
+
+            open_elements.pop()
+            depth = len(open_elements)
+            if depth > 1:
+                if relocate_markers and _is_marker_tag(element.tag):
+                    parent = open_elements[-1]
+                    marker_parents.setdefault(id(parent), (parent, set()))[1].add(id(element))
+                    relocated_markers.append(element)
+            elif depth == 1:
+                if marker_parents:
+                    _remove_children(marker_parents)
+                    marker_parents = {}
+                yield get_raw_tag(element), element
+                element.clear()
+                open_elements[0].clear()
+    except parse_errors as e:
+        raise MBFXMLFormat(e.msg) from None
+
+    for marker_element in relocated_markers:
+        yield "marker", marker_element
+
+
+def iterate_objects(source, backend=None, lazy_properties=False, object_filter=None):
+    """
+    Stream the parsed objects of an MBF XML document.
+
+    Internal data set tags are skipped and unhandled tags are reported and skipped.
+    With lazy_properties the children of generic properties, such as GUID, Channel and FillDensity,
+    are kept as text and only converted when the items of the property are first asked for.
+
+    :param source: File name, '-' for stdin, or file object of the MBF XML document.  Gzip, bz2 and xz
+        compressed documents are decompressed as they are parsed.
+    :param backend: XML parser backend, one of XML_BACKENDS, see resolve_backend for the default.
+    :param lazy_properties: Convert the values of generic properties when they are first used.
+    :param object_filter: MBFObjectFilter selecting the objects to read, see iterate_selected_objects.
+    :return: Generator of (raw tag, parsed object) tuples.
+    """
+    backend = resolve_backend(backend)
+    if object_filter is not None:
+        yield from iterate_selected_objects(source, object_filter, backend, lazy_properties)
+        return
+
+    if backend == "expat":
+        yield from sax.iterate_objects(source, lazy_properties)
+        return
+
+    for raw_tag, element in iterate_top_level_elements(source, backend):
+        if raw_tag == "images":
+            yield raw_tag, parse_images(element)
+        elif raw_tag in MBF_OBJECT_PARSERS:
+            yield raw_tag, MBF_OBJECT_PARSERS[raw_tag](element, lazy_properties=lazy_properties)
+        elif raw_tag in MBF_INTERNAL_DATA_SET_TAGS:
+            pass  # Do nothing.
+        else:
+            print('Unhandled tag: ', raw_tag)
+
+
+def iterate_selection(parts, selection, backend=None, lazy_properties=False, object_filter=None):
+    """
+    Stream the parsed objects of selected parts of an MBF XML document, see mbfxml2ex.filters.select_elements.
+
+    :param parts: Binary file object holding the selected parts of the document.
+    :param selection: List of (raw tag, segments, keep) tuples of the selected parts.
+    :param backend: XML parser backend, see resolve_backend.
+    :param lazy_properties: Convert the values of generic properties when they are first used.
+    :param object_filter: MBFObjectFilter the relocated markers are checked against, or None.
+    :return: Generator of (raw tag, parsed object) tuples.
+    """
+    keep = [kept for raw_tag, _, kept in selection if raw_tag in MBF_OBJECT_PARSERS]
+    for position, (raw_tag, object_data) in enumerate(iterate_objects(parts, backend, lazy_properties)):
+        if position < len(keep):
+            if keep[position]:
+                yield raw_tag, object_data
+        elif object_filter is None or object_filter.accepts_object(raw_tag, object_data):
+            # Markers relocated out of trees and contours.
+            yield raw_tag, object_data
+
+
+def iterate_selected_objects(source, object_filter, backend=None, lazy_properties=False):
+    """
+    Stream the parsed objects of an MBF XML document that are selected by the filter.
+
+    For an uncompressed file the top level elements are scanned first, elements that are not selected
+    are never handed to the XML parser.  Other sources are parsed in full and then filtered.
+
+    :param source: File name, '-' for stdin, or file object of the MBF XML document.
+    :param object_filter: MBFObjectFilter selecting the objects.
+    :param backend: XML parser backend, see resolve_backend.
+    :param lazy_properties: Convert the values of generic properties when they are first used.
+    :return: Generator of (raw tag, parsed object) tuples.
+    """
+    selection = None
+    if is_file_name(source):
+        try:
+            index, selection = index_file(source, functools.partial(select_elements, object_filter=object_filter))
+        except MBFXMLFormat:
+            pass
+
+    if selection is None:
+        for raw_tag, object_data in iterate_objects(source, backend, lazy_properties):
+            if object_filter.accepts_object(raw_tag, object_data):
+                yield raw_tag, object_data
+        return
+
+    with open(source, 'rb') as f:
+        segments = [index.prolog(), *(segment for _, element_segments, _ in selection for segment in element_segments),
+                    index.end_tag()]
+        parts = io.BufferedReader(MBFSegmentReader(f, segments))
+        yield from iterate_selection(parts, selection, backend, lazy_properties, object_filter)
+
+
+def add_object(data, raw_tag, object_data):
+    if raw_tag == "tree":
+        data.add_tree(object_data)
+    elif raw_tag == "contour":
+        data.add_contour(object_data)
+    elif raw_tag == "marker":
+        data.add_marker(object_data)
+    elif raw_tag == "images":
+        data.set_images(object_data)
+    elif raw_tag == "vessel":
+        data.add_vessel(object_data)
+
+
+def _remove_children(parents):
+    # Rebuild each parent once, removing children one at a time is quadratic.
+    for parent, child_ids in parents.values():
+        parent[:] = [child for child in parent if id(child) not in child_ids]
+
+
+def _is_marker_tag(tag):
+    return tag == "marker" or tag.endswith("}marker")
@@ -0,0 +1,334 @@
+import xml.etree.ElementTree as ElTree
+from xml.parsers import expat
+
+from mbfxml2ex.classes import MBFTree, MBFPointStore
+from mbfxml2ex.definitions import MBF_INTERNAL_DATA_SET_TAGS
+from mbfxml2ex.exceptions import MBFXMLException, MBFXMLFormat
+from mbfxml2ex.parsers import parse_images, _parse_property, _new_tree_structure, _new_contour, _new_marker, \
+    _new_vessel, _new_node, _new_edge, _new_edgelist, _add_point, _close_point_run, _raise_missing_node_point
+from mbfxml2ex.sources import open_source
+
+READ_CHUNK_SIZE = 1 << 20
+
+
+class _Frame(object):
+    """
+    An open element that is being built directly into MBF data.
+    """
+    __slots__ = ('kind', 'value', 'store', 'data', 'relocate')
+
+    def __init__(self, kind, value=None, store=None, data=None, relocate=False):
+        self.kind = kind
+        self.value = value
+        self.store = store
+        self.data = data
+        self.relocate = relocate
+
+
+class MBFSaxHandler(object):
+    """
+    Expat handler that builds MBF objects from parser events without creating elements for them.
+
+    Points, branches, nodes and edges go straight into the MBF data structures, only the small
+    property, resolution and images elements are built as elements and passed to the functions
+    in mbfxml2ex.parsers.  The same structural checks as mbfxml2ex.parsers are applied.
+
+    With an error_handler the handler validates instead: an error is passed to the handler with
+    the line number it was found on, the element in error is skipped and parsing carries on.
+    The values of points are checked and then dropped and nested markers are not kept.
+    """
+
+    def __init__(self, parser, lazy_properties=False, error_handler=None):
+        self._parser = parser
+        self._lazy_properties = lazy_properties
+        self._error_handler = error_handler
+        self._new_point_store = MBFPointStore if error_handler is None else _PointCounter
+        self._frames = []
+        self._skip_depth = 0
+        self._builder = None
+        self._builder_depth = 0
+        self._builder_callback = None
+        self._builder_line = 0
+        self._objects = []
+        self._relocated_markers = []
+
+        parser.StartElementHandler = self._start if error_handler is None else self._checked_start
+        parser.EndElementHandler = self._end if error_handler is None else self._checked_end
+        parser.buffer_text = True
+
+    def pop_objects(self):
+        """
+        Return the top level objects completed since the last call.
+        """
+        objects = self._objects
+        self._objects = []
+        return objects
+
+    def relocated_markers(self):
+        return self._relocated_markers
+
+    def _checked_start(self, name, attributes):
+        try:
+            self._start(name, attributes)
+        except VALIDATION_ERRORS as e:
+            self._error_handler(self._parser.CurrentLineNumber, e)
+            # Nothing was opened for the element in error, skip it.
+            self._skip_depth = 1
+
+    def _checked_end(self, name):
+        # Errors in a captured element are reported at its start.
+        captured = self._builder is not None and self._builder_depth == 1
+        line = self._builder_line if captured else self._parser.CurrentLineNumber
+        try:
+            self._end(name)
+        except VALIDATION_ERRORS as e:
+            self._error_handler(line, e)
+
+    def _start(self, name, attributes):
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+
+        raw_tag = name.rpartition(':')[2]
+        if self._builder is not None:
+            self._builder_depth += 1
+            self._builder.start(raw_tag, attributes)
+            return
+
+        if not self._frames:
+            self._frames.append(_Frame('root'))
+            return
+
+        frame = self._frames[-1]
+        kind = frame.kind
+        if raw_tag == "point" and kind in _POINT_CONTAINERS:
+            index = _add_point(frame.store, attributes)
+            if kind == 'node':
+                frame.data = frame.store.point(index)
+            elif frame.data is None:
+                # Start of a run of points in a tree or the first point of an edge.
+                frame.data = index
+            # Anything inside a point is ignored.
+            self._skip_depth = 1
+        elif kind == 'tree' or kind == 'branch':
+            if raw_tag == "branch":
+                frame.data = _close_point_run(frame.value, frame.data, frame.store)
+                branch = _new_tree_structure(attributes)
+                frame.value['points'].append(branch)
+                self._frames.append(_Frame('branch', branch, frame.store))
+            elif raw_tag == "property":
+                appender = _tree_property_appender(frame.value['properties'], self._lazy_properties)
+                self._capture(raw_tag, attributes, appender)
+            elif raw_tag == "marker":
+                self._frames.append(_Frame('marker', _new_marker(attributes), self._new_point_store(), relocate=True))
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'root':
+            self._start_top_level(raw_tag, attributes)
+        elif kind == 'contour':
+            contour = frame.value
+            if raw_tag == "property":
+                self._capture(raw_tag, attributes, _property_appender(contour['properties'], self._lazy_properties))
+            elif raw_tag == "resolution":
+                self._capture(raw_tag, attributes, _resolution_setter(contour))
+            elif raw_tag == "marker":
+                self._frames.append(_Frame('marker', _new_marker(attributes), self._new_point_store(), relocate=True))
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'marker':
+            if raw_tag == "property":
+                self._capture(raw_tag, attributes, _property_appender(frame.value['properties'], self._lazy_properties))
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'vessel':
+            self._start_vessel_child(frame.value, raw_tag, attributes)
+        elif kind == 'nodes':
+            if raw_tag == "node":
+                self._frames.append(_Frame('node', _new_node(attributes), frame.store))
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'node':
+            raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'edges':
+            if raw_tag == "edge":
+                self._frames.append(_Frame('edge', _new_edge(attributes), frame.store))
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+        elif kind == 'edge':
+            if raw_tag == "property":
+                self._capture(raw_tag, attributes, _property_appender(frame.value['properties'], self._lazy_properties))
+            else:
+                raise MBFXMLException("XML format violation unknown tag {0}".format(raw_tag))
+        elif kind == 'edgelists':
+            if raw_tag == "edgelist":
+                frame.value.append(_new_edgelist(attributes))
+                self._skip_depth = 1
+            else:
+                raise MBFXMLException("XML format violation unknown tag '{0}'.".format(raw_tag))
+
+    def _start_top_level(self, raw_tag, attributes):
+        if raw_tag == "tree":
+            self._frames.append(_Frame('tree', _new_tree_structure(attributes), self._new_point_store()))
+        elif raw_tag == "contour":
+            self._frames.append(_Frame('contour', _new_contour(attributes), self._new_point_store()))
+        elif raw_tag == "marker":
+            self._frames.append(_Frame('marker', _new_marker(attributes), self._new_point_store()))
+        elif raw_tag == "vessel":
+            self._frames.append(_Frame('vessel', _new_vessel(attributes), self._new_point_store()))
+        elif raw_tag == "images":
+            self._capture(raw_tag, attributes, self._images_callback)
+        else:
+            if raw_tag not in MBF_INTERNAL_DATA_SET_TAGS:
+                print('Unhandled tag: ', raw_tag)
+            self._skip_depth = 1
+
+    def _start_vessel_child(self, vessel, raw_tag, attributes):
+        if raw_tag == "nodes":
+            vessel['nodes'] = []
+            self._frames.append(_Frame('nodes', vessel['nodes'], self._frames[-1].store))
+        elif raw_tag == "edges":
+            vessel['edges'] = []
+            self._frames.append(_Frame('edges', vessel['edges'], self._frames[-1].store))
+        elif raw_tag == "edgelists":
+            vessel['edgelists'] = []
+            self._frames.append(_Frame('edgelists', vessel['edgelists']))
+        elif raw_tag == "property":
+            self._capture(raw_tag, attributes, _property_appender(vessel['properties'], self._lazy_properties))
+        else:
+            print(f"Unhandled tag in vessel: '{raw_tag}'")
+            self._skip_depth = 1
+
+    def _end(self, name):
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+
+        if self._builder is not None:
+            self._builder.end(name.rpartition(':')[2])
+            self._builder_depth -= 1
+            if self._builder_depth == 0:
+                element = self._builder.close()
+                callback = self._builder_callback
+                self._builder = None
+                self._builder_callback = None
+                self._parser.CharacterDataHandler = None
+                callback(element)
+            return
+
+        frame = self._frames.pop()
+        kind = frame.kind
+        if kind == 'tree':
+            _close_point_run(frame.value, frame.data, frame.store)
+            self._objects.append(("tree", MBFTree(frame.value, frame.store)))
+        elif kind == 'branch':
+            _close_point_run(frame.value, frame.data, frame.store)
+        elif kind == 'contour':
+            frame.value['data'] = frame.store.points()
+            self._objects.append(("contour", frame.value))
+        elif kind == 'marker':
+            frame.value['data'] = frame.store.points()
+            if frame.relocate:
+                if self._error_handler is None:
+                    self._relocated_markers.append(frame.value)
+            else:
+                self._objects.append(("marker", frame.value))
+        elif kind == 'vessel':
+            self._objects.append(("vessel", frame.value))
+        elif kind == 'node':
+            node = frame.value
+            if frame.data is None:
+                _raise_missing_node_point(node)
+            node['data'] = frame.data
+            self._frames[-1].value.append(node)
+        elif kind == 'edge':
+            frame.value['data'] = frame.store.points(len(frame.store) if frame.data is None else frame.data)
+            self._frames[-1].value.append(frame.value)
+
+    def _images_callback(self, images_root):
+        self._objects.append(("images", parse_images(images_root)))
+
+    def _capture(self, raw_tag, attributes, callback):
+        self._builder = ElTree.TreeBuilder()
+        self._builder_depth = 1
+        self._builder_callback = callback
+        self._builder_line = self._parser.CurrentLineNumber
+        self._builder.start(raw_tag, attributes)
+        self._parser.CharacterDataHandler = self._builder.data
+
+
+_POINT_CONTAINERS = {'tree', 'branch', 'contour', 'marker', 'node', 'edge'}
+
+# Errors raised by the structural checks and by missing or malformed attribute and text values.
+VALIDATION_ERRORS = (MBFXMLException, KeyError, ValueError, IndexError, TypeError)
+
+
+class _PointCounter(object):
+    """
+    Stands in for an MBFPointStore when validating, points are counted and their values dropped.
+    """
+    __slots__ = ('_count',)
+
+    def __init__(self):
+        self._count = 0
+
+    def add(self, x, y, z, diameter=0.0):
+        index = self._count
+        self._count += 1
+        return index
+
+    def point(self, index):
+        return index
+
+    def points(self, start=0):
+        return []
+
+    def __len__(self):
+        return self._count
+
+
+def _tree_property_appender(properties, lazy_properties):
+    def _append(property_root):
+        prop = _parse_property(property_root, lazy_properties)
+        properties.append((prop.name(), prop))
+
+    return _append
+
+
+def _property_appender(properties, lazy_properties):
+    def _append(property_root):
+        properties.append(_parse_property(property_root, lazy_properties))
+
+    return _append
+
+
+def _resolution_setter(contour):
+    def _set(resolution_root):
+        contour['resolution'] = float(resolution_root.text)
+
+    return _set
+
+
+def iterate_objects(source, lazy_properties=False):
+    """
+    Stream the parsed objects of an MBF XML document with the expat backend.
+
+    :param source: File name, '-' for stdin, or binary file object of the MBF XML document,
+        see mbfxml2ex.sources.open_source.
+    :param lazy_properties: Convert the values of generic properties when they are first used.
+    :return: Generator of (raw tag, parsed object) tuples.
+    """
+    parser = expat.ParserCreate()
+    handler = MBFSaxHandler(parser, lazy_properties)
+    with open_source(source) as stream:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            try:
+                parser.Parse(chunk, not chunk)
+            except expat.ExpatError as e:
+                raise MBFXMLFormat(str(e)) from None
+            yield from handler.pop_objects()
+            if not chunk:
+                break
+
+    for marker in handler.relocated_markers():
+        yield "marker", marker
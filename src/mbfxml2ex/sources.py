@@ -0,0 +1,131 @@
+import bz2
+import contextlib
+import gzip
+import io
+import lzma
+import os
+import sys
+
+STDIN_SOURCE = "-"
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+_COMPRESSION_MAGIC = [("gzip", b"\x1f\x8b"), ("bz2", b"BZh"), ("xz", b"\xfd7zXZ\x00")]
+_MAGIC_SIZE = max(len(magic) for _, magic in _COMPRESSION_MAGIC)
+
+
+def detect_compression(head):
+    """
+    Return the compression of a stream from its first bytes.
+
+    :param head: The first bytes of the stream, at least six bytes unless the stream is shorter.
+    :return: One of 'gzip', 'bz2' and 'xz', or None for an uncompressed stream.
+    """
+    for compression, magic in _COMPRESSION_MAGIC:
+        if head[:len(magic)] == magic:
+            return compression
+
+    return None
+
+
+def is_file_name(source):
+    """
+    Return whether the source names a file, as opposed to stdin or a file object.
+    """
+    return isinstance(source, (str, os.PathLike)) and source != STDIN_SOURCE
+
+
+def strip_compression_suffix(file_name):
+    """
+    Return the file name without a compression suffix, 'tracing.xml.gz' gives 'tracing.xml'.
+    """
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+
+    return file_name
+
+
+class _PrefixedReader(io.RawIOBase):
+    """
+    Reads bytes already taken from a stream followed by the rest of the stream.
+    """
+
+    def __init__(self, prefix, stream):
+        super(_PrefixedReader, self).__init__()
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            chunk = self._prefix[:len(buffer)]
+            self._prefix = self._prefix[len(chunk):]
+        else:
+            chunk = self._stream.read(len(buffer))
+
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def _peek(stream):
+    # Look at the first bytes without losing them, wrapping streams that can neither peek nor seek.
+    if hasattr(stream, "peek"):
+        return stream, stream.peek(_MAGIC_SIZE)[:_MAGIC_SIZE]
+
+    seekable = getattr(stream, "seekable", None)
+    if seekable is not None and seekable():
+        position = stream.tell()
+        head = stream.read(_MAGIC_SIZE)
+        stream.seek(position)
+        return stream, head
+
+    head = stream.read(_MAGIC_SIZE)
+    return io.BufferedReader(_PrefixedReader(head, stream)), head
+
+
+def _decompressed(compression, stream):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    elif compression == "bz2":
+        return bz2.BZ2File(stream)
+
+    return lzma.LZMAFile(stream)
+
+
+@contextlib.contextmanager
+def open_source(source):
+    """
+    Open an MBF XML source for reading, decompressing gzip, bz2 and xz streams as they are read.
+
+    The compression is detected from the first bytes of the stream, not the file name.
+    A file named by the source is closed on exit, stdin and file objects are left open.
+
+    :param source: File name, STDIN_SOURCE for stdin, or a binary file object.
+    :return: Context manager giving a binary file object of the uncompressed document.
+    """
+    owned = is_file_name(source)
+    if owned:
+        stream = open(source, "rb")
+    elif source == STDIN_SOURCE:
+        stream = sys.stdin.buffer
+    else:
+        stream = source
+
+    try:
+        if isinstance(stream, io.TextIOBase):
+            yield stream
+            return
+
+        readable, head = _peek(stream)
+        compression = detect_compression(head)
+        if compression is None:
+            yield readable
+        else:
+            with _decompressed(compression, readable) as decompressed:
+                yield decompressed
+    finally:
+        if owned:
+            stream.close()
@@ -0,0 +1,295 @@
+from collections import Counter
+
+import numpy as np
+
+from mbfxml2ex.classes import MBFPropertyVolumeRLE, MBFPointSequence, object_values
+from mbfxml2ex.reader import iterate_objects
+
+SUMMARY_KINDS = ["trees", "contours", "markers", "vessels"]
+
+# Coordinates of small objects are gathered and reduced together, at most this many rows at a time.
+_BOUNDS_BATCH_SIZE = 1 << 16
+
+
+class _Bounds(object):
+    """
+    Running axis aligned bounding box of batches of coordinates.
+    """
+
+    def __init__(self):
+        self._minimum = None
+        self._maximum = None
+        self._pending = []
+        self._pending_size = 0
+
+    def add(self, coordinates):
+        if len(coordinates):
+            self._pending.append(coordinates)
+            self._pending_size += len(coordinates)
+            if self._pending_size >= _BOUNDS_BATCH_SIZE:
+                self._reduce()
+
+    def _reduce(self):
+        if not self._pending:
+            return
+
+        coordinates = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending = []
+        self._pending_size = 0
+        minimum = coordinates.min(axis=0)
+        maximum = coordinates.max(axis=0)
+        if self._minimum is None:
+            self._minimum, self._maximum = minimum, maximum
+        else:
+            self._minimum = np.minimum(self._minimum, minimum)
+            self._maximum = np.maximum(self._maximum, maximum)
+
+    def merge(self, other):
+        other._reduce()
+        if other._minimum is not None:
+            self.add(np.stack([other._minimum, other._maximum]))
+
+    def result(self):
+        self._reduce()
+        if self._minimum is None:
+            return None
+
+        return {"min": self._minimum.tolist(), "max": self._maximum.tolist()}
+
+
+def _polyline_length(coordinates):
+    if len(coordinates) < 2:
+        return 0.0
+
+    return float(np.linalg.norm(np.diff(coordinates, axis=0), axis=1).sum())
+
+
+def _tree_links(structure, starts, links, points, previous=None):
+    # Follows mbfxml2ex.zinc.determine_flat_tree_connectivity, the first point of a branch
+    # joins the point before the branch and the point after a branch joins the same point.
+    # Trees built in code may hold points instead of ranges of their point store, they are numbered in order.
+    branches = 0
+    for item in structure['points']:
+        if type(item) is dict:
+            branches += 1 + _tree_links(item, starts, links, points, previous)
+            continue
+
+        if type(item) is not range:
+            points.append(item.coordinates())
+            item = range(len(points) - 1, len(points))
+        if len(item):
+            starts.append(item.start)
+            if previous is not None:
+                links.append((previous, item.start))
+            previous = item.stop - 1
+
+    return branches
+
+
+def _vessel_point_store(nodes, edges):
+    # The point store of the nodes and edges of a parsed vessel, or None when they do not share one.
+    if not nodes and not edges:
+        return None
+
+    if not all(type(edge['data']) is MBFPointSequence for edge in edges):
+        return None
+
+    store = edges[0]['data'].store() if edges else nodes[0]['data'].store()
+    if all(edge['data'].store() is store for edge in edges) and all(node['data'].store() is store for node in nodes):
+        return store
+
+    return None
+
+
+class MBFSummary(object):
+    """
+    Catalog metrics of a stream of parsed MBF objects.
+
+    Objects are added one at a time and only their metrics are kept, the coordinates of every
+    object are reduced with NumPy over the arrays of its point store.  Lengths are the lengths
+    of the line segments written for trees, contours and vessel edges.  Coordinates are the
+    coordinates in the file, the scaling of images is not applied, as for read_xml.
+    """
+
+    def __init__(self):
+        self._counts = dict.fromkeys(SUMMARY_KINDS, 0)
+        self._points = dict.fromkeys(SUMMARY_KINDS, 0)
+        self._lengths = {"trees": 0.0, "contours": 0.0, "vessels": 0.0}
+        self._bounds = {kind: _Bounds() for kind in SUMMARY_KINDS}
+        self._tree_types = Counter()
+        self._tree_classes = Counter()
+        self._names = {"contours": Counter(), "markers": Counter(), "vessels": Counter()}
+        self._trees = []
+        self._puncta = {"count": 0, "foreground_voxels": 0, "volume_voxels": 0}
+
+    def add(self, raw_tag, object_data):
+        """
+        Add a parsed object, as given by mbfxml2ex.reader.iterate_objects, to the summary.
+        Objects other than trees, contours, markers and vessels are ignored.
+        """
+        if raw_tag == "tree":
+            self._add_tree(object_data)
+        elif raw_tag == "contour":
+            self._add_contour(object_data)
+        elif raw_tag == "marker":
+            self._add_marker(object_data)
+        elif raw_tag == "vessel":
+            self._add_vessel(object_data)
+
+    def _add_tree(self, tree):
+        attributes = tree.attributes()
+        starts = []
+        links = []
+        points = []
+        branches = _tree_links(tree.structure(), starts, links, points)
+        store = tree.point_store()
+        coordinates = store.coordinates() if store is not None else np.array(points, dtype=np.float64).reshape(-1, 3)
+
+        length = 0.0
+        if len(coordinates) > 1:
+            # Consecutive points of the store are joined except where a run of points starts.
+            joined = np.ones(len(coordinates) - 1, dtype=bool)
+            run_starts = np.array(starts, dtype=np.intp)
+            joined[run_starts[run_starts > 0] - 1] = False
+            segments = np.linalg.norm(np.diff(coordinates, axis=0), axis=1)
+            length = float(segments[joined].sum())
+            if links:
+                ends = np.array(links, dtype=np.intp)
+                length += float(np.linalg.norm(coordinates[ends[:, 1]] - coordinates[ends[:, 0]], axis=1).sum())
+
+        self._counts["trees"] += 1
+        self._points["trees"] += len(coordinates)
+        self._lengths["trees"] += length
+        self._bounds["trees"].add(coordinates)
+        self._tree_types[attributes.get('type')] += 1
+        if 'class' in attributes:
+            self._tree_classes[attributes['class']] += 1
+        self._trees.append({"type": attributes.get('type'), "class": attributes.get('class'),
+                            "branches": branches, "points": len(coordinates), "length": length})
+
+    def _add_contour(self, contour):
+        coordinates = object_values(contour['data'])[:, :3]
+        length = _polyline_length(coordinates)
+        if contour['closed'] and len(coordinates) > 1:
+            length += float(np.linalg.norm(coordinates[-1] - coordinates[0]))
+
+        self._counts["contours"] += 1
+        self._points["contours"] += len(coordinates)
+        self._lengths["contours"] += length
+        self._bounds["contours"].add(coordinates)
+        self._names["contours"][contour['name']] += 1
+
+    def _add_marker(self, marker):
+        coordinates = object_values(marker['data'])[:, :3]
+        self._counts["markers"] += 1
+        self._points["markers"] += len(coordinates)
+        self._bounds["markers"].add(coordinates)
+        self._names["markers"][marker['name']] += 1
+        if marker['name'] == "Punctum":
+            self._puncta["count"] += 1
+            for property_ in marker['properties']:
+                if type(property_) is MBFPropertyVolumeRLE:
+                    voxel_counts = property_.voxel_counts()
+                    self._puncta["foreground_voxels"] += property_.foreground_voxels_total()
+                    self._puncta["volume_voxels"] += int(voxel_counts[0] * voxel_counts[1] * voxel_counts[2])
+
+    def _add_vessel(self, vessel):
+        nodes = vessel.get('nodes', [])
+        edges = vessel.get('edges', [])
+        store = _vessel_point_store(nodes, edges)
+        if store is None:
+            # Vessels built in code hold lists of points, each edge is a line of its own points.
+            edge_coordinates = [object_values(edge['data'])[:, :3] for edge in edges]
+            node_coordinates = object_values([node['data'] for node in nodes])[:, :3]
+            coordinates = np.concatenate([node_coordinates, *edge_coordinates])
+            length = float(sum(_polyline_length(points) for points in edge_coordinates))
+        else:
+            coordinates = store.coordinates()
+            length = 0.0
+            if edges and len(coordinates) > 1:
+                # Edges are consecutive runs of points in the store, segments between two edges are not joined.
+                joined = np.zeros(len(coordinates) - 1, dtype=bool)
+                for edge in edges:
+                    run = edge['data'].range()
+                    joined[run.start:run.stop - 1] = True
+                segments = np.linalg.norm(np.diff(coordinates, axis=0), axis=1)
+                length = float(segments[joined].sum())
+
+        self._counts["vessels"] += 1
+        self._points["vessels"] += len(coordinates)
+        self._lengths["vessels"] += length
+        self._bounds["vessels"].add(coordinates)
+        self._names["vessels"][vessel['name']] += 1
+
+    def result(self):
+        """
+        Return the summary as a dict of JSON compatible values.
+
+        Bounding boxes are dicts of 'min' and 'max' coordinates, or None when there are no points.
+        """
+        summary = {}
+        total_bounds = _Bounds()
+        for kind in SUMMARY_KINDS:
+            summary[kind] = {"count": self._counts[kind], "points": self._points[kind]}
+            if kind in self._lengths:
+                summary[kind]["length"] = self._lengths[kind]
+            summary[kind]["bounding_box"] = self._bounds[kind].result()
+            total_bounds.merge(self._bounds[kind])
+
+        summary["trees"]["branches"] = sum(tree["branches"] for tree in self._trees)
+        summary["trees"]["by_type"] = _as_dict(self._tree_types)
+        summary["trees"]["by_class"] = _as_dict(self._tree_classes)
+        summary["trees"]["per_tree"] = self._trees
+        for kind, names in self._names.items():
+            summary[kind]["by_name"] = _as_dict(names)
+        summary["markers"]["puncta"] = dict(self._puncta)
+
+        summary["points"] = sum(self._points.values())
+        summary["length"] = sum(self._lengths.values())
+        summary["bounding_box"] = total_bounds.result()
+        return summary
+
+
+def _as_dict(counter):
+    # Objects without the attribute are counted under null, which JSON needs as a string key.
+    return {str(key) if key is None else key: count for key, count in counter.items()}
+
+
+def summarize_objects(objects):
+    """
+    Summarize parsed MBF objects, see MBFSummary.
+
+    :param objects: Iterable of (raw tag, parsed object) tuples.
+    :return: Dict of the summary, see MBFSummary.result.
+    """
+    summary = MBFSummary()
+    for raw_tag, object_data in objects:
+        summary.add(raw_tag, object_data)
+
+    return summary.result()
+
+
+def summarize_data(data):
+    """
+    Summarize the objects of an MBFData, see MBFSummary.
+    """
+    return summarize_objects([*(("tree", tree) for tree in data.get_trees()),
+                              *(("contour", contour) for contour in data.get_contours()),
+                              *(("marker", marker) for marker in data.get_markers()),
+                              *(("vessel", vessel) for vessel in data.get_vessels())])
+
+
+def summarize(source, backend="expat", object_filter=None):
+    """
+    Summarize an MBF XML document while it is read, see MBFSummary.
+
+    Objects are summarized as they are parsed and then dropped, no MBFData is built and Zinc
+    is not imported.  The expat backend streams the document, so memory does not grow with its
+    size.  Generic properties are not converted, they are not part of the summary.
+
+    :param source: File name, '-' for stdin, or binary file object, see mbfxml2ex.sources.open_source.
+    :param backend: XML parser backend, see mbfxml2ex.reader.resolve_backend.
+    :param object_filter: MBFObjectFilter selecting the objects to summarize, or None.
+    :return: Dict of the summary, see MBFSummary.result.
+    """
+    return summarize_objects(iterate_objects(source, backend, lazy_properties=True, object_filter=object_filter))
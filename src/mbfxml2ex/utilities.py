@@ -63,23 +63,6 @@ def reverse_element_to_node_map(element_to_node_map):
     return node_to_element_map
 
 
-def get_minimal_list_paths(node_map):
-    """
-    Extracts the first unique path to each embedded list in a nested structure.
-    A list is identified by its parent path (i.e., path excluding the last index).
-    """
-    unique_paths = []
-    seen_paths = set()
-
-    for path, node_id in node_map.items():
-        parent_path = tuple(path[:-1])  # Identify the list this node belongs to
-        if parent_path not in seen_paths:
-            unique_paths.append(path)
-            seen_paths.add(parent_path)
-
-    return unique_paths
-
-
 def get_elements_for_node_ids(node_ids, node_to_element_map, element_to_node_map):
     """
     Given a list of node ids, node_to_element_map, and element_to_node_map, return all
@@ -94,40 +77,10 @@ def get_elements_for_node_ids(node_ids, node_to_element_map, element_to_node_map
     - List of element_ids that are connected to nodes from the node id list
     """
     # Find all elements that use only these nodes
+    node_id_set = set(node_ids)
     elements = set()
-    for node_id in node_ids:
-        mapped_elements = node_to_element_map[node_id]
-        v = [element_id for element_id in mapped_elements if set(element_to_node_map[element_id]) <= set(node_ids)]
-        elements.update(set(v))
-
-    return list(elements)
-
-
-def get_elements_for_path_old(node_map, element_to_node_map, target_path):
-    """
-    Given a node_map and element_to_node_map, return all elements associated with
-    nodes that share the same parent path as the given target_path.
-
-    Parameters:
-    - node_map: dict mapping node_id -> path (list of indices)
-    - element_to_node_map: dict mapping element_id -> list of node_ids
-    - target_path: list representing the path to a node in the embedded structure
-
-    Returns:
-    - List of element_ids that are connected to nodes from the same embedded list
-    """
-    parent_path = tuple(target_path[:-1])
-
-    # Find all node_ids that share the same parent path
-    relevant_nodes = [
-        node_id for node_id, path in node_map.items()
-        if tuple(path[:-1]) == parent_path
-    ]
-
-    # Find all elements that use any of these nodes
-    elements = set()
-    for element_id, node_ids in element_to_node_map.items():
-        if any(node in relevant_nodes for node in node_ids):
-            elements.add(element_id)
+    for node_id in node_id_set:
+        elements.update(element_id for element_id in node_to_element_map[node_id]
+                        if node_id_set.issuperset(element_to_node_map[element_id]))
 
     return list(elements)
@@ -0,0 +1,69 @@
+from xml.parsers import expat
+
+from mbfxml2ex.exceptions import MBFXMLException
+from mbfxml2ex.sax import MBFSaxHandler, READ_CHUNK_SIZE
+from mbfxml2ex.sources import open_source
+
+
+class MBFValidationError(object):
+    """
+    An error found while validating an MBF XML document.
+    """
+    __slots__ = ('_line', '_message')
+
+    def __init__(self, line, message):
+        self._line = line
+        self._message = message
+
+    def line(self):
+        return self._line
+
+    def message(self):
+        return self._message
+
+    def __repr__(self):
+        return f"line {self._line}: {self._message}"
+
+
+def _error_message(error):
+    if isinstance(error, MBFXMLException):
+        return str(error)
+    elif isinstance(error, KeyError):
+        return f"Missing attribute {error.args[0]!r}."
+
+    return f"Invalid value, {error}."
+
+
+def validate(source):
+    """
+    Check an MBF XML document against the structural checks applied when it is read.
+
+    The document is streamed through the expat backend, every error is reported with the line
+    it was found on and reading carries on after the element in error.  No geometry is built,
+    the values of points are checked and dropped, and Zinc is not imported.  A document that is
+    not well-formed XML is reported up to the point where it stops being well-formed.
+
+    :param source: File name, '-' for stdin, or binary file object, see mbfxml2ex.sources.open_source.
+    :return: List of MBFValidationError, empty for a valid document.
+    """
+    errors = []
+
+    def _report(line, error):
+        errors.append(MBFValidationError(line, _error_message(error)))
+
+    parser = expat.ParserCreate()
+    handler = MBFSaxHandler(parser, error_handler=_report)
+    with open_source(source) as stream:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            try:
+                parser.Parse(chunk, not chunk)
+            except expat.ExpatError as e:
+                errors.append(MBFValidationError(e.lineno, f"XML format violation {expat.ErrorString(e.code)}."))
+                break
+            # Completed objects are not needed, only the errors found in them.
+            handler.pop_objects()
+            if not chunk:
+                break
+
+    return errors
@@ -1,3 +1,5 @@
+import numpy as np
+
 from cmlibs.utils.zinc.finiteelement import create_cube_element
 from cmlibs.zinc.context import Context
 from cmlibs.zinc.element import Element
@@ -5,15 +7,24 @@ from cmlibs.zinc.element import Elementbasis
 from cmlibs.zinc.field import FieldGroup
 
 from cmlibs.utils.zinc.field import create_field_finite_element, create_field_coordinates, find_or_create_field_group
-from cmlibs.utils.zinc.general import create_node as create_zinc_node
 from cmlibs.utils.zinc.general import ChangeManager
 
-from mbfxml2ex.classes import MBFPropertyTraceAssociation, MBFPropertyVolumeRLE, MBFPropertyPunctum, MBFPropertySet, get_text_properties, MBFPropertyGeneric, MBFProperty
+from mbfxml2ex.classes import MBFTree, point_values, object_values, MBFPropertyTraceAssociation, MBFPropertyVolumeRLE, MBFPropertyPunctum, MBFPropertySet, get_text_properties, MBFPropertyGeneric, MBFProperty
 from mbfxml2ex.definitions import INFOSET_RANK_MAP
 from mbfxml2ex.exceptions import MissingImplementationException, MBFDataException
-from mbfxml2ex.utilities import extract_vessel_node_locations, get_minimal_list_paths, classify_properties, get_elements_for_node_ids, reverse_element_to_node_map
+from mbfxml2ex.utilities import is_option, extract_vessel_node_locations, classify_properties, get_elements_for_node_ids, reverse_element_to_node_map
 from mbfxml2ex.templates import field_header_3d_template, grid_field_3d_template, field_data_template
 
+# Changes to the region are cached for the whole load, or only in the functions creating nodes, elements and groups.
+LOAD_CHANGE_CACHE = "load"
+CALL_CHANGE_CACHE = "call"
+CHANGE_CACHES = [LOAD_CHANGE_CACHE, CALL_CHANGE_CACHE]
+
+# Fields constant over an object, such as rgb, are stored on every node of the object, or once on a node of the object.
+NODE_CONSTANT_FIELDS = "node"
+OBJECT_CONSTANT_FIELDS = "object"
+CONSTANT_FIELDS = [NODE_CONSTANT_FIELDS, OBJECT_CONSTANT_FIELDS]
+
 
 def write_ex(file_name, data, options=None):
     context = Context("Neurolucida")
@@ -25,26 +36,45 @@ def write_ex(file_name, data, options=None):
 
 
 def determine_tree_connectivity_with_map(tree, node_map, path=None, parent_path=None):
-    if path is None:
-        path = []
-    connectivity = []
-
-    previous_path = parent_path
-
-    for i, pt in enumerate(tree):
-        current_path = path + [i]
-        if isinstance(pt, list):
-            # Recurse into branch
-            child_connectivity = determine_tree_connectivity_with_map(pt, node_map, current_path, previous_path)
-            connectivity.extend(child_connectivity)
-        else:
-            current_node_id = node_map[tuple(current_path)]
-            if previous_path is not None:
-                previous_node_id = node_map[tuple(previous_path)]
-                connectivity.append([previous_node_id, current_node_id])
-            previous_path = current_path
-
-    return connectivity
+    """
+    Determine the connectivity of the nested point lists of a tree, see determine_flat_tree_connectivity.
+
+    :param tree: Nested lists of the points of the tree.
+    :param node_map: Dict of the path of each point of the tree to its node identifier, see create_nodes.
+    :param path: Path of the tree in node_map. [defaults to the empty path.]
+    :param parent_path: Path in node_map of the point the tree joins, or None.
+    :return: List of the [parent node identifier, node identifier] of every point with a parent, in point order.
+    """
+    paths = []
+    _flatten_points(tree, tuple(path) if path else (), paths, [])
+    flat_tree = MBFTree(_list_structure(tree)).flat()
+    point_node_ids = [node_map[point_path] for point_path in paths]
+    if parent_path is None:
+        return determine_flat_tree_connectivity(flat_tree, point_node_ids)
+
+    # Points without a parent in the tree join the point at parent_path.
+    parent_node_id = node_map[tuple(parent_path)]
+    return [[point_node_ids[parent] if parent >= 0 else parent_node_id, node_id]
+            for parent, node_id in zip(flat_tree.parents().tolist(), point_node_ids)]
+
+
+def _list_structure(embedded_lists):
+    return {'points': [_list_structure(pt) if isinstance(pt, list) else pt for pt in embedded_lists],
+            'attributes': {}, 'properties': []}
+
+
+def determine_flat_tree_connectivity(flat_tree, point_node_ids):
+    """
+    Determine the connectivity of a flat tree, the first point of a branch joins the point before the branch.
+
+    :param flat_tree: MBFFlatTree.
+    :param point_node_ids: Node identifier of each point of the flat tree.
+    :return: List of the [parent node identifier, node identifier] of every point with a parent, in point order.
+    """
+    parents = flat_tree.parents()
+    children = np.flatnonzero(parents >= 0)
+    node_ids = np.asarray(point_node_ids, dtype=np.int64)
+    return np.stack([node_ids[parents[children]], node_ids[children]], axis=1).tolist()
 
 
 def determine_tree_connectivity(tree, current_node_id=0, parent_node_id=None):
@@ -120,58 +150,119 @@ def determine_vessel_connectivity(vessel, node_map):
 
 
 def load(region, data, options):
+    """
+    Load MBF data into a Zinc region.
+
+    By default the changes to the region are cached for the whole of the load and propagated once at its end.
+    Zinc counts nested beginChange/endChange calls, so the change caching of the functions used by the load
+    does nothing while the load holds it.  Set the 'change_cache' option to 'call' to cache changes only in
+    those functions, which propagates the changes of every object as it is created.
+
+    Coincident points of an object share a node.  Set the 'node_tolerance' option to an absolute distance to
+    also share a node between points closer than it, and set the 'share_nodes' option to True to share nodes
+    between the trees, contours and vessels of the load, for example where trees meet at the soma.
+    See MBFNodeDeduplicator.
+
+    The fields constant over a tree, contour or vessel, rgb and the resolution of contours, are stored on
+    every node of the object.  Set the 'constant_fields' option to 'object' to store them once for each
+    object with elements, see create_object_elements, their values are then only defined on the elements.
+
+    :param region: Zinc region to load the data into.
+    :param data: MBFData to load.
+    :param options: Dict of options or None.
+    """
+    change_cache = LOAD_CHANGE_CACHE
+    if is_option('change_cache', options):
+        change_cache = options['change_cache']
+    if change_cache not in CHANGE_CACHES:
+        raise ValueError(f"Unknown change cache '{change_cache}', expected one of {CHANGE_CACHES}.")
+
+    if change_cache == LOAD_CHANGE_CACHE:
+        with ChangeManager(region.getFieldmodule()):
+            _load(region, data, options)
+    else:
+        _load(region, data, options)
+
+
+def _load(region, data, options):
     punctum_data = []
     field_module = region.getFieldmodule()
+    node_tolerance = options['node_tolerance'] if is_option('node_tolerance', options) else 0.0
+    shared_nodes = None
+    if is_option('share_nodes', options) and options['share_nodes']:
+        shared_nodes = MBFNodeDeduplicator(node_tolerance)
+
+    def _node_deduplicator():
+        return MBFNodeDeduplicator(node_tolerance) if shared_nodes is None else shared_nodes
+
+    constant_fields = options['constant_fields'] if is_option('constant_fields', options) else NODE_CONSTANT_FIELDS
+    if constant_fields not in CONSTANT_FIELDS:
+        raise ValueError(f"Unknown constant fields '{constant_fields}', expected one of {CONSTANT_FIELDS}.")
+
+    def _node_field_information(field_information):
+        return field_information if constant_fields == NODE_CONSTANT_FIELDS else {}
+
+    def _create_object_elements(connectivity, node_identifiers, field_names, field_information):
+        if constant_fields == NODE_CONSTANT_FIELDS:
+            return create_elements(field_module, connectivity, field_names=field_names,
+                                   element_templates=element_templates)
+
+        return create_object_elements(field_module, connectivity, node_identifiers, field_names, field_information,
+                                      element_templates=element_templates)
+
     _coordinate_field = create_field_coordinates(field_module)
     _radius_field = create_field_finite_element(field_module, 'radius', 1, type_coordinate=False)
     _rgb_field = create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False)
+    element_templates = MBFElementTemplateCache(field_module)
+    group_builder = MBFGroupBuilder(field_module)
 
     for tree in data.get_trees():
-        tree_data = tree.points()
-        node_map = {}
-        node_identifiers = create_nodes(field_module, tree_data, node_map=node_map)
-        connectivity = determine_tree_connectivity_with_map(tree_data, node_map)
-
+        flat_tree = tree.flat()
         field_info = {'rgb': tree.rgb()}
-        merge_fields_with_nodes(field_module, node_identifiers, field_info)
-        element_ids = create_elements(field_module, connectivity, field_names=['coordinates', 'radius', 'rgb'])
+        point_node_ids = create_nodes_for_values(field_module, flat_tree.values(), _node_field_information(field_info),
+                                                 deduplicator=_node_deduplicator())
+        connectivity = determine_flat_tree_connectivity(flat_tree, point_node_ids)
+
+        element_ids = _create_object_elements(connectivity, set(point_node_ids), ['coordinates', 'radius', 'rgb'],
+                                              field_info)
 
         element_to_node_map = dict(zip(element_ids, connectivity))
         node_to_element_map = reverse_element_to_node_map(element_to_node_map)
 
-        unique_paths = get_minimal_list_paths(node_map)
-        grouped_by_parent = _group_by_parent(node_map)
+        branch_nodes = index_flat_tree_branches(flat_tree, point_node_ids)
 
-        sub_groups = _determine_sub_groups(grouped_by_parent, node_to_element_map, element_to_node_map, tree, unique_paths)
+        sub_groups = _determine_sub_groups(branch_nodes, node_to_element_map, element_to_node_map, tree)
 
         for name, members in sub_groups.items():
-            create_group_elements(field_module, name, members['el'])
-            create_group_nodes(field_module, name, members['no'])
+            group_builder.add_elements(name, members['el'])
+            group_builder.add_nodes(name, members['no'])
 
     for contour in data.get_contours():
         _resolution_field = contour.get('resolution')
         if _resolution_field is not None:
             _resolution_field = create_field_finite_element(field_module, 'resolution', 1, type_coordinate=False)
 
-        node_map = {}
-        node_identifiers = create_nodes(field_module, contour['data'], node_map=node_map)
-        connectivity = determine_contour_connectivity(node_map, contour['closed'])
-
         field_info = {'rgb': contour['rgb']}
         if _resolution_field is not None:
             field_info['resolution'] = contour['resolution']
 
-        merge_fields_with_nodes(field_module, node_identifiers, field_info)
-        element_ids = create_elements(field_module, connectivity, field_names=['coordinates', 'radius', 'rgb', 'resolution'])
-        create_group_elements(field_module, contour['name'], element_ids)
-        create_group_nodes(field_module, contour['name'], node_identifiers)
+        node_map = {}
+        node_identifiers = create_nodes_with_fields(field_module, contour['data'], _node_field_information(field_info),
+                                                    node_map=node_map, deduplicator=_node_deduplicator())
+        connectivity = determine_contour_connectivity(node_map, contour['closed'])
+
+        element_ids = _create_object_elements(connectivity, node_identifiers,
+                                              ['coordinates', 'radius', 'rgb', 'resolution'], field_info)
+        group_builder.add_elements(contour['name'], element_ids)
+        group_builder.add_nodes(contour['name'], node_identifiers)
 
         text_properties = get_text_properties(contour['properties'])
         for text_property in text_properties:
-            create_group_elements(field_module, text_property, element_ids)
-            create_group_nodes(field_module, text_property, node_identifiers)
+            group_builder.add_elements(text_property, element_ids)
+            group_builder.add_nodes(text_property, node_identifiers)
 
     marker_groups = {}
+    point_markers = []
     for marker in data.get_markers():
         if marker['name'] == "Punctum":
             volume_rle = None
@@ -217,40 +308,39 @@ def load(region, data, options):
             else:
                 raise MBFDataException("Missing at least some of the required data for outputting punctum.")
         else:
-            node_identifiers = create_nodes(field_module, marker['data'], node_set_name='datapoints')
-            field_info = {'rgb': marker['rgb']}
-            if 'name' in marker:
-                stored_string_field = field_module.createFieldStoredString()
-                stored_string_field.setManaged(True)
-                stored_string_field.setName('marker_name')
-                field_info['marker_name'] = marker['name']
-                if marker['name'] in marker_groups:
-                    marker_groups[marker['name']].extend(node_identifiers)
-                else:
-                    marker_groups[marker['name']] = node_identifiers
-            merge_fields_with_nodes(field_module, node_identifiers, field_info, node_set_name='datapoints')
-            create_group_nodes(field_module, 'marker', node_identifiers, node_set_name='datapoints')
+            point_markers.append(marker)
+
+    # Markers are data points, they do not share nodes with the other objects.
+    marker_node_identifiers = create_marker_nodes(field_module, point_markers, node_tolerance=node_tolerance)
+    for marker, node_identifiers in zip(point_markers, marker_node_identifiers):
+        if 'name' in marker:
+            marker_groups.setdefault(marker['name'], []).extend(node_identifiers)
+    if point_markers:
+        group_builder.add_nodes('marker', np.concatenate([np.asarray(node_identifiers, dtype=np.int64)
+                                                          for node_identifiers in marker_node_identifiers]),
+                                node_set_name='datapoints')
 
     # Create groups for markers that occur more than once.
     for marker_group_name in marker_groups:
         node_identifiers = marker_groups[marker_group_name]
         if len(node_identifiers) > 1:
-            create_group_nodes(field_module, marker_group_name, node_identifiers, node_set_name='datapoints')
+            group_builder.add_nodes(marker_group_name, node_identifiers, node_set_name='datapoints')
 
     for vessel in data.get_vessels():
         node_map = {}
         node_locations = extract_vessel_node_locations(vessel)
-        node_identifiers = create_nodes(field_module, node_locations, node_map=node_map)
-        connectivity, associated_groups, groups = determine_vessel_connectivity(vessel, node_map)
         field_info = {'rgb': vessel['rgb']}
-        merge_fields_with_nodes(field_module, node_identifiers, field_info)
-        element_ids = create_elements(field_module, connectivity, field_names=['coordinates', 'radius', 'rgb'])
+        node_identifiers = create_nodes_with_fields(field_module, node_locations, _node_field_information(field_info),
+                                                    node_map=node_map, deduplicator=_node_deduplicator())
+        connectivity, associated_groups, groups = determine_vessel_connectivity(vessel, node_map)
+        element_ids = _create_object_elements(connectivity, node_identifiers, ['coordinates', 'radius', 'rgb'],
+                                              field_info)
 
         groups.append({})
         for property_ in vessel['properties']:
             if type(property_) is MBFPropertyTraceAssociation:
                 groups[-1]['TraceAssociation'] = property_.label()
-                groups[-1]['elements'] = element_ids
+                groups[-1]['elements'] = list(element_ids)
 
         for index, associated_group in enumerate(associated_groups):
             element_id = element_ids[index]
@@ -265,28 +355,30 @@ def load(region, data, options):
                 group_element_ids = group['elements']
                 del group['elements']
                 for key in group:
-                    create_group_elements(field_module, group[key], group_element_ids)
+                    group_builder.add_elements(group[key], group_element_ids)
+
+    group_builder.flush()
 
     if punctum_data:
         _process_punctum_data(region, punctum_data)
 
 
-def _determine_sub_groups(grouped_by_parent, node_to_element_map, element_to_node_map, tree, unique_paths):
+def _determine_sub_groups(branch_nodes, node_to_element_map, element_to_node_map, tree):
     sub_groups = {}
     seen_unknown = set()
     all_unknowns = []
-    for u in unique_paths:
-        p = tree.properties(u)
-        properties, metadata, unknown, group_primary_name = classify_properties(p, INFOSET_RANK_MAP)
+    classified_branches = classify_tree_branches(tree)
+    for branch_path, branch_node_ids in branch_nodes.items():
+        group_names, unknown = classified_branches[branch_path]
         for un in unknown:
             if un not in seen_unknown:
                 all_unknowns.append(un)
                 seen_unknown.add(un)
 
-        node_ids = grouped_by_parent[u[:-1]][:]
-        node_ids.append(grouped_by_parent[u[:-2]][-1])
+        # The nodes of the branch and the last node of the branch it grows from.
+        node_ids = branch_node_ids[:]
+        node_ids.append(branch_nodes[branch_path[:-1]][-1])
         element_ids = get_elements_for_node_ids(node_ids, node_to_element_map, element_to_node_map)
-        group_names = _expand_properties(properties)
         for group_name in group_names:
             if group_name in sub_groups:
                 sub_groups[group_name]['el'].extend(element_ids[:])
@@ -302,13 +394,61 @@ def _determine_sub_groups(grouped_by_parent, node_to_element_map, element_to_nod
     return sub_groups
 
 
-def _group_by_parent(node_map):
-    grouped_by_parent = {}
-    for path, node_id in node_map.items():
-        parent = path[:-1]
-        grouped_by_parent[parent] = grouped_by_parent.get(parent, []) + [node_id]
-
-    return grouped_by_parent
+def classify_tree_branches(tree):
+    """
+    Classify the properties of every branch of a tree and expand them into group names, once for each branch.
+
+    The properties of the branches are inherited from the root down in one pass, see MBFTree.branch_properties.
+    Branches without properties of their own and with the same attributes, such as the branches inheriting
+    all of their attributes, share one classification.
+
+    :param tree: MBFTree.
+    :return: Dict of branch path to a tuple of the list of group names and the list of unknown attributes.
+    """
+    classified_branches = {}
+    classified_attributes = {}
+    for branch_path, (properties, attributes) in tree.branch_properties().items():
+        key = None if properties else tuple(attributes.items())
+        classified = classified_attributes.get(key)
+        if classified is None:
+            group_properties, metadata, unknown, group_primary_name = classify_properties(
+                properties + list(attributes.items()), INFOSET_RANK_MAP)
+            classified = (_expand_properties(group_properties), unknown)
+            if key is not None:
+                classified_attributes[key] = classified
+        classified_branches[branch_path] = classified
+
+    return classified_branches
+
+
+def index_flat_tree_branches(flat_tree, point_node_ids):
+    """
+    Index the nodes of the branches of a flat tree.
+
+    A branch is a list of points of the tree, identified by its path, the root list of the tree has the
+    empty path.  Branches are in the order of their first point, and so are the node identifiers of each
+    branch.  Only the points of a branch are included, not those of its sub-branches.
+
+    :param flat_tree: MBFFlatTree.
+    :param point_node_ids: Node identifier of each point of the flat tree.
+    :return: Dict of the path of each branch to the list of the node identifiers of its points.
+    """
+    branch_ids = flat_tree.branch_ids()
+    # Sorting the points by branch keeps the points of each branch in order.
+    order = np.argsort(branch_ids, kind='stable')
+    node_ids = np.asarray(point_node_ids, dtype=np.int64)[order]
+    branch_starts = flat_tree.branch_starts()
+    counts = np.bincount(branch_ids, minlength=len(branch_starts))
+    ends = np.cumsum(counts).tolist()
+    starts = (np.cumsum(counts) - counts).tolist()
+    branch_paths = flat_tree.branch_paths()
+    branch_nodes = {}
+    # Branches are in the order of their first point, branches without points are left out.
+    for branch in np.argsort(branch_starts, kind='stable').tolist():
+        if branch_starts[branch] != -1:
+            branch_nodes[branch_paths[branch]] = node_ids[starts[branch]:ends[branch]].tolist()
+
+    return branch_nodes
 
 
 def _process_punctum_data(region, punctum_data):
@@ -362,6 +502,133 @@ def create_line_elements(field_module, element_node_set, field_names):
     return element_identifiers
 
 
+class MBFElementTemplateCache(object):
+    """
+    Element templates of a mesh shared by all the objects written to a field module.
+
+    Templates are kept for each element shape and list of field names, the fields are defined
+    with one linear Lagrange element field template shared by all templates.  Object fields are
+    defined with one constant element field template mapping them to a node after the nodes of the
+    element shape, the node holding the values of the object, see create_object_node.  A template keeps
+    the fields it defines alive, names that found no field when the template was built are looked
+    up again each time and the template is built again once one of them is found, for example
+    when the resolution field is first created.
+    """
+
+    def __init__(self, field_module, dimension=1):
+        self._field_module = field_module
+        self._mesh = field_module.findMeshByDimension(dimension)
+        self._linear_eft = None
+        self._constant_eft = None
+        self._templates = {}
+
+    def mesh(self):
+        return self._mesh
+
+    def linear_element_field_template(self):
+        if self._linear_eft is None:
+            linear_basis = self._field_module.createElementbasis(self._mesh.getDimension(),
+                                                                 Elementbasis.FUNCTION_TYPE_LINEAR_LAGRANGE)
+            self._linear_eft = self._mesh.createElementfieldtemplate(linear_basis)
+
+        return self._linear_eft
+
+    def constant_element_field_template(self):
+        if self._constant_eft is None:
+            constant_basis = self._field_module.createElementbasis(self._mesh.getDimension(),
+                                                                   Elementbasis.FUNCTION_TYPE_CONSTANT)
+            self._constant_eft = self._mesh.createElementfieldtemplate(constant_basis)
+
+        return self._constant_eft
+
+    def element_template(self, shape_type, field_names, object_field_names=()):
+        """
+        Return an element template of the shape with the named fields defined.
+
+        :param shape_type: Element.SHAPE_TYPE of the elements.
+        :param field_names: Names of the fields to define, names of fields that do not exist are left out.
+        :param object_field_names: Names of the fields to define as constant over the element, with their
+            values taken from the node of the object, names of fields that do not exist are left out.
+        :return: Elementtemplate.
+        """
+        key = (shape_type, tuple(field_names), tuple(object_field_names))
+        if key in self._templates:
+            missing_field_names, element_template = self._templates[key]
+            if not any(self._field_module.findFieldByName(field_name).isValid() for field_name in missing_field_names):
+                return element_template
+
+        element_template = self._mesh.createElementtemplate()
+        element_template.setElementShapeType(shape_type)
+        linear_eft = self.linear_element_field_template()
+        missing_field_names = []
+        for field_name in [*field_names, *object_field_names]:
+            field = self._field_module.findFieldByName(field_name)
+            if not field.isValid():
+                missing_field_names.append(field_name)
+            elif field_name in object_field_names:
+                element_template.defineField(field, -1, self.constant_element_field_template())
+            else:
+                element_template.defineField(field, -1, linear_eft)
+
+        self._templates[key] = (missing_field_names, element_template)
+        return element_template
+
+
+def create_line_elements_by_identifier(field_module, element_node_set, field_names, element_templates=None,
+                                       object_field_names=(), object_node_identifier=None):
+    """
+    Create line elements between nodes given by identifier, as create_line_elements does.
+
+    The nodes of each element are set from their identifiers in one call, no node is looked up
+    from Python.  Elements are given consecutive identifiers from the first identifier the mesh
+    allocates, so the identifiers are returned as a range instead of being collected.
+
+    :param field_module: Field module with the fields named in field_names.
+    :param element_node_set: Sequence of the pairs of node identifiers of the elements.
+    :param field_names: Names of the fields to define on the elements.
+    :param element_templates: MBFElementTemplateCache of the field module to take the element template from,
+        a template is made for this call if None.
+    :param object_field_names: Names of the fields to define as constant over the elements, with their values
+        taken from the node of the object.
+    :param object_node_identifier: Identifier of the node holding the values of the object fields.
+    :return: Range of the element identifiers, a list of them if an identifier in the range was already in use.
+    """
+    if element_templates is None:
+        element_templates = MBFElementTemplateCache(field_module)
+
+    with ChangeManager(field_module):
+        mesh = element_templates.mesh()
+        element_template = element_templates.element_template(Element.SHAPE_TYPE_LINE, field_names,
+                                                              object_field_names)
+        linear_eft = element_templates.linear_element_field_template()
+        constant_eft = element_templates.constant_element_field_template() if object_field_names else None
+
+        first_identifier = None
+        element_identifiers = None
+        for index, element_nodes in enumerate(element_node_set):
+            if first_identifier is None:
+                element = mesh.createElement(-1, element_template)
+                first_identifier = element.getIdentifier()
+            elif element_identifiers is None:
+                element = mesh.createElement(first_identifier + index, element_template)
+                if not element.isValid():
+                    element_identifiers = list(range(first_identifier, first_identifier + index))
+            if element_identifiers is not None:
+                element = mesh.createElement(-1, element_template)
+                element_identifiers.append(element.getIdentifier())
+
+            element.setNodesByIdentifier(linear_eft, element_nodes)
+            if constant_eft is not None:
+                element.setNodesByIdentifier(constant_eft, [object_node_identifier])
+
+    if element_identifiers is not None:
+        return element_identifiers
+    if first_identifier is None:
+        return range(0)
+
+    return range(first_identifier, first_identifier + len(element_node_set))
+
+
 def create_field(field_module, field_info):
     if field_info['name'] == 'constant':
         field = field_module.createFieldConstant(field_info['values'])
@@ -370,6 +637,14 @@ def create_field(field_module, field_info):
     return field
 
 
+def _assign_field_value(field, field_cache, field_value):
+    # Values that are neither strings, lists nor floats are left unassigned, the field is still defined.
+    if isinstance(field_value, str):
+        field.assignString(field_cache, field_value)
+    elif isinstance(field_value, (list, float)):
+        field.assignReal(field_cache, field_value)
+
+
 def merge_fields_with_nodes(field_module, node_identifiers, field_information, node_set_name='nodes'):
     field_cache = field_module.createFieldcache()
     node_set = field_module.findNodesetByName(node_set_name)
@@ -383,14 +658,7 @@ def merge_fields_with_nodes(field_module, node_identifiers, field_information, n
             node_template.defineField(field)
             node.merge(node_template)
             field_cache.setNode(node)
-            if isinstance(field_values, ("".__class__, u"".__class__)):
-                field.assignString(field_cache, field_values)
-            elif isinstance(field_values, list):
-                field.assignReal(field_cache, field_values)
-            elif isinstance(field_values, float):
-                field.assignReal(field_cache, field_values)
-            else:
-                pass
+            _assign_field_value(field, field_cache, field_values)
 
 
 def merge_additional_fields(field_module, element_field_template, additional_field_info, element_identifiers):
@@ -412,37 +680,325 @@ def merge_additional_fields(field_module, element_field_template, additional_fie
 
 
 def create_nodes(field_module, embedded_lists, node_set_name='nodes', path=None, node_map=None, dupe_watch=None):
-    if path is None:
-        path = []
-    if node_map is None:
-        node_map = {}
-    if dupe_watch is None:
-        dupe_watch = {}
-
-    node_identifiers = []
+    """
+    Create the nodes of the points of an object with the coordinates and radius fields, see create_nodes_with_fields.
+
+    :param field_module: Field module with the coordinates and radius fields.
+    :param embedded_lists: Points of the object, nested lists of points for a tree.
+    :param node_set_name: Name of the node set to create the nodes in.
+    :param path: Path of embedded_lists in node_map. [defaults to the empty path.]
+    :param node_map: Dict filled with the node identifier of the point at each path in embedded_lists.
+    :param dupe_watch: MBFNodeDeduplicator shared between calls, points matching a node it created before
+        are given that node.
+    :return: List of the unique node identifiers of the object.
+    """
+    object_node_map = {}
+    node_identifiers = create_nodes_with_fields(field_module, embedded_lists, {}, node_set_name=node_set_name,
+                                                node_map=object_node_map, deduplicator=dupe_watch)
+    if node_map is not None:
+        prefix = tuple(path) if path else ()
+        node_map.update((prefix + point_path, node_id) for point_path, node_id in object_node_map.items())
+
+    return node_identifiers
+
+
+def _flatten_points(embedded_lists, path, paths, points):
     for i, pt in enumerate(embedded_lists):
-        current_path = path + [i]
         if isinstance(pt, list):
-            node_ids = create_nodes(field_module, pt, node_set_name=node_set_name, path=current_path, node_map=node_map, dupe_watch=dupe_watch)
-            node_identifiers.extend(node_ids)
+            _flatten_points(pt, path + (i,), paths, points)
         else:
-            pos = tuple(str(f) for f in pt.coordinates())
-            if pos in dupe_watch:
-                local_node_id = dupe_watch[pos]
-            else:
-                local_node_id = create_zinc_node(field_module, pt, node_set_name=node_set_name)
-                dupe_watch[pos] = local_node_id
+            paths.append(path + (i,))
+            points.append(pt)
+
+
+class MBFNodeDeduplicator(object):
+    """
+    Match points to the nodes already created at their location, so that coincident points share a node.
+
+    With a tolerance of zero points match when their coordinates are exactly equal, which is what comparing
+    the string representations of the coordinates did, the coordinates are compared as bytes.  With a positive
+    tolerance nodes are bucketed in a grid of cells twice the size of the tolerance, and a point matches the
+    first node within that distance of it found in the eight cells nearest the point, searching its own cell
+    first and each cell in the order the nodes were created.  When several nodes are within the tolerance of
+    a point the one it shares is not necessarily the first one created.  The grid cell of every point has to
+    fit in a 64 bit integer, match raises ValueError for coordinates too large for the tolerance.
+
+    A deduplicator remembers the nodes of every call to match, use one for each object to share nodes
+    within the object, or one for a whole load to also share nodes between objects.
+    """
+
+    # Largest coordinate over tolerance for which the grid cells of a point and its neighbours fit in int64.
+    _MAXIMUM_SCALED_COORDINATE = 2.0 ** 62
+
+    def __init__(self, tolerance=0.0):
+        """
+        :param tolerance: Absolute distance within which points share a node, zero for exactly equal points.
+        """
+        if tolerance < 0.0:
+            raise ValueError(f"Node tolerance must not be negative, got '{tolerance}'.")
+
+        self._tolerance = tolerance
+        self._nodes = {}
+
+    def tolerance(self):
+        return self._tolerance
+
+    def match(self, coordinates, create_node):
+        """
+        Return the node identifier of each row of coordinates, creating a node for every row not matching
+        an earlier node.  Nodes are created in the order of the rows.
+
+        :param coordinates: (N, 3) array of point coordinates.
+        :param create_node: Function given the index of a row, creating its node and returning the identifier.
+        :return: List of node identifiers.
+        :raises ValueError: With a tolerance, when the grid cell of a point does not fit in a 64 bit integer.
+        """
+        coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        if self._tolerance > 0.0:
+            return self._match_within_tolerance(coordinates, create_node)
+
+        nodes = self._nodes
+        data = coordinates.tobytes()
+        row_size = coordinates.itemsize * 3
+        node_identifiers = []
+        for index in range(len(coordinates)):
+            key = data[index * row_size:(index + 1) * row_size]
+            node_identifier = nodes.get(key)
+            if node_identifier is None:
+                node_identifier = nodes[key] = create_node(index)
+            node_identifiers.append(node_identifier)
+
+        return node_identifiers
+
+    def _match_within_tolerance(self, coordinates, create_node):
+        nodes = self._nodes
+        squared_tolerance = self._tolerance * self._tolerance
+        scaled_coordinates = coordinates / self._tolerance
+        if not np.all(np.abs(scaled_coordinates) < self._MAXIMUM_SCALED_COORDINATE):
+            raise ValueError(f"Node tolerance '{self._tolerance}' is too small for the coordinates of the points, "
+                             f"or the coordinates are not finite.")
+        half_cells = np.floor(scaled_coordinates).astype(np.int64)
+        cells = half_cells // 2
+        # The cells next to a point that may hold nodes within the tolerance, on the side of the nearest cell face.
+        sides = np.where(half_cells % 2 == 0, -1, 1)
+        node_identifiers = []
+        for index, (cell, side, point) in enumerate(zip(cells.tolist(), sides.tolist(), coordinates.tolist())):
+            node_identifier = None
+            x, y, z = cell
+            for near_cell in ((x, y, z), (x + side[0], y, z), (x, y + side[1], z), (x, y, z + side[2]),
+                              (x + side[0], y + side[1], z), (x + side[0], y, z + side[2]),
+                              (x, y + side[1], z + side[2]), (x + side[0], y + side[1], z + side[2])):
+                for node_point, identifier in nodes.get(near_cell, ()):
+                    if (node_point[0] - point[0]) ** 2 + (node_point[1] - point[1]) ** 2 + \
+                            (node_point[2] - point[2]) ** 2 <= squared_tolerance:
+                        node_identifier = identifier
+                        break
+                if node_identifier is not None:
+                    break
+
+            if node_identifier is None:
+                node_identifier = create_node(index)
+                nodes.setdefault((x, y, z), []).append((point, node_identifier))
+            node_identifiers.append(node_identifier)
+
+        return node_identifiers
+
+
+def create_nodes_for_values(field_module, values, field_information, node_set_name='nodes', deduplicator=None):
+    """
+    Create nodes for rows of point values with all of their fields in one pass.
+
+    The coordinates, radius and the fields of field_information are defined by one node template
+    and assigned through one field cache.
+
+    :param field_module: Field module with the coordinates, radius and the fields of field_information.
+    :param values: (N, 4) array of the x, y, z and radius of the points.
+    :param field_information: Dict of field name to the value given to every node.
+    :param node_set_name: Name of the node set to create the nodes in.
+    :param deduplicator: MBFNodeDeduplicator matching the points to existing nodes of the node set,
+        points matching a node are given that node instead of a new one. [defaults to exact matching
+        within the values.]
+    :return: List of the node identifier of each row of values.
+    """
+    if deduplicator is None:
+        deduplicator = MBFNodeDeduplicator()
+
+    rows = values.tolist()
+    node_set = field_module.findNodesetByName(node_set_name)
+    node_template = node_set.createNodetemplate()
+    coordinates_field = field_module.findFieldByName('coordinates')
+    radius_field = field_module.findFieldByName('radius')
+    constant_fields = [(field_module.findFieldByName(field_name), field_value)
+                       for field_name, field_value in field_information.items()]
+    for field in [coordinates_field, radius_field, *(field for field, _ in constant_fields)]:
+        node_template.defineField(field)
+
+    field_cache = field_module.createFieldcache()
+
+    def _create_node(index):
+        node = node_set.createNode(-1, node_template)
+        field_cache.setNode(node)
+        coordinates_field.assignReal(field_cache, rows[index][:3])
+        radius_field.assignReal(field_cache, rows[index][3])
+        for field, field_value in constant_fields:
+            _assign_field_value(field, field_cache, field_value)
+        return node.getIdentifier()
+
+    with ChangeManager(field_module):
+        return deduplicator.match(values[:, :3], _create_node)
+
 
-            node_map[tuple(current_path)] = local_node_id
-            node_identifiers.append(local_node_id)
+def create_nodes_with_fields(field_module, embedded_lists, field_information, node_set_name='nodes', node_map=None,
+                             deduplicator=None):
+    """
+    Create the nodes of an object with all of their fields in one pass, see create_nodes_for_values.
 
+    The values of the points are read from their point store in one go.  Points with the same coordinates
+    share a node, and the nodes are the same as those of creating each node followed by merge_fields_with_nodes.
+
+    :param field_module: Field module with the coordinates, radius and the fields of field_information.
+    :param embedded_lists: Points of the object, nested lists of points for a tree.
+    :param field_information: Dict of field name to the value given to every node of the object.
+    :param node_set_name: Name of the node set to create the nodes in.
+    :param node_map: Dict filled with the node identifier of the point at each path in embedded_lists.
+    :param deduplicator: MBFNodeDeduplicator, see create_nodes_for_values.
+    :return: List of the unique node identifiers of the object.
+    """
+    if node_map is None:
+        node_map = {}
+
+    paths = []
+    points = []
+    _flatten_points(embedded_lists, (), paths, points)
+    node_identifiers = create_nodes_for_values(field_module, point_values(points), field_information,
+                                               node_set_name=node_set_name, deduplicator=deduplicator)
+    node_map.update(zip(paths, node_identifiers))
     return list(set(node_identifiers))
 
 
-def create_elements(field_module, connectivity, field_names=None):
+def create_marker_nodes(field_module, markers, node_tolerance=0.0, node_set_name='datapoints'):
+    """
+    Create the data points of markers with their rgb and name in one pass.
+
+    The marker_name stored string field is created once, when a marker has a name.  One node template
+    is made for the markers with a name and one for those without, and the values of all of the
+    points are assigned through one field cache.  The points of each marker share nodes as for
+    create_nodes_with_fields, the points of different markers do not share nodes.
+
+    :param field_module: Field module with the coordinates, radius and rgb fields.
+    :param markers: Sequence of the markers, other than Punctum markers.
+    :param node_tolerance: Tolerance of the MBFNodeDeduplicator matching the points of each marker.
+    :param node_set_name: Name of the node set to create the nodes in.
+    :return: List of the list of the unique node identifiers of each marker.
+    """
+    node_set = field_module.findNodesetByName(node_set_name)
+    coordinates_field = field_module.findFieldByName('coordinates')
+    radius_field = field_module.findFieldByName('radius')
+    rgb_field = field_module.findFieldByName('rgb')
+    name_field = None
+    if any('name' in marker for marker in markers):
+        name_field = field_module.findFieldByName('marker_name')
+        if not name_field.isValid():
+            name_field = field_module.createFieldStoredString()
+            name_field.setManaged(True)
+            name_field.setName('marker_name')
+
+    node_templates = {}
+    for named in [False, True] if name_field is not None else [False]:
+        node_template = node_set.createNodetemplate()
+        for field in [coordinates_field, radius_field, rgb_field] + ([name_field] if named else []):
+            node_template.defineField(field)
+        node_templates[named] = node_template
+
+    field_cache = field_module.createFieldcache()
+    marker_node_identifiers = []
+    with ChangeManager(field_module):
+        for marker in markers:
+            values = object_values(marker['data'])
+            rows = values.tolist()
+            node_template = node_templates['name' in marker]
+            rgb = marker['rgb']
+            name = marker.get('name')
+
+            def _create_node(index):
+                node = node_set.createNode(-1, node_template)
+                field_cache.setNode(node)
+                coordinates_field.assignReal(field_cache, rows[index][:3])
+                radius_field.assignReal(field_cache, rows[index][3])
+                _assign_field_value(rgb_field, field_cache, rgb)
+                if name is not None:
+                    _assign_field_value(name_field, field_cache, name)
+                return node.getIdentifier()
+
+            if len(rows) == 1:
+                node_identifiers = [_create_node(0)]
+            else:
+                node_identifiers = list(set(MBFNodeDeduplicator(node_tolerance).match(values[:, :3], _create_node)))
+            marker_node_identifiers.append(node_identifiers)
+
+    return marker_node_identifiers
+
+
+def create_elements(field_module, connectivity, field_names=None, element_templates=None):
     if field_names is None:
         field_names = ['coordinates']
-    return create_line_elements(field_module, connectivity, field_names)
+    return create_line_elements_by_identifier(field_module, connectivity, field_names, element_templates)
+
+
+def create_object_node(field_module, field_information, node_set_name='nodes'):
+    """
+    Create a node holding the values of the fields of an object, and nothing else.
+
+    :param field_module: Field module with the fields of field_information.
+    :param field_information: Dict of field name to the value of the object.
+    :param node_set_name: Name of the node set to create the node in.
+    :return: Identifier of the node.
+    """
+    node_set = field_module.findNodesetByName(node_set_name)
+    node_template = node_set.createNodetemplate()
+    fields = [(field_module.findFieldByName(field_name), field_value)
+              for field_name, field_value in field_information.items()]
+    for field, _ in fields:
+        node_template.defineField(field)
+
+    with ChangeManager(field_module):
+        node = node_set.createNode(-1, node_template)
+        field_cache = field_module.createFieldcache()
+        field_cache.setNode(node)
+        for field, field_value in fields:
+            _assign_field_value(field, field_cache, field_value)
+
+    return node.getIdentifier()
+
+
+def create_object_elements(field_module, connectivity, node_identifiers, field_names, object_field_information,
+                           element_templates=None):
+    """
+    Create the line elements of an object with the fields constant over the object stored once for it.
+
+    The values of object_field_information are held by one node of the object, see create_object_node,
+    and the fields are defined on the elements as constant over each element with their values taken
+    from that node.  The nodes of an object without elements are given the fields instead.
+
+    :param field_module: Field module with the fields named in field_names and object_field_information.
+    :param connectivity: Sequence of the pairs of node identifiers of the elements.
+    :param node_identifiers: Identifiers of the nodes of the object.
+    :param field_names: Names of the fields to define on the elements, those of object_field_information
+        are defined as object fields.
+    :param object_field_information: Dict of field name to the value of the object.
+    :param element_templates: MBFElementTemplateCache of the field module, see create_line_elements_by_identifier.
+    :return: Range or list of the element identifiers, see create_line_elements_by_identifier.
+    """
+    if not connectivity:
+        merge_fields_with_nodes(field_module, node_identifiers, object_field_information)
+        return range(0)
+
+    object_node_identifier = create_object_node(field_module, object_field_information)
+    object_field_names = [field_name for field_name in field_names if field_name in object_field_information]
+    node_field_names = [field_name for field_name in field_names if field_name not in object_field_information]
+    return create_line_elements_by_identifier(field_module, connectivity, node_field_names, element_templates,
+                                              object_field_names=object_field_names,
+                                              object_node_identifier=object_node_identifier)
 
 
 def create_group_elements(field_module, group_name, element_ids, dimension=1):
@@ -469,6 +1025,78 @@ def create_group_nodes(field_module, group_name, node_ids, node_set_name='nodes'
             nodeset_group.addNode(node)
 
 
+def _identifier_array(identifiers):
+    if isinstance(identifiers, range):
+        return np.arange(identifiers.start, identifiers.stop, identifiers.step, dtype=np.int64)
+
+    return np.asarray(identifiers, dtype=np.int64)
+
+
+class MBFGroupBuilder(object):
+    """
+    Members of the groups of a field module, collected while the objects are loaded and added once per group.
+
+    Groups and their mesh and node set groups are made when they are first named, in the order
+    create_group_elements and create_group_nodes make them.  Member identifiers are kept as the
+    ranges and lists they are given in, flush adds each member once.  A group of every element of
+    a mesh or every node of a node set is filled with one conditional addition.
+    """
+
+    def __init__(self, field_module):
+        self._field_module = field_module
+        self._groups = {}
+        self._members = {}
+
+    def _group(self, group_name):
+        group = self._groups.get(group_name)
+        if group is None:
+            group = find_or_create_field_group(self._field_module, name=group_name)
+            # A name taken by a field that is not a group gives a new group each time, as it did before.
+            if group.getName() == group_name:
+                self._groups[group_name] = group
+
+        return group
+
+    def add_elements(self, group_name, element_ids, dimension=1):
+        group = self._group(group_name)
+        key = (group.getName(), dimension)
+        if key not in self._members:
+            mesh = self._field_module.findMeshByDimension(dimension)
+            mesh_group = group.getOrCreateMeshGroup(mesh)
+            self._members[key] = (mesh, mesh.findElementByIdentifier, mesh_group.addElement,
+                                  mesh_group.addElementsConditional, [])
+        self._members[key][-1].append(element_ids)
+
+    def add_nodes(self, group_name, node_ids, node_set_name='nodes'):
+        group = self._group(group_name)
+        key = (group.getName(), node_set_name)
+        if key not in self._members:
+            nodeset = self._field_module.findNodesetByName(node_set_name)
+            nodeset_group = group.getOrCreateNodesetGroup(nodeset)
+            self._members[key] = (nodeset, nodeset.findNodeByIdentifier, nodeset_group.addNode,
+                                  nodeset_group.addNodesConditional, [])
+        self._members[key][-1].append(node_ids)
+
+    def flush(self):
+        """
+        Add the members collected so far to their groups.
+        """
+        with ChangeManager(self._field_module):
+            every_member = self._field_module.createFieldConstant([1.0])
+            for domain, find, add, add_conditional, chunks in self._members.values():
+                arrays = [_identifier_array(chunk) for chunk in chunks if len(chunk)]
+                chunks.clear()
+                if not arrays:
+                    continue
+
+                identifiers = np.unique(np.concatenate(arrays))
+                if len(identifiers) == domain.getSize():
+                    add_conditional(every_member)
+                else:
+                    for identifier in identifiers.tolist():
+                        add(find(identifier))
+
+
 def get_element_field_template(field_module, element_identifier):
     coordinate_field = field_module.findFieldByName('coordinates')
     mesh = field_module.findMeshByDimension(1)
@@ -0,0 +1,68 @@
+"""
+Benchmark the XML parser backends on the test resources and on large synthetic files.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import timeit
+
+from mbfxml2ex.exceptions import MBFXMLFormat
+from mbfxml2ex.reader import available_backends, iterate_objects
+
+from synthetic_data import write_synthetic_mbf_xml
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+SYNTHETIC_FILES = {
+    "synthetic_trees.xml": {"trees": 40, "branch_depth": 9, "points_per_branch": 12, "nested_markers": 20},
+    "synthetic_contours.xml": {"trees": 0, "contours": 4000, "points_per_contour": 150, "markers": 2000},
+}
+
+
+def _read(file_name, backend):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return sum(1 for _ in iterate_objects(file_name, backend))
+
+
+def _time_file(file_name, backends, repeat):
+    timings = []
+    for backend in backends:
+        try:
+            timings.append(min(timeit.repeat(lambda: _read(file_name, backend), number=1, repeat=repeat)))
+        except MBFXMLFormat:
+            timings.append(None)
+    return timings
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the XML parser backends.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="Scale factor for the size of the synthetic files.")
+    parser.add_argument("--skip-resources", action="store_true", help="Only benchmark the synthetic files.")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    backends = available_backends()
+    files = [] if args.skip_resources else sorted(glob.glob(os.path.join(here, "resources", "*.xml")))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, parameters in SYNTHETIC_FILES.items():
+            scaled = {key: int(value * args.scale) if key in ["trees", "contours", "markers"] else value
+                      for key, value in parameters.items()}
+            files.append(write_synthetic_mbf_xml(os.path.join(temp_dir, name), **scaled))
+
+        print(f"{'file':<45} {'MB':>7} " + " ".join(f"{backend + ' [s]':>11}" for backend in backends))
+        for file_name in files:
+            timings = _time_file(file_name, backends, args.repeat)
+            size = os.path.getsize(file_name) / 1e6
+            cells = " ".join(f"{'error':>11}" if timing is None else f"{timing:>11.4f}" for timing in timings)
+            print(f"{os.path.basename(file_name):<45} {size:>7.2f} {cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark resolving the properties of the branches of a tree one branch at a time against in one pass.
+
+Reports the time taken by MBFTree.properties followed by classify_properties and _expand_properties for
+the first point of every branch, and by classify_tree_branches, for a heavily branched synthetic tree and
+for a chain of branches nested to the given depth.
+"""
+import argparse
+import tempfile
+import timeit
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.classes import MBFPoint, MBFTree
+from mbfxml2ex.definitions import INFOSET_RANK_MAP
+from mbfxml2ex.utilities import classify_properties
+from mbfxml2ex.zinc import classify_tree_branches, _expand_properties
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _chain_tree(depth):
+    branch = {'points': [MBFPoint(depth, 0, 0, 1)], 'attributes': {'leaf': 'Normal'}, 'properties': []}
+    for level in reversed(range(depth)):
+        branch = {'points': [MBFPoint(level, 0, 0, 1), branch], 'attributes': {}, 'properties': []}
+    branch['attributes'] = {'color': '#FF0000', 'type': 'Dendrite'}
+    return MBFTree(branch)
+
+
+def _first_point_paths(embedded_lists, path=()):
+    # The path of the first point of every branch.
+    paths = [path + (0,)]
+    for i, pt in enumerate(embedded_lists):
+        if isinstance(pt, list):
+            paths.extend(_first_point_paths(pt, path + (i,)))
+    return paths
+
+
+def _one_at_a_time(tree, paths):
+    for path in paths:
+        properties, metadata, unknown, group_primary_name = classify_properties(tree.properties(path),
+                                                                                INFOSET_RANK_MAP)
+        _expand_properties(properties)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark resolving the properties of tree branches.")
+    parser.add_argument("--branch-depth", type=int, default=10)
+    parser.add_argument("--chain-depth", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=1, branch_depth=args.branch_depth))
+        f.flush()
+        branched_tree = read_xml(f.name, cache=False).get_tree(0)
+
+    for name, tree in [("branched", branched_tree), ("chain", _chain_tree(args.chain_depth))]:
+        paths = _first_point_paths(tree.points())
+        print(f"{name} tree, branches: {len(paths)}")
+        for method, function in [("one at a time", lambda: _one_at_a_time(tree, paths)),
+                                 ("one pass", lambda: classify_tree_branches(tree))]:
+            elapsed = min(timeit.repeat(function, number=1, repeat=args.repeat))
+            print(f"  {method:<14} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
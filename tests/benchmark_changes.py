@@ -0,0 +1,65 @@
+"""
+Benchmark caching the changes of a load for the whole load against caching them in each function of the load.
+
+Reports the time taken by load with each change cache, and the time taken by the endChange call releasing the
+changes cached for the whole load, which is the time spent propagating them.  The difference between the
+times taken by the two change caches is the time spent propagating the changes of each function.
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+from cmlibs.zinc.context import Context
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import load, CHANGE_CACHES, LOAD_CHANGE_CACHE
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _load_time(data, change_cache):
+    context = Context("benchmark")
+    region = context.getDefaultRegion()
+    field_module = region.getFieldmodule()
+    propagation = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if change_cache == LOAD_CHANGE_CACHE:
+            # Holding the changes here nests the change cache of the load, the last endChange propagates them.
+            field_module.beginChange()
+            load(region, data, {'change_cache': change_cache})
+            loaded = time.perf_counter()
+            field_module.endChange()
+            propagation = time.perf_counter() - loaded
+        else:
+            load(region, data, {'change_cache': change_cache})
+        elapsed = time.perf_counter() - start
+    return elapsed, propagation
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the change cache of a load.")
+    parser.add_argument("--trees", type=int, default=20)
+    parser.add_argument("--contours", type=int, default=500)
+    parser.add_argument("--markers", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=args.trees, branch_depth=5, contours=args.contours, points_per_contour=20,
+                                  markers=args.markers))
+        f.flush()
+        data = read_xml(f.name, cache=False)
+
+    for change_cache in CHANGE_CACHES:
+        elapsed, propagation = min(_load_time(data, change_cache) for _ in range(args.repeat))
+        print(f"{change_cache:<5} {elapsed:>8.3f} s" +
+              ("" if propagation is None else f", last endChange {propagation:>8.3f} s"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark storing the fields constant over an object on every node against once for the object.
+
+Reports the size of the EX file written and the time taken by write_ex for the MBF XML files in the test
+resources, or the files given, with the 'node' and 'object' constant fields options.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import time
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import write_ex, CONSTANT_FIELDS
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+
+def _write(data, file_name, constant_fields, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_ex(file_name, data, {'constant_fields': constant_fields})
+        elapsed.append(time.perf_counter() - start)
+    return os.path.getsize(file_name), min(elapsed)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the storage of constant fields.")
+    parser.add_argument("files", nargs="*", help="MBF XML files. [defaults to the test resources.]")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    file_names = args.files or sorted(glob.glob(os.path.join(here, "resources", "*.xml")))
+    totals = dict.fromkeys(CONSTANT_FIELDS, (0, 0.0))
+    print(f"{'file':<42}" + "".join(f"{name + ' size':>13}{name + ' time':>13}" for name in CONSTANT_FIELDS))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file_name in file_names:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    data = read_xml(file_name, cache=False)
+                results = [_write(data, os.path.join(temp_dir, f"{constant_fields}.ex"), constant_fields, args.repeat)
+                           for constant_fields in CONSTANT_FIELDS]
+            except Exception as e:
+                print(f"{os.path.basename(file_name):<42} not converted: {type(e).__name__} {e}")
+                continue
+
+            line = f"{os.path.basename(file_name):<42}"
+            for constant_fields, (size, elapsed) in zip(CONSTANT_FIELDS, results):
+                totals[constant_fields] = (totals[constant_fields][0] + size, totals[constant_fields][1] + elapsed)
+                line += f"{size:>13}{elapsed:>12.3f}s"
+            print(line)
+
+    line = f"{'total':<42}"
+    for size, elapsed in totals.values():
+        line += f"{size:>13}{elapsed:>12.3f}s"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
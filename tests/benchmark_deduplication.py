@@ -0,0 +1,70 @@
+"""
+Benchmark matching points to nodes by the strings of their coordinates against MBFNodeDeduplicator.
+
+Reports the time taken to match the points of synthetic trees and contours, without creating nodes,
+by string keys as create_nodes does, by exact matching and by matching within a tolerance.
+"""
+import argparse
+import tempfile
+import timeit
+
+import numpy as np
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import MBFNodeDeduplicator
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _string_keys(coordinates):
+    dupe_watch = {}
+    node_identifiers = []
+    for point in coordinates.tolist():
+        pos = tuple(str(f) for f in point)
+        if pos not in dupe_watch:
+            dupe_watch[pos] = len(dupe_watch) + 1
+        node_identifiers.append(dupe_watch[pos])
+    return node_identifiers
+
+
+def _deduplicated(coordinates, tolerance):
+    created = []
+
+    def _create_node(index):
+        created.append(index)
+        return len(created)
+
+    return MBFNodeDeduplicator(tolerance).match(coordinates, _create_node)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark node deduplication.")
+    parser.add_argument("--trees", type=int, default=20)
+    parser.add_argument("--contours", type=int, default=200)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=args.trees, branch_depth=5, contours=args.contours, points_per_contour=50))
+        f.flush()
+        data = read_xml(f.name, cache=False)
+
+    objects = [tree.point_store().coordinates() for tree in data.get_trees()] + \
+        [contour['data'].as_array()[:, :3] for contour in data.get_contours()]
+    print(f"objects: {len(objects)}, points: {sum(len(coordinates) for coordinates in objects)}")
+    for name, function in [("string keys", _string_keys),
+                           ("exact", lambda coordinates: _deduplicated(coordinates, 0.0)),
+                           (f"tolerance {args.tolerance}", lambda coordinates: _deduplicated(coordinates,
+                                                                                            args.tolerance))]:
+        elapsed = min(timeit.repeat(lambda: [function(coordinates) for coordinates in objects],
+                                    number=1, repeat=args.repeat))
+        nodes = sum(len(np.unique(function(coordinates))) for coordinates in objects)
+        print(f"{name:<16} {elapsed:>8.3f} s, {nodes} nodes")
+
+
+if __name__ == "__main__":
+    main()
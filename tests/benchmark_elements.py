@@ -0,0 +1,76 @@
+"""
+Benchmark creating the line elements of the large tree fixture with node lookups against setting nodes by identifier.
+
+Reports the time taken by create_line_elements, by create_line_elements_by_identifier and by
+create_line_elements_by_identifier with an element template cache for the elements of all the trees
+in the fixture, created copies times over.
+"""
+import argparse
+import contextlib
+import functools
+import io
+import os
+import timeit
+
+from cmlibs.utils.zinc.field import create_field_finite_element, create_field_coordinates
+from cmlibs.zinc.context import Context
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import create_nodes_for_values, determine_flat_tree_connectivity, create_line_elements, \
+    create_line_elements_by_identifier, MBFElementTemplateCache
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+FIELD_NAMES = ['coordinates', 'radius', 'rgb']
+
+
+def _field_module_with_nodes(trees):
+    # The context and the unmanaged fields are returned to keep them alive.
+    context = Context("benchmark")
+    field_module = context.getDefaultRegion().getFieldmodule()
+    fields = [create_field_coordinates(field_module),
+              create_field_finite_element(field_module, 'radius', 1, type_coordinate=False),
+              create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False)]
+    connectivities = []
+    for tree in trees:
+        flat_tree = tree.flat()
+        point_node_ids = create_nodes_for_values(field_module, flat_tree.values(), {'rgb': tree.rgb()})
+        connectivities.append(determine_flat_tree_connectivity(flat_tree, point_node_ids))
+
+    return field_module, connectivities, (context, fields)
+
+
+def _create_elements(field_module, connectivities, create, copies):
+    for _ in range(copies):
+        for connectivity in connectivities:
+            create(field_module, connectivity, FIELD_NAMES)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark line element creation.")
+    parser.add_argument("--copies", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = read_xml(os.path.join(here, "resources", "large_tree_with_tree_order_prop.xml"), cache=False)
+
+    trees = data.get_trees()
+    field_module, connectivities, _keep = _field_module_with_nodes(trees)
+    elements = args.copies * sum(len(connectivity) for connectivity in connectivities)
+    print(f"trees: {len(trees)}, elements: {elements}")
+    cached = functools.partial(create_line_elements_by_identifier,
+                               element_templates=MBFElementTemplateCache(field_module))
+    for name, create in [("node lookups", create_line_elements), ("by identifier", create_line_elements_by_identifier),
+                         ("cached template", cached)]:
+        mesh = field_module.findMeshByDimension(1)
+        elapsed = min(timeit.repeat(lambda: _create_elements(field_module, connectivities, create, args.copies),
+                                    setup=mesh.destroyAllElements, number=1, repeat=args.repeat))
+        print(f"{name:<15} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark reading only the trees or only the markers of a synthetic file against reading everything.
+
+Reports the parse time and the number of objects read.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import timeit
+
+from mbfxml2ex.filters import MBFObjectFilter
+from mbfxml2ex.reader import iterate_objects
+
+from synthetic_data import write_synthetic_mbf_xml
+
+
+def _parse(file_name, backend, object_filter):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return list(iterate_objects(file_name, backend, object_filter=object_filter))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark reading with an object filter.")
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--contours", type=int, default=2000)
+    parser.add_argument("--markers", type=int, default=20000)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    filters = [("all", None), ("trees", MBFObjectFilter(kinds=["tree"])),
+               ("markers", MBFObjectFilter(kinds=["marker"]))]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = write_synthetic_mbf_xml(os.path.join(temp_dir, "filter.xml"), trees=args.trees,
+                                            contours=args.contours, markers=args.markers)
+        print(f"file size: {os.path.getsize(file_name) / 1e6:.1f} MB")
+        print(f"{'filter':<8} {'time [s]':>9} {'objects':>8}")
+        for name, object_filter in filters:
+            parse_time = min(timeit.repeat(lambda: _parse(file_name, args.backend, object_filter),
+                                           number=1, repeat=args.repeat))
+            print(f"{name:<8} {parse_time:>9.3f} {len(_parse(file_name, args.backend, object_filter)):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark the passes over the points of trees with nested point lists against the flat tree representation.
+
+Reports the time taken to gather the point values, determine the connectivity and index the branches of
+the trees of a synthetic file, numbering the points as nodes without creating them, from the nested lists
+of MBFTree.points with determine_tree_connectivity_with_map and a node map, and from MBFTree.flat.
+"""
+import argparse
+import tempfile
+import timeit
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.classes import point_values
+from mbfxml2ex.zinc import determine_tree_connectivity_with_map, determine_flat_tree_connectivity, \
+    index_flat_tree_branches, _flatten_points
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _index_tree_branches(node_map):
+    # The node identifiers of each branch of the node map of a tree, as load found them before MBFTree.flat.
+    branch_nodes = {}
+    for path, node_id in node_map.items():
+        branch_path = path[:-1]
+        node_ids = branch_nodes.get(branch_path)
+        if node_ids is None:
+            branch_nodes[branch_path] = [node_id]
+        else:
+            node_ids.append(node_id)
+
+    return branch_nodes
+
+
+def _nested(trees):
+    for tree in trees:
+        tree_data = tree.points()
+        paths = []
+        points = []
+        _flatten_points(tree_data, (), paths, points)
+        point_values(points)
+        node_map = dict(zip(paths, range(1, len(paths) + 1)))
+        determine_tree_connectivity_with_map(tree_data, node_map)
+        _index_tree_branches(node_map)
+
+
+def _flat(trees):
+    for tree in trees:
+        flat_tree = tree.flat()
+        point_node_ids = range(1, len(flat_tree.values()) + 1)
+        determine_flat_tree_connectivity(flat_tree, point_node_ids)
+        index_flat_tree_branches(flat_tree, point_node_ids)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the flat tree representation.")
+    parser.add_argument("--trees", type=int, default=20)
+    parser.add_argument("--branch-depth", type=int, default=8)
+    parser.add_argument("--points-per-branch", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=args.trees, branch_depth=args.branch_depth,
+                                  points_per_branch=args.points_per_branch))
+        f.flush()
+        trees = read_xml(f.name, cache=False).get_trees()
+
+    print(f"trees: {len(trees)}, points: {sum(len(tree.point_store()) for tree in trees)}")
+    for name, function in [("nested lists", _nested), ("flat tree", _flat)]:
+        elapsed = min(timeit.repeat(lambda: function(trees), number=1, repeat=args.repeat))
+        print(f"{name:<13} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
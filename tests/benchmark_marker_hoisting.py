@@ -0,0 +1,67 @@
+"""
+Benchmark relocating markers that are nested in tree structures.
+
+Times the streaming reader against the previous find based relocation for an increasing
+number of nested markers, the time per marker of the streaming reader should stay flat.
+"""
+import argparse
+import io
+import timeit
+import xml.etree.ElementTree as ElTree
+
+from mbfxml2ex.reader import iterate_top_level_elements
+from mbfxml2ex.utilities import get_raw_tag
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _find_based_relocation(content):
+    root = ElTree.parse(io.BytesIO(content)).getroot()
+    relocate_marker_elements = []
+    for child in root:
+        raw_tag = get_raw_tag(child)
+        if raw_tag in ["tree", "contour"] and child.find('.//{http://www.mbfbioscience.com/2007/neurolucida}marker') is not None:
+            relocate_marker_elements.append({"owner": child, "ns": "http://www.mbfbioscience.com/2007/neurolucida"})
+        elif raw_tag in ["tree", "contour"] and child.find('.//{}marker') is not None:
+            relocate_marker_elements.append({"owner": child, "ns": ""})
+
+    for marker_root_element in relocate_marker_elements:
+        marker_element = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker')
+        marker_element_parent = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker/..')
+        while marker_element is not None:
+            marker_element_parent.remove(marker_element)
+            root.append(marker_element)
+            marker_element = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker')
+            marker_element_parent = marker_root_element["owner"].find(f'.//{{{marker_root_element["ns"]}}}marker/..')
+
+    return len(root)
+
+
+def _streaming_relocation(content):
+    return sum(1 for _ in iterate_top_level_elements(io.BytesIO(content)))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark relocation of markers nested in trees.")
+    parser.add_argument("--markers", type=int, nargs="+", default=[125, 250, 500, 1000, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-namespace", action="store_true", help="Generate documents without a namespace.")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    print(f"{'markers':>8} {'find [s]':>10} {'us/marker':>10} {'stream [s]':>11} {'us/marker':>10}")
+    for marker_count in args.markers:
+        # Keep the amount of tree data proportional to the number of markers, one marker per branch.
+        branch_depth = max(0, (marker_count + 1).bit_length() - 2)
+        content = synthetic_mbf_xml(trees=1, branch_depth=branch_depth, points_per_branch=2,
+                                    nested_markers=marker_count, namespace=not args.no_namespace)
+        find_time = min(timeit.repeat(lambda: _find_based_relocation(content), number=1, repeat=args.repeat))
+        stream_time = min(timeit.repeat(lambda: _streaming_relocation(content), number=1, repeat=args.repeat))
+        print(f"{marker_count:>8} {find_time:>10.4f} {find_time / marker_count * 1e6:>10.2f} "
+              f"{stream_time:>11.4f} {stream_time / marker_count * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
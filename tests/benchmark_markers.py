@@ -0,0 +1,77 @@
+"""
+Benchmark creating the data points of markers one marker at a time against creating them in one pass.
+
+Reports the time taken by creating a marker_name field and calling create_nodes_with_fields for each
+marker and by create_marker_nodes, followed by adding the nodes to the marker group.
+"""
+import argparse
+import tempfile
+import timeit
+
+from cmlibs.utils.zinc.field import create_field_finite_element, create_field_coordinates
+from cmlibs.zinc.context import Context
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import create_nodes_with_fields, create_marker_nodes, MBFGroupBuilder
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _field_module():
+    # The context and the unmanaged fields are returned to keep them alive.
+    context = Context("benchmark")
+    field_module = context.getDefaultRegion().getFieldmodule()
+    fields = [create_field_coordinates(field_module),
+              create_field_finite_element(field_module, 'radius', 1, type_coordinate=False),
+              create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False)]
+    return field_module, (context, fields)
+
+
+def _one_marker_at_a_time(markers):
+    field_module, _keep = _field_module()
+    group_builder = MBFGroupBuilder(field_module)
+    for marker in markers:
+        field_info = {'rgb': marker['rgb']}
+        if 'name' in marker:
+            stored_string_field = field_module.createFieldStoredString()
+            stored_string_field.setManaged(True)
+            stored_string_field.setName('marker_name')
+            field_info['marker_name'] = marker['name']
+        node_identifiers = create_nodes_with_fields(field_module, marker['data'], field_info,
+                                                    node_set_name='datapoints')
+        group_builder.add_nodes('marker', node_identifiers, node_set_name='datapoints')
+    group_builder.flush()
+
+
+def _one_pass(markers):
+    field_module, _keep = _field_module()
+    group_builder = MBFGroupBuilder(field_module)
+    marker_node_identifiers = create_marker_nodes(field_module, markers)
+    group_builder.add_nodes('marker', [node_identifier for node_identifiers in marker_node_identifiers
+                                       for node_identifier in node_identifiers], node_set_name='datapoints')
+    group_builder.flush()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark marker creation.")
+    parser.add_argument("--markers", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=0, contours=0, markers=args.markers))
+        f.flush()
+        data = read_xml(f.name, cache=False)
+
+    markers = data.get_markers()
+    print(f"markers: {len(markers)}")
+    for name, function in [("one at a time", _one_marker_at_a_time), ("one pass", _one_pass)]:
+        elapsed = min(timeit.repeat(lambda: function(markers), number=1, repeat=args.repeat))
+        print(f"{name:<14} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
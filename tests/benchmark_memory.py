@@ -0,0 +1,83 @@
+"""
+Measure the memory held by the parsed objects of scaled up test resources.
+
+The parsed objects are compared with the same content held in plain dicts with a separate copy
+of every string, which is how contours, markers and vessels were stored before they became slotted
+records with interned strings.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+from collections.abc import Mapping
+
+from mbfxml2ex.reader import iterate_objects
+
+from synthetic_data import replicate_mbf_xml
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+RESOURCES = ["vagus_tracing.xml", "tracing_vessels_and_markers.xml"]
+
+
+def _as_plain_dicts(value):
+    if isinstance(value, Mapping):
+        return {_as_plain_dicts(k): _as_plain_dicts(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_as_plain_dicts(v) for v in value]
+    if isinstance(value, str):
+        # A new string object that is not shared with any other record.
+        return value.encode("utf-8").decode("utf-8")
+    return value
+
+
+def _deep_size(value, seen):
+    # Point data and property objects are the same in both layouts and are not counted.
+    if id(value) in seen or not isinstance(value, (Mapping, list, str, int, float, bool)):
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, Mapping):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, list):
+        size += sum(_deep_size(v, seen) for v in value)
+    return size
+
+
+def _parse(file_name, backend):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            objects = list(iterate_objects(file_name, backend))
+            return objects, tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Measure the memory held by parsed MBF objects.")
+    parser.add_argument("--copies", type=int, default=200, help="Number of times the resource content is repeated.")
+    parser.add_argument("--backend", default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    print(f"{'file':<33} {'MB':>6} {'objects':>8} {'held [MB]':>10} {'records':>8} "
+          f"{'B/record':>9} {'B/dict':>7} {'reduction':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name in RESOURCES:
+            file_name = replicate_mbf_xml(os.path.join(here, "resources", name), os.path.join(temp_dir, name), args.copies)
+            objects, held = _parse(file_name, args.backend)
+            records = [object_data for raw_tag, object_data in objects if raw_tag in ["contour", "marker", "vessel"]]
+            record_size = _deep_size(records, set()) / max(1, len(records))
+            dict_size = _deep_size(_as_plain_dicts(records), set()) / max(1, len(records))
+            print(f"{name:<33} {os.path.getsize(file_name) / 1e6:>6.2f} {len(objects):>8} {held / 1e6:>10.2f} "
+                  f"{len(records):>8} {record_size:>9.0f} {dict_size:>7.0f} {1.0 - record_size / dict_size:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark merging the fields of the nodes of trees and contours one node at a time against creating them
+with the nodes in one pass.
+
+Reports the time taken by create_nodes followed by merge_fields_with_nodes and by create_nodes_with_fields.
+"""
+import argparse
+import tempfile
+import timeit
+
+from cmlibs.utils.zinc.field import create_field_finite_element, create_field_coordinates
+from cmlibs.zinc.context import Context
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import create_nodes, merge_fields_with_nodes, create_nodes_with_fields
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _field_module():
+    # The context and the unmanaged fields are returned to keep them alive.
+    context = Context("benchmark")
+    field_module = context.getDefaultRegion().getFieldmodule()
+    fields = [create_field_coordinates(field_module),
+              create_field_finite_element(field_module, 'radius', 1, type_coordinate=False),
+              create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False)]
+    return field_module, (context, fields)
+
+
+def _objects(data):
+    return [tree.points() for tree in data.get_trees()] + [contour['data'] for contour in data.get_contours()]
+
+
+def _merged(objects):
+    field_module, _keep = _field_module()
+    for points in objects:
+        node_identifiers = create_nodes(field_module, points)
+        merge_fields_with_nodes(field_module, node_identifiers, {'rgb': [1.0, 0.5, 0.25]})
+
+
+def _one_pass(objects):
+    field_module, _keep = _field_module()
+    for points in objects:
+        create_nodes_with_fields(field_module, points, {'rgb': [1.0, 0.5, 0.25]})
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark node creation.")
+    parser.add_argument("--trees", type=int, default=20)
+    parser.add_argument("--contours", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=args.trees, branch_depth=5, contours=args.contours, points_per_contour=50))
+        f.flush()
+        data = read_xml(f.name, cache=False)
+
+    objects = _objects(data)
+    points = sum(len(tree.point_store()) for tree in data.get_trees()) + \
+        sum(len(contour['data']) for contour in data.get_contours())
+    print(f"objects: {len(objects)}, points: {points}")
+    for name, function in [("merged fields", _merged), ("one pass", _one_pass)]:
+        elapsed = min(timeit.repeat(lambda: function(objects), number=1, repeat=args.repeat))
+        print(f"{name:<14} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark parsing a large synthetic file with an increasing number of processes.
+
+The time to scan the byte ranges of the top level elements is reported separately, it is
+the serial part of a parallel read.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import timeit
+
+from mbfxml2ex.index import index_file
+from mbfxml2ex.parallel import read_objects_in_parallel
+from mbfxml2ex.reader import iterate_objects
+
+from synthetic_data import write_synthetic_mbf_xml
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark parsing with a pool of processes.")
+    cpu_count = os.cpu_count() or 1
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=[count for count in [2, 4, 8, 16, 32] if count <= cpu_count])
+    parser.add_argument("--trees", type=int, default=200)
+    parser.add_argument("--contours", type=int, default=4000)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = write_synthetic_mbf_xml(os.path.join(temp_dir, "synthetic.xml"), trees=args.trees, branch_depth=8,
+                                            points_per_branch=12, nested_markers=20, contours=args.contours,
+                                            points_per_contour=150, markers=args.contours // 2)
+        print(f"file size: {os.path.getsize(file_name) / 1e6:.1f} MB")
+        scan_time = min(timeit.repeat(lambda: index_file(file_name), number=1, repeat=args.repeat))
+        print(f"scan: {scan_time:.3f} s, {len(index_file(file_name))} top level elements")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial_time = min(timeit.repeat(lambda: list(iterate_objects(file_name, args.backend)), number=1,
+                                            repeat=args.repeat))
+        print(f"{'processes':>9} {'time [s]':>9} {'speedup':>8}")
+        print(f"{1:>9} {serial_time:>9.3f} {1.0:>8.2f}")
+        for processes in args.processes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                parallel_time = min(timeit.repeat(lambda: read_objects_in_parallel(file_name, processes, args.backend),
+                                                  number=1, repeat=args.repeat))
+            print(f"{processes:>9} {parallel_time:>9.3f} {serial_time / parallel_time:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
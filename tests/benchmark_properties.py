@@ -0,0 +1,59 @@
+"""
+Benchmark parsing a property heavy synthetic file with and without lazy properties.
+
+Reports the parse time and the memory held by the parsed objects.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import timeit
+import tracemalloc
+
+from mbfxml2ex.reader import iterate_objects
+
+from synthetic_data import write_synthetic_mbf_xml
+
+
+def _parse(file_name, backend, lazy_properties):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return list(iterate_objects(file_name, backend, lazy_properties))
+
+
+def _held_memory(file_name, backend, lazy_properties):
+    tracemalloc.start()
+    try:
+        objects = _parse(file_name, backend, lazy_properties)
+        return tracemalloc.get_traced_memory()[0], len(objects)
+    finally:
+        tracemalloc.stop()
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark lazy property parsing.")
+    parser.add_argument("--markers", type=int, default=20000)
+    parser.add_argument("--contours", type=int, default=2000)
+    parser.add_argument("--generic-properties", type=int, default=10)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = write_synthetic_mbf_xml(os.path.join(temp_dir, "properties.xml"), trees=0,
+                                            contours=args.contours, points_per_contour=10, markers=args.markers,
+                                            generic_properties=args.generic_properties)
+        print(f"file size: {os.path.getsize(file_name) / 1e6:.1f} MB")
+        print(f"{'mode':<8} {'time [s]':>9} {'held [MB]':>10} {'objects':>8}")
+        for lazy_properties in [False, True]:
+            parse_time = min(timeit.repeat(lambda: _parse(file_name, args.backend, lazy_properties),
+                                           number=1, repeat=args.repeat))
+            held, object_count = _held_memory(file_name, args.backend, lazy_properties)
+            print(f"{'lazy' if lazy_properties else 'eager':<8} {parse_time:>9.3f} {held / 1e6:>10.2f} {object_count:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark finding the nodes and elements of the branches of a tree with the branch index against the
+previous grouping of the node map.
+
+Reports the time taken by _determine_sub_groups for one heavily branched synthetic tree, with the branches
+found by grouping the node map with list concatenation and the elements found by rebuilding the set of
+branch nodes for every element, and with index_flat_tree_branches and get_elements_for_node_ids.
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import timeit
+from unittest import mock
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.utilities import reverse_element_to_node_map
+from mbfxml2ex.zinc import determine_flat_tree_connectivity, index_flat_tree_branches, _determine_sub_groups
+
+from synthetic_data import synthetic_mbf_xml
+
+
+def _group_by_parent(node_map):
+    # The branch index as the previous _determine_sub_groups found it.
+    grouped_by_parent = {}
+    for path, node_id in node_map.items():
+        parent = path[:-1]
+        grouped_by_parent[parent] = grouped_by_parent.get(parent, []) + [node_id]
+
+    return grouped_by_parent
+
+
+def _get_elements_for_node_ids(node_ids, node_to_element_map, element_to_node_map):
+    elements = set()
+    for node_id in node_ids:
+        mapped_elements = node_to_element_map[node_id]
+        v = [element_id for element_id in mapped_elements if set(element_to_node_map[element_id]) <= set(node_ids)]
+        elements.update(set(v))
+
+    return list(elements)
+
+
+def _paths(embedded_lists, path=()):
+    for i, pt in enumerate(embedded_lists):
+        if isinstance(pt, list):
+            yield from _paths(pt, path + (i,))
+        else:
+            yield path + (i,)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark finding the members of tree sub-groups.")
+    parser.add_argument("--branch-depth", type=int, default=10)
+    parser.add_argument("--points-per-branch", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.NamedTemporaryFile(suffix=".xml") as f:
+        f.write(synthetic_mbf_xml(trees=1, branch_depth=args.branch_depth, points_per_branch=args.points_per_branch))
+        f.flush()
+        tree = read_xml(f.name, cache=False).get_tree(0)
+
+    # The points of the flat tree are in the order of their paths in the nested point lists.
+    node_map = {path: node_id for node_id, path in enumerate(_paths(tree.points()), start=1)}
+    flat_tree = tree.flat()
+    point_node_ids = range(1, len(flat_tree.values()) + 1)
+    connectivity = determine_flat_tree_connectivity(flat_tree, point_node_ids)
+    element_to_node_map = dict(zip(range(1, len(connectivity) + 1), connectivity))
+    node_to_element_map = reverse_element_to_node_map(element_to_node_map)
+    print(f"points: {len(node_map)}, branches: {len(index_flat_tree_branches(flat_tree, point_node_ids))}")
+
+    def _previous():
+        with mock.patch("mbfxml2ex.zinc.get_elements_for_node_ids", _get_elements_for_node_ids):
+            return _determine_sub_groups(_group_by_parent(node_map), node_to_element_map, element_to_node_map, tree)
+
+    def _indexed():
+        return _determine_sub_groups(index_flat_tree_branches(flat_tree, point_node_ids), node_to_element_map,
+                                     element_to_node_map, tree)
+
+    for name, function in [("previous", _previous), ("branch index", _indexed)]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{name:<13} {elapsed:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
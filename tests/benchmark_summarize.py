@@ -0,0 +1,51 @@
+"""
+Benchmark summarizing a synthetic file against converting it to EX.
+
+Reports the time taken by summarize, by reading the file with read_xml and by writing the EX file with write_ex.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.summary import summarize
+from mbfxml2ex.zinc import write_ex
+
+from synthetic_data import write_synthetic_mbf_xml
+
+
+def _timed(function):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function()
+    return time.perf_counter() - start, result
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark summarizing against converting.")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--contours", type=int, default=500)
+    parser.add_argument("--markers", type=int, default=5000)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_name = write_synthetic_mbf_xml(os.path.join(temp_dir, "summarize.xml"), trees=args.trees,
+                                            contours=args.contours, markers=args.markers)
+        print(f"file size: {os.path.getsize(file_name) / 1e6:.1f} MB")
+        summarize_time, summary = _timed(lambda: summarize(file_name))
+        read_time, data = _timed(lambda: read_xml(file_name, cache=False))
+        write_time, _ = _timed(lambda: write_ex(file_name + ".ex", data))
+        print(f"summarize {summarize_time:>8.3f} s, {summary['points']} points")
+        print(f"read_xml  {read_time:>8.3f} s")
+        print(f"write_ex  {write_time:>8.3f} s")
+        print(f"summarize / conversion: {summarize_time / (read_time + write_time):.2f}")
+
+
+if __name__ == "__main__":
+    main()
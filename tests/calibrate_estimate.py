@@ -0,0 +1,114 @@
+"""
+Fit the cost model of mbfxml2ex.estimate to measured conversions.
+
+Synthetic files dominated by trees, contours, markers, vessels and puncta are converted with
+read_xml and write_ex in a fresh process each, the wall time and peak resident memory of the
+conversions are fitted against the features of the files, see mbfxml2ex.estimate.cost_features.
+The fitted model is printed in the form of DEFAULT_COST_MODEL.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from mbfxml2ex.estimate import estimate, cost_features, COST_FEATURES
+
+from synthetic_data import write_synthetic_mbf_xml, replicate_mbf_xml
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+_CONVERT = """
+import json, resource, sys, time
+start = time.perf_counter()
+from mbfxml2ex.app import read_xml
+from mbfxml2ex.zinc import write_ex
+write_ex(sys.argv[2], read_xml(sys.argv[1], cache=False))
+print(json.dumps({"wall_time": time.perf_counter() - start,
+                  "peak_memory": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+"""
+
+
+def _write_files(directory, scale):
+    files = []
+    for size in [1, 2, 4]:
+        count = size * scale
+        files.append(write_synthetic_mbf_xml(os.path.join(directory, f"trees_{count}.xml"), trees=count,
+                                             branch_depth=5, points_per_branch=10, nested_markers=2))
+        files.append(write_synthetic_mbf_xml(os.path.join(directory, f"deep_trees_{count}.xml"),
+                                             trees=count // 2 + 1, branch_depth=3, points_per_branch=80))
+        files.append(write_synthetic_mbf_xml(os.path.join(directory, f"contours_{count}.xml"), trees=0,
+                                             contours=count * 10, points_per_contour=50))
+        files.append(write_synthetic_mbf_xml(os.path.join(directory, f"markers_{count}.xml"), trees=0,
+                                             markers=count * 20))
+        files.append(replicate_mbf_xml(os.path.join(here, "resources", "vessel_ex_1.xml"),
+                                       os.path.join(directory, f"vessels_{count}.xml"), count))
+        files.append(replicate_mbf_xml(os.path.join(here, "resources", "puncta_small.xml"),
+                                       os.path.join(directory, f"puncta_{count}.xml"), count * 5))
+    files.append(replicate_mbf_xml(os.path.join(here, "resources", "puncta_with_set_prop.xml"),
+                                   os.path.join(directory, "large_puncta.xml"), 2))
+    return files
+
+
+def _measure(file_name):
+    result = subprocess.run([sys.executable, "-c", _CONVERT, file_name, file_name + ".ex"],
+                            check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def _fit(rows, values):
+    # Least squares of the relative error with the costs held non-negative,
+    # negative costs are dropped and the rest refitted.
+    names = ["base"] + COST_FEATURES
+    active = list(range(len(names)))
+    values = np.array(values)
+    matrix = np.array([[1.0] + [row[name] for name in COST_FEATURES] for row in rows]) / values[:, np.newaxis]
+    values = np.ones(len(values))
+    while True:
+        solution = np.linalg.lstsq(matrix[:, active], values, rcond=None)[0]
+        if (solution >= 0).all():
+            break
+        active = [column for column, value in zip(active, solution) if value >= 0]
+
+    costs = dict.fromkeys(names, 0.0)
+    costs.update((names[column], value) for column, value in zip(active, solution))
+    return costs
+
+
+def _format_costs(costs):
+    return "{" + ", ".join(f"{name!r}: {cost:.3g}" for name, cost in costs.items() if cost) + "}"
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description="Calibrate the conversion cost model.")
+    parser.add_argument("--scale", type=int, default=20, help="Number of objects in the smallest files.")
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    rows = []
+    measurements = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file_name in _write_files(temp_dir, args.scale):
+            counts = estimate(file_name)["counts"]
+            measurement = _measure(file_name)
+            rows.append(cost_features(counts))
+            measurements.append(measurement)
+            print(f"{os.path.basename(file_name):<22} {measurement['wall_time']:>8.3f} s "
+                  f"{measurement['peak_memory'] / 1e6:>8.1f} MB")
+
+    time_costs = _fit(rows, [m["wall_time"] for m in measurements])
+    memory_costs = _fit(rows, [m["peak_memory"] for m in measurements])
+    print("DEFAULT_COST_MODEL = MBFCostModel(")
+    print(f"    base_time={time_costs.pop('base'):.3g},")
+    print(f"    time_per_item={_format_costs(time_costs)},")
+    print(f"    base_memory={int(memory_costs.pop('base'))},")
+    print(f"    memory_per_item={_format_costs(memory_costs)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Generators for synthetic MBF XML documents of arbitrary size used by the benchmark scripts.
+"""
+import io
+
+GENERIC_PROPERTIES = ['<property name="Channel"><n>2</n><n>1</n><n>0</n><c>#0000FF</c><n>1</n></property>',
+                      '<property name="GUID"><s>5D56E410EFFD49F38E82C0E11CBFFBCD</s></property>',
+                      '<property name="FillDensity"><n>0</n></property>',
+                      '<property name="zSmear"><n>1</n><n>1</n></property>',
+                      '<property name="Densitometry"><n>0.5</n><n>12</n><n>200</n></property>']
+
+NAMESPACE_ATTRIBUTES = ' xmlns="http://www.mbfbioscience.com/2007/neurolucida"' \
+                       ' xmlns:nl="http://www.mbfbioscience.com/2007/neurolucida"'
+
+
+def _point(index, offset=0.0):
+    return f'<point x="{offset + index * 0.5:.2f}" y="{(index % 97) * 0.25:.2f}" z="{(index % 13) * 1.5:.2f}" d="0.77"/>'
+
+
+def _generic_property_lines(count, indent):
+    return [f'{indent}{GENERIC_PROPERTIES[index % len(GENERIC_PROPERTIES)]}' for index in range(count)]
+
+
+def _marker_lines(index, indent, generic_properties=0):
+    return [f'{indent}<marker type="OpenStar" color="#FF8040" name="Marker {index % 7}" varicosity="false">',
+            *_generic_property_lines(generic_properties, indent + "  "),
+            f'{indent}  {_point(index, 100.0)}',
+            f'{indent}</marker>']
+
+
+def _branch_lines(depth, points_per_branch, counter, nested_markers, indent):
+    lines = []
+    for _ in range(points_per_branch):
+        lines.append(f'{indent}{_point(counter["points"])}')
+        counter["points"] += 1
+
+    if counter["markers"] < nested_markers:
+        lines.extend(_marker_lines(counter["markers"], indent))
+        counter["markers"] += 1
+
+    if depth > 0:
+        for _ in range(2):
+            lines.append(f'{indent}<branch>')
+            lines.extend(_branch_lines(depth - 1, points_per_branch, counter, nested_markers, indent + "  "))
+            lines.append(f'{indent}</branch>')
+
+    return lines
+
+
+def _tree_lines(tree_index, branch_depth, points_per_branch, nested_markers, generic_properties):
+    tree_type = "Dendrite" if tree_index % 2 == 0 else "Axon"
+    counter = {"points": 0, "markers": 0}
+    lines = [f'<tree color="#FF8040" type="{tree_type}" leaf="Normal">',
+             '  <property name="Set"><s>Synthetic tree</s></property>',
+             '  <property name="GUID"><s>5D56E410EFFD49F38E82C0E11CBFFBCD</s></property>',
+             *_generic_property_lines(generic_properties, "  ")]
+    lines.extend(_branch_lines(branch_depth, points_per_branch, counter, nested_markers, "  "))
+    # Any markers that did not fit in a branch are added at the end of the tree.
+    while counter["markers"] < nested_markers:
+        lines.extend(_marker_lines(counter["markers"], "  "))
+        counter["markers"] += 1
+    lines.append('</tree>')
+    return lines
+
+
+def _contour_lines(contour_index, points_per_contour, generic_properties):
+    lines = [f'<contour name="Contour {contour_index % 5}" color="#FFFF00" closed="true" shape="Contour">',
+             '  <property name="GUID"><s>5D56E410EFFD49F38E82C0E11CBFFBCD</s></property>',
+             '  <property name="FillDensity"><n>0</n></property>',
+             *_generic_property_lines(generic_properties, "  "),
+             '  <resolution>0.414635</resolution>']
+    lines.extend(f'  {_point(index, contour_index)}' for index in range(points_per_contour))
+    lines.append('</contour>')
+    return lines
+
+
+def generate_mbf_xml(stream, trees=1, branch_depth=3, points_per_branch=10, nested_markers=0,
+                     contours=0, points_per_contour=20, markers=0, generic_properties=0, namespace=True):
+    """
+    Write a synthetic MBF XML document to the text stream.
+
+    Top level trees, contours and markers get generic_properties extra GUID, Channel, FillDensity,
+    zSmear and Densitometry properties.
+    """
+    stream.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
+    stream.write(f'<mbf version="4.0"{NAMESPACE_ATTRIBUTES if namespace else ""} appname="Synthetic">\n')
+    stream.write('<description><![CDATA[]]></description>\n')
+    stream.write('<filefacts>\n  <sectionmanager currentsection="" sectioninterval="0" startingsection="0"/>\n</filefacts>\n')
+    for index in range(contours):
+        stream.write("\n".join(_contour_lines(index, points_per_contour, generic_properties)) + "\n")
+    for index in range(markers):
+        stream.write("\n".join(_marker_lines(index, "", generic_properties)) + "\n")
+    for index in range(trees):
+        stream.write("\n".join(_tree_lines(index, branch_depth, points_per_branch, nested_markers,
+                                            generic_properties)) + "\n")
+    stream.write('</mbf>\n')
+
+
+def synthetic_mbf_xml(**kwargs):
+    """
+    Return a synthetic MBF XML document as bytes, see generate_mbf_xml for the keyword arguments.
+    """
+    stream = io.StringIO()
+    generate_mbf_xml(stream, **kwargs)
+    return stream.getvalue().encode("iso-8859-1")
+
+
+def write_synthetic_mbf_xml(file_name, **kwargs):
+    """
+    Write a synthetic MBF XML document to file_name, see generate_mbf_xml for the keyword arguments.
+    """
+    with open(file_name, "w", encoding="iso-8859-1") as f:
+        generate_mbf_xml(f, **kwargs)
+
+    return file_name
+
+
+def replicate_mbf_xml(source_file_name, file_name, copies):
+    """
+    Write a copy of the MBF XML document source_file_name to file_name with the content of the
+    document root repeated copies times.
+    """
+    with open(source_file_name, "rb") as f:
+        content = f.read()
+
+    root_start = content.index(b">", content.index(b"<mbf")) + 1
+    root_end = content.rindex(b"</mbf>")
+    with open(file_name, "wb") as f:
+        f.write(content[:root_start])
+        for _ in range(copies):
+            f.write(content[root_start:root_end])
+        f.write(content[root_end:])
+
+    return file_name
@@ -1,14 +1,49 @@
+import io
+import bz2
+import contextlib
+import functools
+import gzip
+import lzma
 import os
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
+
+import numpy as np
+
+from cmlibs.utils.zinc.field import create_field_coordinates, create_field_finite_element
+from cmlibs.utils.zinc.general import create_node as create_zinc_node
+from cmlibs.zinc.context import Context
+from cmlibs.zinc.element import Element
 
 from mbfxml2ex.app import read_xml
-from mbfxml2ex.classes import MBFPoint, MBFData, MBFPropertyVolumeRLE, MBFTree
+from mbfxml2ex.cache import MBFParseCache
+from mbfxml2ex.classes import MBFPoint, MBFData, MBFPropertyVolumeRLE, MBFTree, MBFPointStore, MBFMarker, \
+    MBFPropertyGeneric, get_text_properties
 from mbfxml2ex.definitions import INFOSET_RANK_MAP
+from mbfxml2ex.estimate import estimate, DEFAULT_COST_MODEL
 from mbfxml2ex.exceptions import MBFXMLFile, MBFXMLFormat
-from mbfxml2ex.utilities import extract_vessel_node_locations, is_option
+from mbfxml2ex.filters import MBFObjectFilter
+from mbfxml2ex.index import scan_top_level_elements
+from mbfxml2ex.lazy import LazyMBFData, index_file_name
+from mbfxml2ex.reader import iterate_objects, iterate_top_level_elements, available_backends
+from mbfxml2ex.summary import summarize, summarize_data
+from mbfxml2ex.utilities import extract_vessel_node_locations, is_option, get_elements_for_node_ids, \
+    reverse_element_to_node_map, classify_properties
+from mbfxml2ex.validate import validate
 from mbfxml2ex.zinc import write_ex, determine_tree_connectivity, determine_contour_connectivity, \
-    determine_vessel_connectivity
+    determine_vessel_connectivity, determine_tree_connectivity_with_map, create_nodes, merge_fields_with_nodes, \
+    create_nodes_for_values, \
+    create_nodes_with_fields, create_line_elements, create_line_elements_by_identifier, MBFElementTemplateCache, \
+    MBFGroupBuilder, create_group_elements, create_group_nodes, load, MBFNodeDeduplicator, \
+    classify_tree_branches, _expand_properties, determine_flat_tree_connectivity, \
+    index_flat_tree_branches, create_marker_nodes, _flatten_points
+
+from synthetic_data import synthetic_mbf_xml
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -29,6 +64,197 @@ class NeurolucidaXmlReadTreesTestCase(unittest.TestCase):
         self.assertRaises(MBFXMLFormat, read_xml, not_xml_file)
 
 
+class StreamingReaderTestCase(unittest.TestCase):
+
+    def test_top_level_elements_are_released(self):
+        xml_file = _resource_path("multi_tree.xml")
+        previous_element = None
+        raw_tags = []
+        for raw_tag, element in iterate_top_level_elements(xml_file):
+            if previous_element is not None:
+                self.assertEqual(0, len(previous_element))
+            if raw_tag == "tree":
+                self.assertGreater(len(element), 0)
+            previous_element = element
+            raw_tags.append(raw_tag)
+
+        self.assertEqual(3, raw_tags.count("tree"))
+
+    def test_nested_markers_are_streamed_last(self):
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        raw_tags = [raw_tag for raw_tag, _ in iterate_objects(xml_file)]
+        self.assertEqual(["contour", "marker", "marker", "tree", "marker", "marker", "marker"], raw_tags)
+
+    def test_deeply_nested_markers_are_relocated(self):
+        for namespace in [True, False]:
+            content = synthetic_mbf_xml(trees=2, branch_depth=4, points_per_branch=3, nested_markers=40, namespace=namespace)
+            raw_tags = [raw_tag for raw_tag, _ in iterate_objects(io.BytesIO(content))]
+            self.assertEqual(["tree", "tree"], raw_tags[:2])
+            self.assertEqual(80, raw_tags.count("marker"))
+
+    def test_streaming_not_xml(self):
+        not_xml_file = _resource_path("random_file.txt")
+        self.assertRaises(MBFXMLFormat, list, iterate_objects(not_xml_file))
+
+
+class XmlBackendTestCase(unittest.TestCase):
+
+    def test_backends_agree(self):
+        for file_name in ["tree_contour_with_markers_no_ns.xml", "tracing_vessels_and_markers.xml", "puncta.xml"]:
+            xml_file = _resource_path(file_name)
+            expected = read_xml(xml_file, backend="etree")
+            for backend in available_backends():
+                contents = read_xml(xml_file, backend=backend)
+                self.assertEqual(len(expected), len(contents))
+                self.assertEqual(expected.markers_count(), contents.markers_count())
+                self.assertEqual(expected.trees_count(), contents.trees_count())
+
+    def test_expat_tree_structure(self):
+        xml_file = _resource_path("tree_with_anatomical_terms.xml")
+        neurolucida_data = read_xml(xml_file, backend="expat")
+        tree = neurolucida_data.get_tree(0)
+        self.assertEqual('Dendrite', tree.type())
+        self.assertEqual(4, len(tree.properties([0])))
+        self.assertEqual('Thorasic Sympathetic Trunk', tree.properties([0])[0][1].items()[0])
+
+    def test_expat_vessel(self):
+        etree_contents = read_xml(_resource_path("basic_vessel_version_4.xml"), backend="etree")
+        expat_contents = read_xml(_resource_path("basic_vessel_version_4.xml"), backend="expat")
+        etree_vessel = etree_contents.get_vessel(0)
+        expat_vessel = expat_contents.get_vessel(0)
+        self.assertEqual(etree_vessel['name'], expat_vessel['name'])
+        self.assertEqual(len(etree_vessel['nodes']), len(expat_vessel['nodes']))
+        self.assertEqual(len(extract_vessel_node_locations(etree_vessel)), len(extract_vessel_node_locations(expat_vessel)))
+        self.assertEqual(str(etree_vessel['edges'][-1]['data']), str(expat_vessel['edges'][-1]['data']))
+
+    def test_backends_not_xml(self):
+        not_xml_file = _resource_path("random_file.txt")
+        for backend in available_backends():
+            self.assertRaises(MBFXMLFormat, read_xml, not_xml_file, backend=backend)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, read_xml, _resource_path("multi_tree.xml"), backend="sgml")
+
+
+class ParallelReadTestCase(unittest.TestCase):
+
+    def test_scan_top_level_elements(self):
+        content = synthetic_mbf_xml(trees=2, branch_depth=2, nested_markers=3, contours=2, markers=1)
+        index = scan_top_level_elements(content)
+        self.assertEqual(b'mbf', index.root_tag())
+        self.assertEqual(["description", "filefacts", "contour", "contour", "marker", "tree", "tree"],
+                         [raw_tag for raw_tag, _, _ in index.entries()])
+        _, start, end = index.entries()[-1]
+        self.assertTrue(content[start:end].startswith(b'<tree'))
+        self.assertTrue(content[start:end].endswith(b'</tree>'))
+
+    def test_parallel_read_matches_serial_read(self):
+        for file_name in ["tree_contour_with_markers_no_ns.xml", "multi_tree_with_annotations.xml",
+                          "tracing_vessels_and_markers.xml"]:
+            xml_file = _resource_path(file_name)
+            expected = read_xml(xml_file)
+            contents = read_xml(xml_file, processes=2)
+            self.assertEqual(len(expected), len(contents))
+            self.assertEqual([t.type() for t in expected.get_trees()], [t.type() for t in contents.get_trees()])
+            self.assertEqual([m['name'] for m in expected.get_markers()], [m['name'] for m in contents.get_markers()])
+            self.assertEqual([str(c['data']) for c in expected.get_contours()],
+                             [str(c['data']) for c in contents.get_contours()])
+
+    def test_parallel_read_errors(self):
+        self.assertRaises(MBFXMLFormat, read_xml, _resource_path("random_file.txt"), processes=2)
+        self.assertRaises(MBFXMLFormat, read_xml, _resource_path("three_heart_contours.xml"), processes=2)
+        self.assertRaises(ValueError, read_xml, _resource_path("multi_tree.xml"), processes=-1)
+
+
+class LazyReadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._xml_file = os.path.join(self._temp_dir, "tree_contour_with_markers_no_ns.xml")
+        shutil.copy(_resource_path("tree_contour_with_markers_no_ns.xml"), self._xml_file)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_lazy_read_matches_read(self):
+        expected = read_xml(self._xml_file)
+        contents = read_xml(self._xml_file, lazy=True)
+        self.assertIsInstance(contents, LazyMBFData)
+        self.assertEqual(len(expected), len(contents))
+        self.assertEqual(0, contents.cached_count())
+        self.assertEqual(expected.markers_count(), contents.markers_count())
+        self.assertEqual([m['name'] for m in expected.get_markers()], [m['name'] for m in contents.get_markers()])
+        self.assertEqual(str(expected.get_contour(0)['data']), str(contents.get_contour(0)['data']))
+        self.assertEqual(expected.get_tree(0).type(), contents.get_tree(-1).type())
+
+    def test_bounded_cache(self):
+        contents = LazyMBFData(self._xml_file, cache_size=2)
+        first_marker = contents.get_marker(0)
+        self.assertIs(first_marker, contents.get_marker(0))
+        for index in range(contents.markers_count()):
+            contents.get_marker(index)
+        self.assertEqual(2, contents.cached_count())
+        self.assertIsNot(first_marker, contents.get_marker(0))
+
+    def test_persisted_index(self):
+        LazyMBFData(self._xml_file)
+        self.assertTrue(os.path.exists(index_file_name(self._xml_file)))
+        with open(self._xml_file, "rb") as f:
+            content = f.read()
+        # An index for a file that has changed is not used.
+        with open(self._xml_file, "wb") as f:
+            f.write(content.replace(b"</mbf>", b"<marker type=\"Dot\" color=\"#FF0000\" name=\"Extra\" "
+                                               b"varicosity=\"false\"><point x=\"1\" y=\"2\" z=\"3\" d=\"1\"/>"
+                                               b"</marker></mbf>"))
+        contents = LazyMBFData(self._xml_file)
+        self.assertEqual(6, contents.markers_count())
+        self.assertEqual("Extra", contents.get_marker(2)['name'])
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir)
+
+    def test_cached_read(self):
+        cache = MBFParseCache(self._cache_dir)
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        expected = read_xml(xml_file, cache=cache)
+        self.assertEqual(1, len(cache.entries()))
+        self.assertIsNotNone(cache.load(cache.key(xml_file)))
+
+        contents = read_xml(xml_file, cache=cache)
+        self.assertEqual(len(expected), len(contents))
+        self.assertEqual([m['name'] for m in expected.get_markers()], [m['name'] for m in contents.get_markers()])
+        self.assertEqual(str(expected.get_contour(0)['data']), str(contents.get_contour(0)['data']))
+        self.assertEqual(expected.get_tree(0).properties([]), contents.get_tree(0).properties([]))
+
+    def test_eviction(self):
+        cache = MBFParseCache(self._cache_dir, max_size=1)
+        read_xml(_resource_path("multi_tree.xml"), cache=cache)
+        self.assertEqual(0, len(cache.entries()))
+
+        cache = MBFParseCache(self._cache_dir)
+        for file_name in ["multi_tree.xml", "puncta.xml", "tree_with_markers.xml"]:
+            read_xml(_resource_path(file_name), cache=cache)
+        entries = sorted(cache.entries(), key=lambda entry: entry[2])
+        cache = MBFParseCache(self._cache_dir, max_size=sum(entry[1] for entry in entries[1:]))
+        cache.evict()
+        self.assertEqual(sorted(entries[1:]), sorted(cache.entries()))
+
+    def test_unreadable_entry(self):
+        cache = MBFParseCache(self._cache_dir)
+        xml_file = _resource_path("multi_tree.xml")
+        read_xml(xml_file, cache=cache)
+        with open(cache.entries()[0][0], "wb") as f:
+            f.write(b"not a cache entry")
+        self.assertIsNone(cache.load(cache.key(xml_file)))
+        self.assertEqual(3, read_xml(xml_file, cache=cache).trees_count())
+
+
 class NeurolucidaXmlReadTreesWithAnatomicalTermsTestCase(unittest.TestCase):
 
     def test_read_tree_with_anatomical_terms(self):
@@ -351,6 +577,264 @@ class MBFPunctaTestCase(unittest.TestCase):
             self.assertEqual(1021, len(lines))
 
 
+class LazyPropertiesTestCase(unittest.TestCase):
+
+    def test_lazy_generic_property(self):
+        prop = MBFPropertyGeneric("Channel", raw_items=("n", "2", "c", "#0000FF", "s", None))
+        self.assertEqual([{'n': 2.0}, {'c': '#0000FF'}, {'s': None}], prop.items())
+
+    def test_lazy_properties_match_eager_properties(self):
+        xml_file = _resource_path("contour_with_multiple_set_properties.xml")
+        for backend in available_backends():
+            expected = read_xml(xml_file, backend=backend)
+            contents = read_xml(xml_file, backend=backend, lazy_properties=True)
+            for index in range(expected.contours_count()):
+                expected_properties = expected.get_contour(index)['properties']
+                properties = contents.get_contour(index)['properties']
+                self.assertEqual(get_text_properties(expected_properties), get_text_properties(properties))
+                self.assertEqual([repr(p) for p in expected_properties], [repr(p) for p in properties])
+
+
+class CompressedInputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        with open(_resource_path("tree_contour_with_markers_no_ns.xml"), "rb") as f:
+            self._content = f.read()
+        self._expected = read_xml(_resource_path("tree_contour_with_markers_no_ns.xml"), cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _assert_same_counts(self, contents):
+        self.assertEqual(self._expected.trees_count(), contents.trees_count())
+        self.assertEqual(self._expected.contours_count(), contents.contours_count())
+        self.assertEqual(self._expected.markers_count(), contents.markers_count())
+
+    def test_read_compressed_files(self):
+        for extension, compress in [(".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress)]:
+            xml_file = os.path.join(self._temp_dir, "tracing.xml" + extension)
+            with open(xml_file, "wb") as f:
+                f.write(compress(self._content))
+            for backend in available_backends():
+                self._assert_same_counts(read_xml(xml_file, backend=backend, cache=False))
+            self._assert_same_counts(read_xml(xml_file, processes=2, cache=False))
+
+    def test_read_file_objects(self):
+        self._assert_same_counts(read_xml(io.BytesIO(self._content)))
+        self._assert_same_counts(read_xml(io.BytesIO(gzip.compress(self._content)), backend="expat"))
+        with open(_resource_path("tree_contour_with_markers_no_ns.xml"), "rb") as f:
+            contents = read_xml(f, object_filter=MBFObjectFilter(kinds=["marker"]))
+        self.assertEqual(self._expected.markers_count(), contents.markers_count())
+        self.assertRaises(ValueError, read_xml, io.BytesIO(self._content), lazy=True)
+
+    def test_read_stdin(self):
+        stdin = io.TextIOWrapper(io.BytesIO(lzma.compress(self._content)))
+        with mock.patch("sys.stdin", stdin):
+            self._assert_same_counts(read_xml("-"))
+
+
+class EstimateTestCase(unittest.TestCase):
+
+    def test_estimate_counts(self):
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        contents = read_xml(xml_file, cache=False)
+        result = estimate(xml_file)
+        counts = result["counts"]
+        self.assertEqual(contents.trees_count(), counts["trees"])
+        self.assertEqual(contents.contours_count(), counts["contours"])
+        self.assertEqual(contents.markers_count(), counts["markers"])
+        self.assertEqual(os.path.getsize(xml_file), result["file_size"])
+        self.assertGreater(result["peak_memory"], DEFAULT_COST_MODEL.peak_memory(dict.fromkeys(counts, 0)))
+        self.assertGreater(result["wall_time"], 0.0)
+
+        with mock.patch("mbfxml2ex.estimate.SCAN_CHUNK_SIZE", 4099):
+            self.assertEqual(counts, estimate(xml_file)["counts"])
+        with open(xml_file, "rb") as f:
+            self.assertEqual(counts, estimate(io.BytesIO(bz2.compress(f.read())))["counts"])
+
+    def test_estimate_puncta(self):
+        counts = estimate(_resource_path("puncta_small.xml"))["counts"]
+        self.assertEqual(2, counts["puncta"])
+        self.assertEqual(2 * 2 * 2 + 2 * 3 * 2, counts["puncta_voxels"])
+
+
+class ValidateTestCase(unittest.TestCase):
+
+    def test_validate_reports_every_error(self):
+        document = b"""<?xml version="1.0" encoding="ISO-8859-1"?>
+<mbf version="4.0">
+<tree color="#FF0000" type="Dendrite" leaf="Normal">
+  <bogus/>
+  <point x="1" y="oops" z="3" d="1"/>
+  <branch>
+    <property name="Mystery"><s>x</s></property>
+  </branch>
+</tree>
+<contour name="Heart" closed="true">
+  <point x="1" y="2" z="3" d="1"/>
+</contour>
+<vessel version="3" color="#00FF00" type="directed" name="Vessel">
+  <nodes><node id="0"></node></nodes>
+</vessel>
+</mbf>
+"""
+        errors = validate(io.BytesIO(document))
+        self.assertEqual([4, 5, 7, 10, 14], [error.line() for error in errors])
+        self.assertEqual("XML format violation unknown tag 'bogus'.", errors[0].message())
+        self.assertEqual("Unhandled property 'Mystery'", errors[2].message())
+        self.assertEqual("Missing attribute 'color'.", errors[3].message())
+
+    def test_validate_files(self):
+        self.assertEqual([], validate(_resource_path("tree_contour_with_markers_no_ns.xml")))
+        self.assertEqual([], validate(_resource_path("tracing_vessels_and_markers.xml")))
+        errors = validate(_resource_path("random_file.txt"))
+        self.assertEqual(1, len(errors))
+        self.assertEqual(1, errors[0].line())
+
+    def test_validate_does_not_import_zinc(self):
+        script = "import sys; from mbfxml2ex.validate import validate; validate(sys.argv[1]); " \
+                 "print(any(name.startswith('cmlibs') for name in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", script, _resource_path("vagus_tracing.xml")],
+                                check=True, capture_output=True, text=True)
+        self.assertEqual("False", result.stdout.strip())
+
+
+class SummarizeTestCase(unittest.TestCase):
+
+    def test_summarize_geometry(self):
+        document = b"""<?xml version="1.0" encoding="ISO-8859-1"?>
+<mbf version="4.0">
+<tree color="#FF0000" type="Axon" leaf="Normal">
+  <point x="0" y="0" z="0" d="1"/>
+  <point x="3" y="0" z="0" d="1"/>
+  <branch>
+    <point x="3" y="4" z="0" d="1"/>
+  </branch>
+  <branch>
+    <point x="3" y="0" z="2" d="1"/>
+    <point x="3" y="0" z="5" d="1"/>
+  </branch>
+</tree>
+<contour color="#00FF00" closed="true" name="Square">
+  <point x="0" y="0" z="-1" d="1"/>
+  <point x="1" y="0" z="-1" d="1"/>
+  <point x="1" y="1" z="-1" d="1"/>
+  <point x="0" y="1" z="-1" d="1"/>
+</contour>
+</mbf>
+"""
+        summary = summarize(io.BytesIO(document))
+        self.assertEqual(1, summary["trees"]["count"])
+        self.assertEqual(2, summary["trees"]["branches"])
+        self.assertEqual(5, summary["trees"]["points"])
+        self.assertAlmostEqual(12.0, summary["trees"]["length"])
+        self.assertEqual({"Axon": 1}, summary["trees"]["by_type"])
+        self.assertEqual([{"type": "Axon", "class": None, "branches": 2, "points": 5, "length": 12.0}],
+                         summary["trees"]["per_tree"])
+        self.assertAlmostEqual(4.0, summary["contours"]["length"])
+        self.assertEqual({"Square": 1}, summary["contours"]["by_name"])
+        self.assertEqual(9, summary["points"])
+        self.assertAlmostEqual(16.0, summary["length"])
+        self.assertEqual({"min": [0.0, 0.0, -1.0], "max": [3.0, 4.0, 5.0]}, summary["bounding_box"])
+        self.assertIsNone(summary["markers"]["bounding_box"])
+
+    def test_summarize_puncta(self):
+        summary = summarize(_resource_path("puncta_small.xml"))
+        self.assertEqual(2, summary["markers"]["puncta"]["count"])
+        self.assertEqual(estimate(_resource_path("puncta_small.xml"))["counts"]["puncta_voxels"],
+                         summary["markers"]["puncta"]["volume_voxels"])
+
+    def test_summarize_tree_without_point_store(self):
+        tree = MBFTree({'points': [MBFPoint(0, 0, 0, 2),
+                                   {'points': [MBFPoint(3, 0, 0, 7)], 'attributes': {}, 'properties': []},
+                                   {'points': [MBFPoint(0, 4, 0, 5.7)], 'attributes': {}, 'properties': []}],
+                        'attributes': {'color': '#000000'}, 'properties': []})
+        data = MBFData()
+        data.add_tree(tree)
+        summary = summarize_data(data)
+        self.assertEqual(2, summary["trees"]["branches"])
+        self.assertAlmostEqual(7.0, summary["trees"]["length"])
+
+    def test_summarize_contour_and_marker_without_point_store(self):
+        data = MBFData()
+        data.add_contour({'colour': '#00ff00', 'rgb': [0, 1, 0], 'closed': True, 'name': 'Heart',
+                          'data': [MBFPoint(0, 0, 0, 1), MBFPoint(3, 0, 0, 1), MBFPoint(3, 4, 0, 1)]})
+        data.add_marker({'colour': '#00ff00', 'rgb': [0, 1, 0], 'name': 'Marker', 'properties': [],
+                         'data': [MBFPoint(1, 2, 3, 1), MBFPoint(-1, 0, 5, 1)]})
+        summary = summarize_data(data)
+        self.assertEqual(3, summary["contours"]["points"])
+        self.assertAlmostEqual(12.0, summary["contours"]["length"])
+        self.assertEqual(2, summary["markers"]["points"])
+        self.assertEqual({"min": [-1.0, 0.0, 3.0], "max": [1.0, 2.0, 5.0]}, summary["markers"]["bounding_box"])
+
+    def test_summarize_vessel_without_point_store(self):
+        vessel, _ = _create_advanced_vessel()
+        data = MBFData()
+        data.add_vessel(vessel)
+        summary = summarize_data(data)
+        edge_points = [np.array([point.coordinates() for point in edge['data']]) for edge in vessel['edges']]
+        self.assertEqual(len(vessel['nodes']) + sum(len(points) for points in edge_points),
+                         summary["vessels"]["points"])
+        self.assertAlmostEqual(sum(np.linalg.norm(np.diff(points, axis=0), axis=1).sum() for points in edge_points),
+                               summary["vessels"]["length"])
+
+    def test_summarize_data(self):
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        contents = read_xml(xml_file, cache=False)
+        summary = summarize(xml_file)
+        self.assertEqual(summary, summarize_data(contents))
+        self.assertEqual(contents.trees_count(), summary["trees"]["count"])
+        self.assertEqual(contents.contours_count(), summary["contours"]["count"])
+        self.assertEqual(contents.markers_count(), summary["markers"]["count"])
+        self.assertEqual(summary, summarize(xml_file, backend="etree"))
+
+
+class ObjectFilterTestCase(unittest.TestCase):
+
+    def test_filter_kinds(self):
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        contents = read_xml(xml_file)
+        trees = read_xml(xml_file, object_filter=MBFObjectFilter(kinds=["tree"]))
+        self.assertEqual(contents.trees_count(), trees.trees_count())
+        self.assertEqual(0, trees.contours_count())
+        self.assertEqual(0, trees.markers_count())
+
+        markers = read_xml(xml_file, object_filter=MBFObjectFilter(kinds=["marker"]))
+        self.assertEqual(0, markers.trees_count())
+        self.assertEqual(0, markers.contours_count())
+        self.assertEqual(5, markers.markers_count())
+        self.assertEqual([m['name'] for m in contents.get_markers()], [m['name'] for m in markers.get_markers()])
+
+    def test_filter_names(self):
+        xml_file = _resource_path("complex_heart_contours.xml")
+        contents = read_xml(xml_file, object_filter=MBFObjectFilter(contour_names=["Heart (7088)"]))
+        self.assertTrue(contents.contours_count())
+        self.assertTrue(all(c['name'] == "Heart (7088)" for c in contents.get_contours()))
+
+        contents = read_xml(_resource_path("multi_tree.xml"), object_filter=MBFObjectFilter(tree_types=["Axon"]))
+        self.assertEqual(0, contents.trees_count())
+        contents = read_xml(_resource_path("multi_tree.xml"), object_filter=MBFObjectFilter(tree_types=["Dendrite"]))
+        self.assertEqual(3, contents.trees_count())
+
+    def test_filter_matches_full_read(self):
+        object_filter = MBFObjectFilter(kinds=["contour", "marker"], marker_names=["Marker 1", "Marker 3"])
+        xml_file = _resource_path("tree_contour_with_markers_no_ns.xml")
+        for backend in available_backends():
+            expected = [(raw_tag, o['name']) for raw_tag, o in iterate_objects(xml_file, backend)
+                        if object_filter.accepts_object(raw_tag, o)]
+            objects = iterate_objects(xml_file, backend, object_filter=object_filter)
+            self.assertEqual(expected, [(raw_tag, o['name']) for raw_tag, o in objects])
+            with open(xml_file, "rb") as f:
+                objects = iterate_objects(io.BytesIO(f.read()), backend, object_filter=object_filter)
+            self.assertEqual(expected, [(raw_tag, o['name']) for raw_tag, o in objects])
+
+    def test_filter_errors(self):
+        self.assertRaises(ValueError, MBFObjectFilter, kinds=["neuron"])
+        self.assertRaises(MBFXMLFormat, read_xml, _resource_path("three_heart_contours.xml"),
+                          object_filter=MBFObjectFilter(contour_names=["Heart"]))
+
+
 class MBFPropertyVolumeRLETestCase(unittest.TestCase):
 
     def test_volume_rle(self):
@@ -381,6 +865,88 @@ class MBFPointTestCase(unittest.TestCase):
         p = MBFPoint(6, 3, 4, 9)
         self.assertListEqual([6, 3, 4, 4.5], p.get())
 
+    def test_point_has_no_instance_dict(self):
+        p = MBFPoint(1, 2, 3, 4)
+        self.assertFalse(hasattr(p, '__dict__'))
+        self.assertFalse(hasattr(MBFPoint.view(p.store(), 0), '__dict__'))
+
+    def test_point_node_data_setters(self):
+        p = MBFPoint(1, 2, 3, 4)
+        other = MBFPoint(5, 6, 7, 8)
+        self.assertEqual(['coordinates', 'radius'], p.get_field_names())
+        self.assertEqual([], p.get_time_sequence())
+        p.set_field_names(['coordinates'])
+        p.set_time_sequence([0.0, 1.0])
+        p.set_time_sequence_field_names(['coordinates'])
+        self.assertEqual(['coordinates'], p.get_field_names())
+        self.assertEqual([0.0, 1.0], p.get_time_sequence())
+        self.assertEqual(['coordinates'], p.get_time_sequence_field_names())
+        # Setting the values of one point leaves the others with the defaults.
+        self.assertEqual(['coordinates', 'radius'], other.get_field_names())
+        self.assertEqual([], other.get_time_sequence_field_names())
+        self.assertRaises(NotImplementedError, p.set_field_names, ['rgb'])
+
+
+class MBFPointStoreTestCase(unittest.TestCase):
+
+    def test_point_store(self):
+        store = MBFPointStore()
+        self.assertEqual(0, store.add(1, 2, 3, 4))
+        self.assertEqual(1, store.add(5, 6, 7, 8))
+        self.assertEqual(2, len(store))
+        self.assertEqual((2, 4), store.as_array().shape)
+        self.assertListEqual([2.0, 4.0], store.radius().tolist())
+        self.assertListEqual([5, 6, 7], store.point(1).coordinates())
+
+        points = store.points()
+        self.assertEqual(2, len(points))
+        self.assertListEqual([1, 2, 3, 2], points[0].get())
+        self.assertListEqual([5, 6, 7, 4], points[-1].get())
+        self.assertEqual(1, len(points[1:]))
+
+    def test_contour_data_view(self):
+        neurolucida_data = read_xml(_resource_path("scale_example.xml"))
+        raw_data = neurolucida_data.get_contour(0)['data']
+        values = raw_data.as_array()
+        self.assertEqual(len(raw_data), values.shape[0])
+        self.assertAlmostEqual(8794.46, values[0, 0])
+
+    def test_tree_points_view(self):
+        neurolucida_data = read_xml(_resource_path("multi_tree.xml"))
+        tree = neurolucida_data.get_tree(0)
+
+        def _flatten(points):
+            return [p for item in points for p in (_flatten(item) if isinstance(item, list) else [item])]
+
+        flat_points = _flatten(tree.points())
+        self.assertEqual(len(tree.point_store()), len(flat_points))
+        self.assertListEqual(tree.point_store().coordinates()[-1].tolist(), flat_points[-1].coordinates())
+
+
+class MBFRecordTestCase(unittest.TestCase):
+
+    def test_dict_style_access(self):
+        marker = MBFMarker(name="Marker 1", properties=[])
+        self.assertEqual("Marker 1", marker['name'])
+        self.assertIn('properties', marker)
+        self.assertNotIn('data', marker)
+        marker['data'] = []
+        self.assertEqual({'name': "Marker 1", 'properties': [], 'data': []}, marker)
+        self.assertEqual("Marker 1", marker.get('name'))
+        self.assertRaises(KeyError, marker.__setitem__, 'unknown', 1)
+        self.assertFalse(hasattr(marker, '__dict__'))
+
+    def test_shared_strings(self):
+        neurolucida_data = read_xml(_resource_path("complex_heart_contours.xml"))
+        first_contour = neurolucida_data.get_contour(0)
+        second_contour = neurolucida_data.get_contour(1)
+        self.assertEqual("Heart (7088)", second_contour['name'])
+        self.assertIs(first_contour['name'], second_contour['name'])
+        self.assertIs(first_contour['colour'], second_contour['colour'])
+        self.assertEqual(first_contour['rgb'], second_contour['rgb'])
+        first_contour['rgb'][0] = 0.5
+        self.assertNotEqual(first_contour['rgb'], second_contour['rgb'])
+
 
 class DetermineTreeConnectivityTestCase(unittest.TestCase):
 
@@ -403,6 +969,94 @@ class DetermineTreeConnectivityTestCase(unittest.TestCase):
                               [9, 10], [6, 11], [11, 12], [12, 13], [3, 14], [14, 15]],
                              determine_tree_connectivity(tree)[0])
 
+    def test_determine_connectivity_with_map(self):
+        tree = [MBFPoint(3, 3, 4, 2), [MBFPoint(2, 1, 5, 7), MBFPoint(2, 2, 5, 7)], [MBFPoint(2, 4, 8, 5.7)]]
+        node_map = {(0,): 1, (1, 0): 2, (1, 1): 3, (2, 0): 4}
+        self.assertListEqual(determine_tree_connectivity(tree)[0], determine_tree_connectivity_with_map(tree, node_map))
+        # A branch starting with a branch joins its first points to the point at the parent path.
+        branch = [[MBFPoint(1, 0, 0)], MBFPoint(2, 0, 0)]
+        node_map = {(0,): 1, (1, 0, 0): 2, (1, 1): 3}
+        self.assertListEqual([[1, 2], [1, 3]], determine_tree_connectivity_with_map(branch, node_map, [1], (0,)))
+
+    def test_create_nodes(self):
+        context = Context("test")
+        field_module = context.getDefaultRegion().getFieldmodule()
+        fields = [create_field_coordinates(field_module),
+                  create_field_finite_element(field_module, 'radius', 1, type_coordinate=False)]
+        dupe_watch = MBFNodeDeduplicator()
+        node_map = {}
+        tree = [MBFPoint(0, 0, 0), [MBFPoint(1, 0, 0), MBFPoint(0, 0, 0)]]
+        self.assertEqual([1, 2], sorted(create_nodes(field_module, tree, path=[3], node_map=node_map,
+                                                     dupe_watch=dupe_watch)))
+        self.assertEqual({(3, 0): 1, (3, 1, 0): 2, (3, 1, 1): 1}, node_map)
+        # Points matching the nodes of an earlier call share them.
+        self.assertEqual([2, 3], sorted(create_nodes(field_module, [MBFPoint(1, 0, 0), MBFPoint(2, 0, 0)],
+                                                     dupe_watch=dupe_watch)))
+        self.assertTrue(all(field.isValid() for field in fields))
+
+
+class MBFTreeTestCase(unittest.TestCase):
+
+    def test_branch_properties(self):
+        for file_name in ["large_tree_with_tree_order_prop.xml", "tree_with_set_property.xml", "vagus_tracing.xml"]:
+            for tree in read_xml(_resource_path(file_name)).get_trees():
+                flat_tree = tree.flat()
+                branch_index = index_flat_tree_branches(flat_tree, range(len(flat_tree.values())))
+                classified_branches = classify_tree_branches(tree)
+                for branch_path in branch_index:
+                    properties, metadata, unknown, group_primary_name = classify_properties(
+                        tree.properties(branch_path + (0,)), INFOSET_RANK_MAP)
+                    self.assertEqual((_expand_properties(properties), unknown), classified_branches[branch_path])
+
+    def test_flat_tree(self):
+        for file_name in ["large_tree_with_tree_order_prop.xml", "tree_with_set_property.xml", "vagus_tracing.xml"]:
+            for tree in read_xml(_resource_path(file_name)).get_trees():
+                tree_data = tree.points()
+                paths = []
+                points = []
+                _flatten_points(tree_data, (), paths, points)
+                flat_tree = tree.flat()
+                point_node_ids = list(range(1, len(paths) + 1))
+                self.assertEqual([point.get() for point in points], flat_tree.values().tolist())
+                # The tree numbers its points in the same order as the flat tree.
+                self.assertEqual(determine_tree_connectivity(tree_data)[0],
+                                 determine_flat_tree_connectivity(flat_tree, point_node_ids))
+                branch_index = {}
+                for path, node_id in zip(paths, point_node_ids):
+                    branch_index.setdefault(path[:-1], []).append(node_id)
+                self.assertEqual(list(branch_index.items()),
+                                 list(index_flat_tree_branches(flat_tree, point_node_ids).items()))
+
+    def test_flat_tree_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        branch = {'points': [MBFPoint(depth, 0, 0, 1)], 'attributes': {}, 'properties': []}
+        for level in reversed(range(depth)):
+            branch = {'points': [MBFPoint(level, 0, 0, 1), branch], 'attributes': {}, 'properties': []}
+        flat_tree = MBFTree(branch).flat()
+        self.assertEqual(list(range(depth + 1)), flat_tree.values()[:, 0].tolist())
+        self.assertEqual(list(range(-1, depth)), flat_tree.parents().tolist())
+        self.assertEqual(list(range(depth + 1)), flat_tree.branch_ids().tolist())
+        self.assertEqual(depth, len(flat_tree.branch_paths()[-1]))
+
+    def test_parse_tree_deeper_than_recursion_limit(self):
+        depth = sys.getrecursionlimit() + 100
+        lines = ['<?xml version="1.0" encoding="ISO-8859-1"?>',
+                 '<mbf version="4.0" xmlns="http://www.mbfbioscience.com/2007/neurolucida">',
+                 '<tree color="#FF0000" type="Axon" leaf="Normal">',
+                 *(f'<point x="{level}" y="0" z="0" d="1"/><branch>' for level in range(depth)),
+                 f'<point x="{depth}" y="0" z="0" d="1"/>', '</branch>' * depth, '</tree>', '</mbf>']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            xml_file = os.path.join(temp_dir, "deep_tree.xml")
+            with open(xml_file, "w") as f:
+                f.write("\n".join(lines))
+            for backend in [None, "expat"]:
+                context = Context("test")
+                region = context.getDefaultRegion()
+                load(region, read_xml(xml_file, backend, cache=False), None)
+                field_module = region.getFieldmodule()
+                self.assertEqual(depth + 1, field_module.findNodesetByName('nodes').getSize())
+                self.assertEqual(depth, field_module.findMeshByDimension(1).getSize())
+
 
 class DetermineContourConnectivityTestCase(unittest.TestCase):
 
@@ -423,6 +1077,266 @@ class DetermineContourConnectivityTestCase(unittest.TestCase):
         self.assertListEqual([[1, 2], [2, 3], [3, 1]], node_ids)
 
 
+class BulkZincCreationTestCase(unittest.TestCase):
+
+    def _region_text(self, create):
+        context = Context("test")
+        region = context.getDefaultRegion()
+        field_module = region.getFieldmodule()
+        # Unmanaged fields only live as long as a reference to them.
+        fields = [create_field_coordinates(field_module),
+                  create_field_finite_element(field_module, 'radius', 1, type_coordinate=False),
+                  create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False),
+                  create_field_finite_element(field_module, 'resolution', 1, type_coordinate=False)]
+        node_map = {}
+        node_identifiers = create(field_module, node_map)
+        stream_information = region.createStreaminformationRegion()
+        memory_resource = stream_information.createStreamresourceMemory()
+        region.write(stream_information)
+        self.assertTrue(all(field.isValid() for field in fields))
+        return memory_resource.getBuffer()[1], node_map, sorted(node_identifiers)
+
+    def test_same_nodes_as_merged_fields(self):
+        tree = read_xml(_resource_path("tree_with_markers.xml")).get_tree(0).points()
+        field_information = {'rgb': [1.0, 0.5, 0.0], 'resolution': -1}
+
+        def _merged(field_module, node_map):
+            paths = []
+            points = []
+            _flatten_points(tree, (), paths, points)
+            coordinates_nodes = {}
+            for path, point in zip(paths, points):
+                coordinates = tuple(point.coordinates())
+                if coordinates not in coordinates_nodes:
+                    coordinates_nodes[coordinates] = create_zinc_node(field_module, point)
+                node_map[path] = coordinates_nodes[coordinates]
+            node_identifiers = list(coordinates_nodes.values())
+            merge_fields_with_nodes(field_module, node_identifiers, field_information)
+            return node_identifiers
+
+        def _bulk(field_module, node_map):
+            return create_nodes_with_fields(field_module, tree, field_information, node_map=node_map)
+
+        self.assertEqual(self._region_text(_merged), self._region_text(_bulk))
+
+    def test_elements_by_identifier(self):
+        flat_tree = read_xml(_resource_path("tree_with_markers.xml")).get_tree(0).flat()
+        field_names = ['coordinates', 'radius', 'rgb']
+
+        def _create(create_elements):
+            def _create_nodes_and_elements(field_module, _):
+                point_node_ids = create_nodes_for_values(field_module, flat_tree.values(), {'rgb': [1.0, 0.5, 0.0]})
+                node_identifiers = set(point_node_ids)
+                connectivity = determine_flat_tree_connectivity(flat_tree, point_node_ids)
+                self.assertEqual(list(range(1, len(connectivity) + 1)),
+                                 list(create_elements(field_module, connectivity, field_names)))
+                return node_identifiers
+            return _create_nodes_and_elements
+
+        self.assertEqual(self._region_text(_create(create_line_elements)),
+                         self._region_text(_create(create_line_elements_by_identifier)))
+
+    def test_elements_by_identifier_in_use(self):
+        def _create(field_module, _):
+            create_nodes_with_fields(field_module, [MBFPoint(0, 0, 0), MBFPoint(1, 0, 0), MBFPoint(2, 0, 0)], {})
+            mesh = field_module.findMeshByDimension(1)
+            element_template = mesh.createElementtemplate()
+            element_template.setElementShapeType(Element.SHAPE_TYPE_LINE)
+            self.assertTrue(mesh.createElement(2, element_template).isValid())
+            field_names = ['coordinates']
+            self.assertEqual([1, 3], create_line_elements_by_identifier(field_module, [[1, 2], [2, 3]], field_names))
+            self.assertEqual(range(4, 5), create_line_elements_by_identifier(field_module, [[1, 3]], field_names))
+            return []
+
+        self._region_text(_create)
+
+    def test_element_template_cache(self):
+        def _create(field_module, _):
+            create_nodes_with_fields(field_module, [MBFPoint(0, 0, 0), MBFPoint(1, 0, 0), MBFPoint(2, 0, 0)], {})
+            element_templates = MBFElementTemplateCache(field_module)
+            field_names = ['coordinates', 'time']
+            element_template = element_templates.element_template(Element.SHAPE_TYPE_LINE, field_names)
+            self.assertEqual(element_template, element_templates.element_template(Element.SHAPE_TYPE_LINE, field_names))
+            create_line_elements_by_identifier(field_module, [[1, 2]], field_names, element_templates)
+
+            time_field = create_field_finite_element(field_module, 'time', 1, type_coordinate=False)
+            self.assertNotEqual(element_template, element_templates.element_template(Element.SHAPE_TYPE_LINE,
+                                                                                     field_names))
+            create_line_elements_by_identifier(field_module, [[2, 3]], field_names, element_templates)
+            mesh = element_templates.mesh()
+            self.assertFalse(mesh.findElementByIdentifier(1).getElementfieldtemplate(time_field, -1).isValid())
+            self.assertTrue(mesh.findElementByIdentifier(2).getElementfieldtemplate(time_field, -1).isValid())
+            return []
+
+        self._region_text(_create)
+
+    def test_group_builder(self):
+        points = [MBFPoint(0, 0, 0), MBFPoint(1, 0, 0), MBFPoint(2, 0, 0), MBFPoint(3, 0, 0)]
+
+        def _create(add_elements, add_nodes):
+            add_elements('part', [1, 1, 2])
+            add_elements('part', range(2, 3))
+            add_nodes('part', [1, 2, 2, 3])
+            add_elements('empty', [])
+            add_elements('all', range(1, 4))
+            add_nodes('all', [4, 3, 2, 1])
+
+        def _one_at_a_time(field_module, _):
+            node_identifiers = create_nodes_with_fields(field_module, points, {})
+            create_line_elements_by_identifier(field_module, [[1, 2], [2, 3], [3, 4]], ['coordinates'])
+            _create(functools.partial(create_group_elements, field_module),
+                    functools.partial(create_group_nodes, field_module))
+            return node_identifiers
+
+        def _built(field_module, _):
+            node_identifiers = create_nodes_with_fields(field_module, points, {})
+            create_line_elements_by_identifier(field_module, [[1, 2], [2, 3], [3, 4]], ['coordinates'])
+            group_builder = MBFGroupBuilder(field_module)
+            _create(group_builder.add_elements, group_builder.add_nodes)
+            group_builder.flush()
+            mesh = field_module.findMeshByDimension(1)
+            mesh_group = field_module.findFieldByName('part').castGroup().getMeshGroup(mesh)
+            self.assertEqual(2, mesh_group.getSize())
+            return node_identifiers
+
+        self.assertEqual(self._region_text(_one_at_a_time), self._region_text(_built))
+
+    def test_change_cache(self):
+        data = read_xml(_resource_path("tree_with_markers.xml"))
+
+        def _loaded_text(options):
+            context = Context("test")
+            region = context.getDefaultRegion()
+            load(region, data, options)
+            stream_information = region.createStreaminformationRegion()
+            memory_resource = stream_information.createStreamresourceMemory()
+            region.write(stream_information)
+            return memory_resource.getBuffer()[1]
+
+        self.assertEqual(_loaded_text(None), _loaded_text({'change_cache': 'call'}))
+        self.assertEqual(_loaded_text(None), _loaded_text({'change_cache': 'load'}))
+        self.assertRaises(ValueError, _loaded_text, {'change_cache': 'object'})
+
+    def test_node_deduplicator(self):
+        coordinates = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0], [1.0005, 0.0, 0.0],
+                                [-0.0, 0.0, 0.0], [0.9996, 0.0, 0.0]])
+
+        def _match(deduplicator, rows):
+            return deduplicator.match(rows, lambda index: f"node {index}")
+
+        self.assertEqual(['node 0', 'node 1', 'node 0', 'node 3', 'node 4', 'node 5'],
+                         _match(MBFNodeDeduplicator(), coordinates))
+        self.assertEqual(['node 0', 'node 1', 'node 0', 'node 1', 'node 0', 'node 1'],
+                         _match(MBFNodeDeduplicator(1e-3), coordinates))
+        shared = MBFNodeDeduplicator(1e-3)
+        self.assertEqual(['node 0', 'node 1'], _match(shared, coordinates[:2]))
+        self.assertEqual(['node 1', 'node 0', 'node 2'], _match(shared, np.vstack([coordinates[3:5], [0.0, 0.0, 2.0]])))
+        self.assertRaises(ValueError, MBFNodeDeduplicator, -1.0)
+        # Points far apart must not share a grid cell when the cell index would overflow.
+        self.assertRaises(ValueError, _match, MBFNodeDeduplicator(1e-300), np.array([[1.0, 0.0, 0.0]]))
+        self.assertRaises(ValueError, _match, MBFNodeDeduplicator(1e-3), np.array([[np.inf, 0.0, 0.0]]))
+        self.assertEqual(['node 0', 'node 1'], _match(MBFNodeDeduplicator(1e-12), np.array([[1e6, 0.0, 0.0],
+                                                                                         [-1e6, 0.0, 0.0]])))
+
+    def test_share_nodes(self):
+        data = MBFData()
+        for end in [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]:
+            data.add_tree(MBFTree({'points': [MBFPoint(0.0, 0.0, 0.0, 1.0), MBFPoint(*end, 1.0)],
+                                   'attributes': {'color': '#000000'}, 'properties': []}))
+
+        def _node_count(options):
+            context = Context("test")
+            region = context.getDefaultRegion()
+            with contextlib.redirect_stdout(io.StringIO()):
+                load(region, data, options)
+            return region.getFieldmodule().findNodesetByName('nodes').getSize()
+
+        self.assertEqual(4, _node_count(None))
+        self.assertEqual(3, _node_count({'share_nodes': True}))
+
+    def test_object_constant_fields(self):
+        def _loaded(file_name, options):
+            context = Context("test")
+            region = context.getDefaultRegion()
+            with contextlib.redirect_stdout(io.StringIO()):
+                load(region, read_xml(_resource_path(file_name)), options)
+            field_module = region.getFieldmodule()
+            field_cache = field_module.createFieldcache()
+            element_values = []
+            for field_name, components in [('rgb', 3), ('resolution', 1)]:
+                field = field_module.findFieldByName(field_name)
+                element_iterator = field_module.findMeshByDimension(1).createElementiterator()
+                element = element_iterator.next()
+                while element.isValid():
+                    field_cache.setMeshLocation(element, [0.5])
+                    result, values = field.evaluateReal(field_cache, components)
+                    element_values.append(values if result == 1 else None)
+                    element = element_iterator.next()
+            nodes = field_module.findNodesetByName('nodes')
+            field_cache.setNode(nodes.findNodeByIdentifier(1))
+            return element_values, nodes.getSize(), field_module.findFieldByName('rgb').isDefinedAtLocation(field_cache)
+
+        for file_name in ["tree_with_markers.xml", "basic_vessel_version_4.xml", "contour_with_only_one_point.xml"]:
+            node_values, node_count, node_rgb = _loaded(file_name, None)
+            object_values, object_count, object_rgb = _loaded(file_name, {'constant_fields': 'object'})
+            self.assertEqual(node_values, object_values)
+            # One node holds the constant fields of each object with elements.
+            self.assertEqual(node_count + 1, object_count)
+            self.assertTrue(node_rgb)
+
+        # The first node is the single point of a contour, which has no elements and so keeps its rgb.
+        self.assertTrue(object_rgb)
+        self.assertRaises(ValueError, _loaded, "basic_tree.xml", {'constant_fields': 'element'})
+
+    def test_index_flat_tree_branches(self):
+        # A root of two points and two branches, the second branch starts at the last point of the root.
+        flat_tree = MBFTree({'points': [MBFPoint(0, 0, 0), MBFPoint(1, 0, 0),
+                                        {'points': [MBFPoint(2, 0, 0), MBFPoint(3, 0, 0)], 'attributes': {},
+                                         'properties': []},
+                                        {'points': [MBFPoint(1, 0, 0), MBFPoint(1, 1, 0)], 'attributes': {},
+                                         'properties': []}],
+                             'attributes': {}, 'properties': []}).flat()
+        point_node_ids = [1, 2, 3, 4, 2, 5]
+        branch_index = index_flat_tree_branches(flat_tree, point_node_ids)
+        self.assertEqual({(): [1, 2], (2,): [3, 4], (3,): [2, 5]}, branch_index)
+
+        connectivity = determine_flat_tree_connectivity(flat_tree, point_node_ids)
+        element_to_node_map = dict(zip(range(1, len(connectivity) + 1), connectivity))
+        node_to_element_map = reverse_element_to_node_map(element_to_node_map)
+        self.assertEqual([[1, 2], [2, 3], [3, 4], [2, 2], [2, 5]], connectivity)
+        # The coincident point makes the element starting the second branch part of the first branch.
+        self.assertEqual([2, 3, 4], sorted(get_elements_for_node_ids([3, 4, 2], node_to_element_map,
+                                                                     element_to_node_map)))
+        self.assertEqual([4, 5], sorted(get_elements_for_node_ids([2, 5, 2], node_to_element_map,
+                                                                  element_to_node_map)))
+
+    def test_create_marker_nodes(self):
+        context = Context("test")
+        field_module = context.getDefaultRegion().getFieldmodule()
+        fields = [create_field_coordinates(field_module),
+                  create_field_finite_element(field_module, 'radius', 1, type_coordinate=False),
+                  create_field_finite_element(field_module, 'rgb', 3, type_coordinate=False)]
+        markers = [MBFMarker(name="A", rgb=[1.0, 0.0, 0.0], data=[MBFPoint(0, 0, 0), MBFPoint(0, 0, 0)]),
+                   MBFMarker(rgb=[0.0, 1.0, 0.0], data=[MBFPoint(1, 0, 0)]),
+                   MBFMarker(name="B", rgb=[0.0, 0.0, 1.0], data=[MBFPoint(0, 0, 0)])]
+        node_identifiers = create_marker_nodes(field_module, markers)
+        self.assertEqual([[1], [2], [3]], node_identifiers)
+        self.assertEqual(3, field_module.findNodesetByName('datapoints').getSize())
+
+        name_field = field_module.findFieldByName('marker_name')
+        self.assertTrue(name_field.isValid())
+        field_cache = field_module.createFieldcache()
+        nodes = field_module.findNodesetByName('datapoints')
+        names = []
+        for node_identifier in [1, 2, 3]:
+            field_cache.setNode(nodes.findNodeByIdentifier(node_identifier))
+            defined = name_field.isDefinedAtLocation(field_cache)
+            names.append(name_field.evaluateString(field_cache) if defined else None)
+        self.assertEqual(["A", None, "B"], names)
+        field_cache.setNode(nodes.findNodeByIdentifier(2))
+        self.assertEqual([0.0, 1.0, 0.0], fields[2].evaluateReal(field_cache, 3)[1])
+
+
 class ExWritingTreeWithAnnotationTestCase(unittest.TestCase):
 
     def test_write_ex_with_annotation(self):